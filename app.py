@@ -1,14 +1,19 @@
 import os
 from flask import Flask, render_template, request, session
-from flask_migrate import Migrate
 from flask_session import Session
 from config import config_by_name
 from modelos.models import db
+from controladores.registro_interacciones import cola_interacciones
+from controladores.planificador_slots import planificador_slots
+from controladores.gateway_llm import gateway_llm
+from controladores.conversacion import indice_problemas, indice_servicios
+from controladores import analitica, metricas
 from controladores.admin_routes import admin_bp
 from controladores.user_routes import user_bp
 from controladores.auth_routes import auth_bp
 from controladores.main_routes import main_bp
 from controladores.routes import register_routes
+from controladores.comandos import register_commands
 from controladores.chatbot_logic import chat
 import logging
 from logging.handlers import RotatingFileHandler
@@ -31,19 +36,32 @@ def create_app(config_name):
         'pool_recycle': 3600,
     }
 
-    # Configurar sesiones en Redis
-    app.config['SESSION_TYPE'] = 'redis'
-    app.config['SESSION_REDIS'] = redis.from_url(os.getenv('REDIS_URL'))
-    app.config['SESSION_KEY_PREFIX'] = os.getenv('SESSION_KEY_PREFIX')
-    app.config['SESSION_USE_SIGNER'] = os.getenv('SESSION_USE_SIGNER') == 'True'
-    app.config['SESSION_PERMANENT'] = os.getenv('SESSION_PERMANENT') == 'True'
+    # Configurar sesiones en Redis; sin REDIS_URL se usa la sesión por cookie de Flask (desarrollo, pruebas)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'supersecretkey')
-    Session(app)
+    if os.getenv('REDIS_URL'):
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = redis.from_url(os.getenv('REDIS_URL'))
+        app.config['SESSION_KEY_PREFIX'] = os.getenv('SESSION_KEY_PREFIX')
+        app.config['SESSION_USE_SIGNER'] = os.getenv('SESSION_USE_SIGNER') == 'True'
+        app.config['SESSION_PERMANENT'] = os.getenv('SESSION_PERMANENT') == 'True'
+        Session(app)
+    else:
+        app.config['SESSION_REDIS'] = None
 
     db.init_app(app)
+    cola_interacciones.init_app(app)
+    planificador_slots.init_app(app)
+    gateway_llm.init_app(app)
+    indice_problemas.init_app(app, 'INTENCIONES_BUSCADOR')
+    indice_servicios.init_app(app)
+    metricas.init_app(app)
+    analitica.init_app(app)
     db.app = app
 
-    migrate = Migrate(app, db)
+    # Flask-Migrate (y alembic) solo se usan desde 'flask db ...': los workers web no lo importan
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
 
     # Registrar Blueprints
     app.register_blueprint(admin_bp)
@@ -51,9 +69,12 @@ def create_app(config_name):
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     register_routes(app)
+    register_commands(app)
 
-    with app.app_context():
-        db.create_all()
+    # El esquema se crea con 'python manage.py db'; create_all al arrancar es opcional (desarrollo)
+    if app.config.get('CREAR_TABLAS_AL_INICIAR'):
+        with app.app_context():
+            db.create_all()
 
     # Configuración de logs
     configure_logging(app)
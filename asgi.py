@@ -0,0 +1,5 @@
+from app import create_app
+from controladores.asgi_conversacion import AplicacionASGI
+
+# Modo ASGI: gunicorn asgi:app -k uvicorn.workers.UvicornWorker (o bien: uvicorn asgi:app)
+app = AplicacionASGI(create_app('prod'))
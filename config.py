@@ -23,22 +23,95 @@ class Config:
     HORARIO_FIN_MANANA = '12:00'
     HORARIO_INICIO_TARDE = '13:00'
     HORARIO_FIN_TARDE = '18:00'
+    DURACION_SLOT_MINUTOS = 60
+
+    # Secreto de la cabecera X-Api-Token para /conversacion/batch; sin él la ruta rechaza todo
+    CLASIFICACION_API_TOKEN = os.environ.get('CLASIFICACION_API_TOKEN')
+    # Secreto compartido con los gateways de mensajería para /conversacion/<conversacion_id>
+    CANALES_API_TOKEN = os.environ.get('CANALES_API_TOKEN')
+
+    # Pre-aprovisionamiento de slots: días de horizonte y minutos entre ejecuciones del proceso
+    # 'planificador' (python manage.py planificador-slots)
+    SLOTS_HORIZONTE_DIAS = int(os.environ.get('SLOTS_HORIZONTE_DIAS', 30))
+    SLOTS_PLANIFICADOR_INTERVALO_MIN = int(os.environ.get('SLOTS_PLANIFICADOR_INTERVALO_MIN', 60))
+
+    # Reservas del chatbot: 'local' (mismo proceso) o 'remoto' (API JSON en RESERVAS_API_URL)
+    RESERVAS_MODO = os.environ.get('RESERVAS_MODO', 'local')
+    RESERVAS_API_URL = os.environ.get('RESERVAS_API_URL')
+    RESERVAS_API_TIMEOUT = float(os.environ.get('RESERVAS_API_TIMEOUT', 10))
+
+    # Notificaciones por correo: transporte 'sendgrid', 'smtp' o 'archivo', con reintentos exponenciales
+    SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
+    NOTIFICACIONES_TRANSPORTE = os.environ.get('NOTIFICACIONES_TRANSPORTE', 'sendgrid')
+    NOTIFICACIONES_REMITENTE = os.environ.get('NOTIFICACIONES_REMITENTE', 'tucorreo@tuempresa.com')
+    NOTIFICACIONES_ARCHIVO = os.environ.get('NOTIFICACIONES_ARCHIVO', os.path.join(BASE_DIR, 'logs', 'correos.jsonl'))
+    NOTIFICACIONES_SMTP_HOST = os.environ.get('NOTIFICACIONES_SMTP_HOST', 'localhost')
+    NOTIFICACIONES_SMTP_PUERTO = int(os.environ.get('NOTIFICACIONES_SMTP_PUERTO', 1025))
+    NOTIFICACIONES_MAX_INTENTOS = 5
+    NOTIFICACIONES_BACKOFF_SEGUNDOS = 30
+
+    # Gateway LLM: backend 'openai' o 'falso' (pruebas), caché de respuestas con TTL y LRU
+    OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY') or os.environ.get('API_KEY')
+    LLM_BACKEND = os.environ.get('LLM_BACKEND', 'openai')
+    LLM_MODELO = 'gpt-4'
+    LLM_MAX_TOKENS = 100
+    LLM_TEMPERATURA = 0.5
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 86400))
+    LLM_CACHE_MAX_ENTRADAS = 1000
+    # Caché de casi duplicados: coseno TF-IDF mínimo entre consultas con las mismas negaciones y
+    # números, y cada cuántos segundos se leen las consultas cacheadas por otros workers
+    LLM_CACHE_UMBRAL_SIMILITUD = 0.9
+    LLM_CACHE_SINCRONIZACION_SEGUNDOS = 30
+
+    # Buscador del índice de problemas: 'tfidf' (exacto, recorre todo el corpus), 'invertido'
+    # (mismos resultados, solo recorre los postings de la consulta) o 'ngramas' (tolera errores
+    # de tipeo). Ver 'python manage.py comparar-buscadores'
+    INTENCIONES_BUSCADOR = os.environ.get('INTENCIONES_BUSCADOR', 'tfidf')
+    # Artefactos de los índices ('python manage.py construir-indices'), abiertos con mmap por los workers
+    INDICES_DIR = os.environ.get('INDICES_DIR', os.path.join(BASE_DIR, 'datos', 'indices'))
+
+    # Segundos sin actividad tras los que expira el estado de una conversación del chatbot
+    CONVERSACION_TTL = int(os.environ.get('CONVERSACION_TTL', 3600))
+
+    # Modo ASGI (asgi.py): hilos para los turnos de la máquina de estados; no debe superar
+    # pool_size + max_overflow del motor SQLAlchemy
+    ASGI_HILOS = int(os.environ.get('ASGI_HILOS', 20))
+
+    # Segundos que se conserva en Redis el mapa de bits de slots libres por (servicio, fecha)
+    DISPONIBILIDAD_CACHE_TTL = int(os.environ.get('DISPONIBILIDAD_CACHE_TTL', 300))
+
+    # Registro de interacciones en segundo plano (write-behind)
+    INTERACCIONES_WRITE_BEHIND = True
+    INTERACCIONES_LOTE_TAMANO = int(os.environ.get('INTERACCIONES_LOTE_TAMANO', 100))
+    INTERACCIONES_LOTE_MS = int(os.environ.get('INTERACCIONES_LOTE_MS', 500))
+
+    # db.create_all() al crear la aplicación. En producción el esquema se crea y migra con
+    # 'python manage.py db' (fase release del Procfile) y los workers arrancan sin tocar la base
+    CREAR_TABLAS_AL_INICIAR = os.environ.get('CREAR_TABLAS_AL_INICIAR', '0') == '1'
+
+    # Métricas en formato Prometheus en /metrics (latencia por etapa y por estado, consultas SQL)
+    METRICAS_HABILITADAS = os.environ.get('METRICAS_HABILITADAS', '1') != '0'
 
 class DevelopmentConfig(Config):
     """Configuración utilizada durante el desarrollo."""
     DEBUG = True
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL').replace('mysql://', 'mysql+pymysql://')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', '').replace('mysql://', 'mysql+pymysql://')
+    CREAR_TABLAS_AL_INICIAR = os.environ.get('CREAR_TABLAS_AL_INICIAR', '1') == '1'
 
 class TestingConfig(Config):
     """Configuración utilizada durante las pruebas."""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(BASE_DIR, 'test.db')
     DEBUG = True
+    INTERACCIONES_WRITE_BEHIND = False
+    NOTIFICACIONES_TRANSPORTE = 'archivo'
+    CREAR_TABLAS_AL_INICIAR = True
+    LLM_BACKEND = 'falso'
 
 class ProductionConfig(Config):
     """Configuración utilizada en producción."""
     DEBUG = False
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL').replace('mysql://', 'mysql+pymysql://')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', '').replace('mysql://', 'mysql+pymysql://')
 
 # Diccionario para facilitar el acceso a las configuraciones
 config_by_name = {
@@ -1,7 +1,13 @@
-from flask import Blueprint, request, redirect, url_for, flash, render_template, send_file
+from datetime import date, datetime, timedelta
+from flask import Blueprint, request, redirect, url_for, flash, render_template, abort
+from sqlalchemy.orm import joinedload, selectinload
 from modelos.models import db, Usuario, Vehiculo, Reserva, Servicio
-from .decorators import login_required, admin_required
-import pandas as pd
+from .decorators import admin_required
+from .disponibilidad import invalidar_slot
+from .capa_servicios import ReservaService, ConflictoReserva
+from . import analitica
+from .paginacion import paginar
+from .exportacion import EXPORTACIONES, FORMATOS, respuesta_exportacion
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -9,67 +15,103 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 @admin_bp.route('/dashboard')
 @admin_required
 def dashboard():
-    total_usuarios = Usuario.query.count()
-    total_vehiculos = Vehiculo.query.count()
-    total_servicios = Servicio.query.count()
-    total_reservas = Reserva.query.count()
-    total_no_realizados = Reserva.query.filter_by(estado='no realizado').count()
+    # Totales y contadores del día precalculados (analitica); el historial sale de ResumenDiario
+    totales = analitica.totales()
     return render_template('admin/dashboard.html', 
-                           total_usuarios=total_usuarios, 
-                           total_vehiculos=total_vehiculos, 
-                           total_servicios=total_servicios, 
-                           total_reservas=total_reservas,
-                           total_no_realizados=total_no_realizados)
+                           total_usuarios=totales['usuarios'], 
+                           total_vehiculos=totales['vehiculos'], 
+                           total_servicios=totales['servicios'], 
+                           total_reservas=totales['reservas'],
+                           total_no_realizados=totales['reservas_no_realizadas'],
+                           hoy=analitica.contadores_dia(date.today()),
+                           historial=analitica.historial(7))
+
+def _fecha_argumento(nombre):
+    try:
+        return datetime.strptime(request.args.get(nombre, ''), '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _filtro_texto(consulta, columnas):
+    # Búsqueda por prefijo con LIKE (sin LOWER) para que los índices de las columnas sirvan;
+    # la colación de MySQL ya compara sin distinguir mayúsculas
+    texto = request.args.get('q', '').strip()
+    if texto:
+        patron = texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        consulta = consulta.filter(db.or_(*(columna.like(patron, escape='\\') for columna in columnas)))
+    return consulta
 
 # Listar Reservas
 @admin_bp.route('/reservas')
 @admin_required
 def reservas():
-    reservas = Reserva.query.all()
-    return render_template('admin/reservas.html', reservas=reservas)
+    # Relaciones muchos-a-uno en la misma consulta: sin una consulta extra por fila en la plantilla
+    consulta = Reserva.query.options(
+        joinedload(Reserva.usuario), joinedload(Reserva.vehiculo), joinedload(Reserva.servicio))
+    if request.args.get('estado'):
+        consulta = consulta.filter(Reserva.estado == request.args['estado'])
+    if request.args.get('servicio_id', type=int):
+        consulta = consulta.filter(Reserva.servicio_id == request.args.get('servicio_id', type=int))
+    desde, hasta = _fecha_argumento('desde'), _fecha_argumento('hasta')
+    if desde:
+        consulta = consulta.filter(Reserva.fecha_hora >= desde)
+    if hasta:
+        consulta = consulta.filter(Reserva.fecha_hora < hasta + timedelta(days=1))
+    if request.args.get('q', '').strip():
+        consulta = _filtro_texto(consulta.join(Reserva.usuario), (Usuario.email, Usuario.apellido))
+    pagina = paginar(consulta, {'fecha_hora': Reserva.fecha_hora, 'id': Reserva.id},
+                     Reserva.id, request.args, orden_defecto='fecha_hora', direccion_defecto='desc')
+    return render_template('admin/reservas.html', reservas=pagina, pagina=pagina)
 
 # Listar Servicios
 @admin_bp.route('/servicios')
 @admin_required
 def servicios():
-    servicios = Servicio.query.all()
-    return render_template('admin/servicios.html', servicios=servicios)
+    consulta = _filtro_texto(Servicio.query, (Servicio.nombre,))
+    pagina = paginar(consulta, {'id': Servicio.id, 'nombre': Servicio.nombre}, Servicio.id, request.args,
+                     orden_defecto='nombre')
+    return render_template('admin/servicios.html', servicios=pagina, pagina=pagina)
 
 # Listar Clientes
 @admin_bp.route('/clientes')
 @admin_required
 def clientes():
-    clientes = Usuario.query.all()
-    return render_template('admin/clientes.html', clientes=clientes)
+    # Vehículos de toda la página en una sola consulta IN (relación uno-a-muchos)
+    consulta = _filtro_texto(Usuario.query.options(selectinload(Usuario.vehiculos)),
+                             (Usuario.email, Usuario.nombre, Usuario.apellido))
+    if request.args.get('pais'):
+        consulta = consulta.filter(Usuario.pais == request.args['pais'])
+    pagina = paginar(consulta, {'id': Usuario.id, 'nombre': Usuario.nombre, 'apellido': Usuario.apellido,
+                                'email': Usuario.email}, Usuario.id, request.args, direccion_defecto='desc')
+    return render_template('admin/clientes.html', clientes=pagina, pagina=pagina)
 
 # Exportar Clientes a Excel
 @admin_bp.route('/exportar_clientes_excel', methods=['GET'])
 @admin_required
 def exportar_clientes_excel():
-    clientes = Usuario.query.all()
-    data = {
-        "ID": [cliente.id for cliente in clientes],
-        "Nombre": [cliente.nombre for cliente in clientes],
-        "Apellido": [cliente.apellido for cliente in clientes],
-        "Email": [cliente.email for cliente in clientes],
-        "Teléfono": [cliente.telefono for cliente in clientes],
-        "Dirección": [cliente.direccion for cliente in clientes],
-        "Género": [cliente.genero for cliente in clientes],
-        "Fecha de Nacimiento": [cliente.fecha_nacimiento for cliente in clientes],
-        "País": [cliente.pais for cliente in clientes],
-        "Fecha de Registro": [cliente.fecha_registro for cliente in clientes]
-    }
-    df = pd.DataFrame(data)
-    file_path = 'clientes.xlsx'
-    df.to_excel(file_path, index=False)
-    return send_file(file_path, as_attachment=True)
+    return respuesta_exportacion('clientes', 'xlsx')
+
+# Exportar clientes, reservas o interacciones a CSV o Excel, con rango de fechas opcional (desde/hasta)
+@admin_bp.route('/exportar/<nombre>.<formato>', methods=['GET'])
+@admin_required
+def exportar(nombre, formato):
+    if nombre not in EXPORTACIONES or formato not in FORMATOS:
+        abort(404)
+    hasta = _fecha_argumento('hasta')
+    return respuesta_exportacion(nombre, formato, desde=_fecha_argumento('desde'),
+                                 hasta=hasta + timedelta(days=1) if hasta else None)
 
 # Listar Usuarios y Cambiar Roles
 @admin_bp.route('/roles')
 @admin_required
 def roles():
-    usuarios = Usuario.query.all()
-    return render_template('admin/roles.html', usuarios=usuarios)
+    consulta = _filtro_texto(Usuario.query, (Usuario.email, Usuario.nombre))
+    if request.args.get('rol'):
+        consulta = consulta.filter(Usuario.rol == request.args['rol'])
+    pagina = paginar(consulta, {'id': Usuario.id, 'nombre': Usuario.nombre, 'email': Usuario.email},
+                     Usuario.id, request.args)
+    return render_template('admin/roles.html', usuarios=pagina, pagina=pagina)
 
 @admin_bp.route('/roles/cambiar/<int:user_id>', methods=['POST'])
 @admin_required
@@ -111,9 +153,11 @@ def nueva_reserva():
         slot_id = request.form.get('slot_id')
         problema = request.form.get('problema')
         fecha_hora = request.form.get('fecha_hora')
-        nueva_reserva = Reserva(usuario_id=usuario_id, vehiculo_id=vehiculo_id, servicio_id=servicio_id, slot_id=slot_id, problema=problema, fecha_hora=fecha_hora)
-        db.session.add(nueva_reserva)
-        db.session.commit()
+        try:
+            ReservaService.crear(usuario_id=usuario_id, vehiculo_id=vehiculo_id, servicio_id=servicio_id, slot_id=slot_id, problema=problema, fecha_hora=fecha_hora)
+        except ConflictoReserva:
+            flash('El slot seleccionado ya está reservado.', 'danger')
+            return redirect(url_for('admin.nueva_reserva'))
         flash('Nueva reserva creada con éxito', 'success')
         return redirect(url_for('admin.reservas'))
     return render_template('admin/nueva_reserva.html')
@@ -191,9 +235,13 @@ def eliminar_servicio(servicio_id):
 def eliminar_cliente(cliente_id):
     cliente = Usuario.query.get_or_404(cliente_id)
     try:
-        # Eliminar reservas asociadas
+        # Eliminar reservas asociadas y liberar sus slots
         reservas = Reserva.query.filter_by(usuario_id=cliente_id).all()
+        slots_liberados = []
         for reserva in reservas:
+            if reserva.slot and reserva.slot.reservado:
+                reserva.slot.reservado = False
+                slots_liberados.append(reserva.slot)
             db.session.delete(reserva)
 
         # Eliminar vehículos asociados
@@ -203,6 +251,8 @@ def eliminar_cliente(cliente_id):
 
         db.session.delete(cliente)
         db.session.commit()
+        for slot in slots_liberados:
+            invalidar_slot(slot)
         flash('Cliente eliminado correctamente.', 'success')
     except Exception as e:
         db.session.rollback()
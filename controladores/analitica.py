@@ -0,0 +1,340 @@
+"""Analítica del dashboard mantenida de forma incremental.
+
+Los totales (usuarios, vehículos, servicios, reservas) y los contadores del día se actualizan
+en Redis al confirmar cada transacción, a partir de los eventos de la sesión de SQLAlchemy,
+así que el dashboard los lee con un HGETALL en lugar de recorrer las tablas. El comando
+'consolidar-analitica' recalcula los días desde las tablas de origen, los guarda en
+ResumenDiario y corrige cualquier desvío de los totales.
+"""
+import threading
+from datetime import date, datetime, time, timedelta
+import redis
+from flask import current_app, has_app_context
+from sqlalchemy import case, event, func, inspect
+from sqlalchemy.orm import Session
+from modelos.models import (db, Usuario, Vehiculo, Servicio, Reserva, Interaccion, RegistroUsuario,
+                            RegistroServicio, ResumenDiario)
+from controladores.redis_cliente import obtener_redis
+
+PREFIJO_CLAVE = 'analitica:'
+CLAVE_TOTALES = PREFIJO_CLAVE + 'totales'
+TOTALES = ('usuarios', 'vehiculos', 'servicios', 'reservas', 'reservas_no_realizadas')
+CONTADORES_CONVERSACION = ('consultas_iniciadas', 'solicitudes_atendidas', 'conversiones_realizadas')
+ESTADO_NO_REALIZADO = 'no realizado'
+DIAS_RETENCION = 40  # Los contadores diarios viven en Redis hasta que se consolidan en ResumenDiario
+
+_TOTAL_POR_MODELO = {Usuario: 'usuarios', Vehiculo: 'vehiculos', Servicio: 'servicios', Reserva: 'reservas'}
+
+
+def clave_dia(fecha):
+    return f'{PREFIJO_CLAVE}dia:{fecha.isoformat()}'
+
+
+def clave_embudo(fecha):
+    return f'{PREFIJO_CLAVE}embudo:{fecha.isoformat()}'
+
+
+def _numero(crudo):
+    valor = float(crudo)
+    return int(valor) if valor.is_integer() else valor
+
+
+class ContadoresRedis:
+    """Hashes de Redis con HINCRBY; los contadores se comparten entre workers."""
+
+    def __init__(self, cliente):
+        self.redis = cliente
+
+    def incrementar(self, cambios, ttl=None):
+        """cambios: {clave: {campo: delta}}; ttl (segundos) se aplica a todas las claves salvo los totales."""
+        with self.redis.pipeline(transaction=False) as pipe:
+            for clave, campos in cambios.items():
+                for campo, delta in campos.items():
+                    if isinstance(delta, float):
+                        pipe.hincrbyfloat(clave, campo, delta)
+                    else:
+                        pipe.hincrby(clave, campo, delta)
+                if ttl and clave != CLAVE_TOTALES:
+                    pipe.expire(clave, ttl)
+            pipe.execute()
+
+    def existe(self, clave):
+        return bool(self.redis.exists(clave))
+
+    def leer(self, clave):
+        datos = self.redis.hgetall(clave)
+        return {campo.decode(): _numero(valor) for campo, valor in datos.items()} if datos else None
+
+    def reemplazar(self, clave, valores):
+        with self.redis.pipeline() as pipe:
+            pipe.delete(clave)
+            if valores:
+                pipe.hset(clave, mapping=valores)
+            pipe.execute()
+
+
+class ContadoresMemoria:
+    """Contadores del proceso para desarrollo y pruebas sin Redis (no se comparten entre workers)."""
+
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, cambios, ttl=None):
+        with self._lock:
+            for clave, campos in cambios.items():
+                datos = self._datos.setdefault(clave, {})
+                for campo, delta in campos.items():
+                    datos[campo] = datos.get(campo, 0) + delta
+
+    def existe(self, clave):
+        with self._lock:
+            return clave in self._datos
+
+    def leer(self, clave):
+        with self._lock:
+            datos = self._datos.get(clave)
+            return dict(datos) if datos is not None else None
+
+    def reemplazar(self, clave, valores):
+        with self._lock:
+            self._datos[clave] = dict(valores)
+
+
+# Función para obtener los contadores: Redis si está configurado, memoria del proceso si no
+def obtener_contadores(app=None):
+    app = app or current_app
+    contadores = app.extensions.get('contadores_analitica')
+    if contadores is None:
+        cliente = obtener_redis(app)
+        contadores = ContadoresRedis(cliente) if cliente is not None else ContadoresMemoria()
+        app.extensions['contadores_analitica'] = contadores
+    return contadores
+
+
+def incrementar(cambios):
+    """Aplica los incrementos; un fallo de Redis solo se registra para no afectar al request."""
+    if not cambios or not has_app_context():
+        return
+    contadores = obtener_contadores()
+    try:
+        # Sin hash de totales no se incrementa: totales() lo reconstruye completo desde la base de datos
+        if CLAVE_TOTALES in cambios and not contadores.existe(CLAVE_TOTALES):
+            cambios = {clave: campos for clave, campos in cambios.items() if clave != CLAVE_TOTALES}
+        contadores.incrementar(cambios, ttl=DIAS_RETENCION * 86400)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"No se pudieron actualizar los contadores de analítica: {e}")
+
+
+def _sumar(cambios, clave, campo, delta=1):
+    campos = cambios.setdefault(clave, {})
+    campos[campo] = campos.get(campo, 0) + delta
+
+
+def _sumar_duracion(cambios, clave, campo_cantidad, campo_segundos, registro):
+    # Solo valores asignados en Python; leer un default de la base exigiría otra consulta durante el flush
+    inicio = registro.__dict__.get('tiempo_inicio')
+    fin = registro.__dict__.get('tiempo_fin')
+    if isinstance(inicio, datetime) and isinstance(fin, datetime):
+        _sumar(cambios, clave, campo_cantidad)
+        _sumar(cambios, clave, campo_segundos, max((fin - inicio).total_seconds(), 0.0))
+
+
+def _despues_de_flush(session, flush_context):
+    cambios = session.info.setdefault('analitica', {})
+    dia = clave_dia(date.today())
+    for objeto in session.new:
+        total = _TOTAL_POR_MODELO.get(type(objeto))
+        if total is not None:
+            _sumar(cambios, CLAVE_TOTALES, total)
+        if isinstance(objeto, Reserva) and objeto.estado in (None, ESTADO_NO_REALIZADO):
+            _sumar(cambios, CLAVE_TOTALES, 'reservas_no_realizadas')
+        elif isinstance(objeto, RegistroUsuario):
+            _sumar_duracion(cambios, dia, 'registros', 'registro_segundos', objeto)
+        elif isinstance(objeto, RegistroServicio):
+            _sumar_duracion(cambios, dia, 'reservas', 'reserva_segundos', objeto)
+    for objeto in session.deleted:
+        total = _TOTAL_POR_MODELO.get(type(objeto))
+        if total is not None:
+            _sumar(cambios, CLAVE_TOTALES, total, -1)
+        if isinstance(objeto, Reserva) and objeto.estado == ESTADO_NO_REALIZADO:
+            _sumar(cambios, CLAVE_TOTALES, 'reservas_no_realizadas', -1)
+    for objeto in session.dirty:
+        if isinstance(objeto, Reserva):
+            historial = inspect(objeto).attrs.estado.history
+            if historial.has_changes():
+                antes = ESTADO_NO_REALIZADO in (historial.deleted or ())
+                despues = objeto.estado == ESTADO_NO_REALIZADO
+                if antes != despues:
+                    _sumar(cambios, CLAVE_TOTALES, 'reservas_no_realizadas', 1 if despues else -1)
+
+
+def _despues_de_commit(session):
+    incrementar(session.info.pop('analitica', None))
+
+
+def _despues_de_rollback(session):
+    session.info.pop('analitica', None)
+
+
+_eventos_registrados = False
+
+
+def init_app(app):
+    """Registra los eventos de sesión que mantienen los contadores."""
+    global _eventos_registrados
+    if not _eventos_registrados:
+        # Sobre la clase Session: aplica también a la sesión con ámbito de Flask-SQLAlchemy
+        event.listen(Session, 'after_flush', _despues_de_flush)
+        event.listen(Session, 'after_commit', _despues_de_commit)
+        event.listen(Session, 'after_rollback', _despues_de_rollback)
+        _eventos_registrados = True
+
+
+# Funciones llamadas desde el chatbot y la cola de interacciones
+def registrar_interacciones(filas):
+    cambios = {}
+    for fila in filas:
+        clave = clave_dia(fila['timestamp'].date())
+        _sumar(cambios, clave, 'interacciones')
+        if fila.get('es_exitosa'):
+            _sumar(cambios, clave, 'interacciones_exitosas')
+    incrementar(cambios)
+
+
+def registrar_turno(contadores_antes, conversation_state, estado_anterior):
+    """Suma al día los contadores de la conversación que cambiaron y la entrada al nuevo estado."""
+    hoy = date.today()
+    cambios = {}
+    for campo, antes in zip(CONTADORES_CONVERSACION, contadores_antes):
+        delta = conversation_state[campo] - antes
+        if delta:
+            _sumar(cambios, clave_dia(hoy), campo, delta)
+    if conversation_state["estado"] != estado_anterior:
+        _sumar(cambios, clave_embudo(hoy), conversation_state["estado"])
+    incrementar(cambios)
+
+
+# Lectura para el dashboard
+def calcular_totales():
+    """Totales desde la base de datos en una sola consulta."""
+    fila = db.session.query(
+        db.session.query(func.count(Usuario.id)).scalar_subquery(),
+        db.session.query(func.count(Vehiculo.id)).scalar_subquery(),
+        db.session.query(func.count(Servicio.id)).scalar_subquery(),
+        db.session.query(func.count(Reserva.id)).scalar_subquery(),
+        db.session.query(func.count(Reserva.id)).filter(Reserva.estado == ESTADO_NO_REALIZADO).scalar_subquery(),
+    ).one()
+    return dict(zip(TOTALES, fila))
+
+
+def totales():
+    contadores = obtener_contadores()
+    try:
+        datos = contadores.leer(CLAVE_TOTALES)
+        if datos is None:
+            datos = calcular_totales()
+            contadores.reemplazar(CLAVE_TOTALES, datos)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"No se pudieron leer los totales de analítica: {e}")
+        datos = calcular_totales()
+    return {campo: datos.get(campo, 0) for campo in TOTALES}
+
+
+def contadores_dia(fecha):
+    try:
+        datos = obtener_contadores().leer(clave_dia(fecha)) or {}
+        embudo = obtener_contadores().leer(clave_embudo(fecha)) or {}
+    except redis.RedisError as e:
+        current_app.logger.warning(f"No se pudieron leer los contadores de analítica: {e}")
+        datos, embudo = {}, {}
+    return _resumen(fecha, datos, embudo)
+
+
+def _resumen(fecha, datos, embudo):
+    registros = datos.get('registros', 0)
+    reservas = datos.get('reservas', 0)
+    return {
+        'fecha': fecha,
+        'interacciones': datos.get('interacciones', 0),
+        'interacciones_exitosas': datos.get('interacciones_exitosas', 0),
+        'consultas_iniciadas': datos.get('consultas_iniciadas', 0),
+        'solicitudes_atendidas': datos.get('solicitudes_atendidas', 0),
+        'conversiones_realizadas': datos.get('conversiones_realizadas', 0),
+        'registros': registros,
+        'reservas': reservas,
+        'registro_segundos_promedio': datos.get('registro_segundos', 0) / registros if registros else None,
+        'reserva_segundos_promedio': datos.get('reserva_segundos', 0) / reservas if reservas else None,
+        'embudo': dict(sorted(embudo.items(), key=lambda par: -par[1])),
+    }
+
+
+def historial(dias=7):
+    """Resúmenes consolidados de los últimos 'dias' días anteriores a hoy."""
+    desde = date.today() - timedelta(days=dias)
+    return (ResumenDiario.query
+            .filter(ResumenDiario.fecha >= desde, ResumenDiario.fecha < date.today())
+            .order_by(ResumenDiario.fecha.desc())
+            .all())
+
+
+# Consolidación diaria
+def _rango(fecha):
+    inicio = datetime.combine(fecha, time.min)
+    return inicio, inicio + timedelta(days=1)
+
+
+def _duraciones(modelo, inicio, fin):
+    total, cantidad = 0.0, 0
+    consulta = (db.session.query(modelo.tiempo_inicio, modelo.tiempo_fin)
+                .filter(modelo.tiempo_fin >= inicio, modelo.tiempo_fin < fin)
+                .execution_options(yield_per=1000))
+    for tiempo_inicio, tiempo_fin in consulta:
+        total += max((tiempo_fin - tiempo_inicio).total_seconds(), 0.0)
+        cantidad += 1
+    return cantidad, total
+
+
+def consolidar_dia(fecha):
+    """Recalcula el día desde las tablas de origen y lo guarda en ResumenDiario.
+
+    Los contadores de conversación y el embudo solo existen en los contadores del día, así que
+    se copian de allí.
+    """
+    inicio, fin = _rango(fecha)
+    interacciones, exitosas = db.session.query(
+        func.count(Interaccion.id),
+        func.coalesce(func.sum(case((Interaccion.es_exitosa.is_(True), 1), else_=0)), 0),
+    ).filter(Interaccion.timestamp >= inicio, Interaccion.timestamp < fin).one()
+    registros, registro_segundos = _duraciones(RegistroUsuario, inicio, fin)
+    reservas, reserva_segundos = _duraciones(RegistroServicio, inicio, fin)
+    vivos = contadores_dia(fecha)
+
+    resumen = ResumenDiario.query.filter_by(fecha=fecha).first() or ResumenDiario(fecha=fecha)
+    resumen.interacciones = interacciones
+    resumen.interacciones_exitosas = int(exitosas)
+    resumen.registros = registros
+    resumen.reservas = reservas
+    resumen.registro_segundos_promedio = registro_segundos / registros if registros else None
+    resumen.reserva_segundos_promedio = reserva_segundos / reservas if reservas else None
+    # Si los contadores del día ya expiraron se conservan los valores consolidados antes
+    if any(vivos[campo] for campo in CONTADORES_CONVERSACION) or vivos['embudo']:
+        for campo in CONTADORES_CONVERSACION:
+            setattr(resumen, campo, vivos[campo])
+        resumen.embudo = vivos['embudo']
+    resumen.actualizado = datetime.now()
+    db.session.add(resumen)
+    db.session.commit()
+    return resumen
+
+
+def consolidar(dias=1, hasta=None):
+    """Consolida los 'dias' días anteriores a 'hasta' (hoy por defecto) y recalcula los totales.
+
+    Recalcular los totales corrige el desvío de cambios hechos fuera del ORM o perdidos por un
+    fallo de Redis entre el commit y el incremento.
+    """
+    hasta = hasta or date.today()
+    resumenes = [consolidar_dia(hasta - timedelta(days=n)) for n in range(dias, 0, -1)]
+    obtener_contadores().reemplazar(CLAVE_TOTALES, calcular_totales())
+    return resumenes
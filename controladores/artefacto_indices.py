@@ -0,0 +1,175 @@
+"""Artefactos en disco de los índices de intenciones, compartidos entre workers con mmap.
+
+'python manage.py construir-indices' vectoriza cada corpus de datos/*.txt una sola vez y
+escribe en INDICES_DIR/<índice>/v<formato>-<huella>/ el vocabulario, el idf y los arreglos
+de la matriz dispersa, junto con las claves y valores del corpus. Cada arreglo es un .npy
+independiente. El archivo ACTUAL de cada índice apunta a la versión vigente y se reemplaza
+de forma atómica.
+
+Los workers abren los arreglos con np.load(mmap_mode='r'): el sistema operativo comparte
+esas páginas entre todos los procesos, que no necesitan vectorizar ni importar
+scikit-learn al arrancar. La huella cubre el contenido del corpus, el formato, el buscador
+y el normalizador. Si no coincide con la del índice configurado, el worker ignora el
+artefacto y vectoriza el corpus en memoria, como antes.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+import numpy as np
+
+FORMATO = 1
+ARCHIVO_ACTUAL = 'ACTUAL'
+ARCHIVO_MANIFIESTO = 'manifiesto.json'
+
+
+class Textos:
+    """Secuencia de textos guardada como UTF-8 concatenado más sus desplazamientos."""
+
+    def __init__(self, datos, desplazamientos):
+        self.datos = datos
+        self.desplazamientos = desplazamientos
+
+    @classmethod
+    def codificar(cls, textos):
+        codificados = [texto.encode('utf-8') for texto in textos]
+        desplazamientos = np.zeros(len(codificados) + 1, dtype=np.int64)
+        np.cumsum([len(texto) for texto in codificados], out=desplazamientos[1:])
+        return cls(np.frombuffer(b''.join(codificados), dtype=np.uint8), desplazamientos)
+
+    def __len__(self):
+        return len(self.desplazamientos) - 1
+
+    def __getitem__(self, posicion):
+        if posicion < 0:
+            posicion += len(self)
+        if not 0 <= posicion < len(self):
+            raise IndexError(posicion)
+        inicio, fin = self.desplazamientos[posicion], self.desplazamientos[posicion + 1]
+        return self.datos[inicio:fin].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[posicion] for posicion in range(len(self)))
+
+
+def huella_archivo(ruta):
+    with open(ruta, 'rb') as archivo:
+        return hashlib.sha256(archivo.read()).hexdigest()
+
+
+def huella_indice(indice, huella_fuente):
+    """Huella de todo lo que determina el contenido del artefacto de 'indice'."""
+    descripcion = json.dumps({
+        'formato': FORMATO,
+        'fuente': huella_fuente,
+        'campo': indice.campo,
+        'buscador': indice.buscador.nombre,
+        'normalizador': indice.normalizador.firma(),
+    }, sort_keys=True)
+    return hashlib.sha256(descripcion.encode('utf-8')).hexdigest()[:16]
+
+
+def _ruta_actual(directorio, nombre):
+    return os.path.join(directorio, nombre, ARCHIVO_ACTUAL)
+
+
+def version_actual(directorio, nombre):
+    """Directorio de la versión vigente del índice 'nombre', o None si no hay artefacto."""
+    try:
+        with open(_ruta_actual(directorio, nombre), 'r', encoding='utf-8') as archivo:
+            version = archivo.read().strip()
+    except OSError:
+        return None
+    return os.path.join(directorio, nombre, version) if version else None
+
+
+def construir(indice, directorio, conservar=2):
+    """Escribe el artefacto de 'indice' y lo marca como vigente; devuelve su manifiesto.
+
+    Si la versión ya existe solo se vuelve a marcar como vigente. Se conservan las
+    'conservar' versiones más recientes para que los workers que aún las tienen abiertas
+    puedan terminar; borrar un archivo abierto con mmap no lo invalida en Linux.
+    """
+    datos = indice.cargador(indice.ruta)
+    claves = list(datos.keys())
+    valores = list(datos.values())
+    docs = claves if indice.campo == 'claves' else valores
+    if not docs:
+        raise ValueError(f'El corpus {indice.ruta} está vacío')
+    huella = huella_indice(indice, huella_archivo(indice.ruta))
+    version = f'v{FORMATO}-{huella}'
+    base = os.path.join(directorio, indice.nombre)
+    destino = os.path.join(base, version)
+    os.makedirs(base, exist_ok=True)
+
+    if not os.path.isdir(destino):
+        buscador = indice.buscador.ajustar([indice.normalizador(doc) for doc in docs])
+        arreglos = buscador.arreglos()
+        for prefijo, textos in (('claves', claves), ('valores', valores)):
+            codificados = Textos.codificar(textos)
+            arreglos[f'{prefijo}_datos'] = codificados.datos
+            arreglos[f'{prefijo}_desplazamientos'] = codificados.desplazamientos
+        manifiesto = {
+            'formato': FORMATO,
+            'huella': huella,
+            'indice': indice.nombre,
+            'fuente': os.path.basename(indice.ruta),
+            'buscador': indice.buscador.nombre,
+            'documentos': len(docs),
+            'terminos': len(buscador.vectorizador.terminos),
+            'arreglos': sorted(arreglos),
+            'creado': datetime.now().isoformat(timespec='seconds'),
+        }
+        # Se escribe en un directorio temporal y se renombra: un worker nunca ve una versión a medias
+        temporal = f'{destino}.tmp-{os.getpid()}'
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        for nombre, arreglo in arreglos.items():
+            np.save(os.path.join(temporal, f'{nombre}.npy'), np.ascontiguousarray(arreglo), allow_pickle=False)
+        with open(os.path.join(temporal, ARCHIVO_MANIFIESTO), 'w', encoding='utf-8') as archivo:
+            json.dump(manifiesto, archivo, indent=2, ensure_ascii=False)
+        os.replace(temporal, destino)
+
+    temporal = f'{_ruta_actual(directorio, indice.nombre)}.tmp-{os.getpid()}'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        archivo.write(version)
+    os.replace(temporal, _ruta_actual(directorio, indice.nombre))
+
+    versiones = sorted((entrada for entrada in os.scandir(base)
+                        if entrada.is_dir() and entrada.name.startswith('v') and entrada.name != version),
+                       key=lambda entrada: entrada.stat().st_mtime, reverse=True)
+    for entrada in versiones[max(conservar - 1, 0):]:
+        shutil.rmtree(entrada.path, ignore_errors=True)
+    return leer_manifiesto(destino)
+
+
+def leer_manifiesto(directorio_version):
+    with open(os.path.join(directorio_version, ARCHIVO_MANIFIESTO), 'r', encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def cargar(indice, directorio):
+    """Abre con mmap la versión vigente del artefacto de 'indice'.
+
+    Devuelve (claves, valores, buscador), o None si no hay artefacto o si su huella no
+    corresponde al corpus y la configuración actuales.
+    """
+    destino = version_actual(directorio, indice.nombre)
+    if destino is None:
+        return None
+    try:
+        manifiesto = leer_manifiesto(destino)
+        huella = huella_indice(indice, huella_archivo(indice.ruta))
+    except (OSError, ValueError) as e:
+        print(f"Artefacto del índice '{indice.nombre}' ilegible, se vectoriza en memoria: {e}")
+        return None
+    if manifiesto.get('formato') != FORMATO or manifiesto.get('huella') != huella:
+        print(f"Artefacto del índice '{indice.nombre}' desactualizado, se vectoriza en memoria "
+              f"(ejecute 'python manage.py construir-indices').")
+        return None
+    arreglos = {nombre: np.load(os.path.join(destino, f'{nombre}.npy'), mmap_mode='r', allow_pickle=False)
+                for nombre in manifiesto['arreglos']}
+    claves = Textos(arreglos.pop('claves_datos'), arreglos.pop('claves_desplazamientos'))
+    valores = Textos(arreglos.pop('valores_datos'), arreglos.pop('valores_desplazamientos'))
+    return claves, valores, indice.buscador.desde_arreglos(arreglos)
@@ -0,0 +1,210 @@
+import asyncio
+import io
+import json
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.wsgi import WsgiToAsgi
+from flask import request
+from controladores.decorators import CABECERA_TOKEN, token_valido
+from controladores.conversacion import handle_message_stream, procesar_mensaje, registrar_interaccion, MENSAJE_BIENVENIDA
+from controladores.estado_conversacion import id_valido, ConversacionOcupada
+from controladores.gateway_llm import gateway_llm
+from controladores.maquina_estados import Turno
+
+# Ruta -> True si responde con Server-Sent Events cuando el turno consulta al LLM
+RUTAS_CONVERSACION = {'/conversacion': False, '/conversacion/stream': True}
+PREFIJO_CONVERSACION_ID = '/conversacion/'
+RUTAS_SOLO_WSGI = {'/conversacion/batch'}
+CABECERAS_SESION = ('set-cookie', 'vary')
+
+
+def construir_environ(scope, cuerpo):
+    """Environ WSGI mínimo a partir del scope ASGI, para abrir un request de Flask con la misma sesión."""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': scope['server'][0] if scope.get('server') else 'localhost',
+        'SERVER_PORT': str(scope['server'][1]) if scope.get('server') else '80',
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(cuerpo)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre = nombre.decode('latin1').upper().replace('-', '_')
+        if nombre == 'CONTENT_TYPE':
+            clave = nombre
+        elif nombre == 'CONTENT_LENGTH':
+            continue
+        else:
+            clave = f'HTTP_{nombre}'
+        valor = valor.decode('latin1')
+        environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    return environ
+
+
+class AplicacionASGI:
+    """Modo ASGI: /conversacion y /conversacion/stream se atienden sobre asyncio.
+
+    El turno de la máquina de estados (consultas cortas e indexadas a la base de datos y la
+    sesión de Flask) se ejecuta en un pool de hilos acotado por ASGI_HILOS; la espera al LLM,
+    que es lo que dura segundos, se hace con httpx.AsyncClient sin ocupar ningún hilo. El resto
+    de rutas (panel de administración, usuarios, API JSON) se delega en la app Flask.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.ejecutor = ThreadPoolExecutor(max_workers=flask_app.config.get('ASGI_HILOS', 20),
+                                           thread_name_prefix='turnos')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._ciclo_de_vida(receive, send)
+            return
+        ruta = self._ruta_conversacion(scope)
+        if ruta is None:
+            await self.wsgi(scope, receive, send)
+        else:
+            await self._conversacion(scope, receive, send, *ruta)
+
+    @staticmethod
+    def _ruta_conversacion(scope):
+        """Devuelve (con_eventos, conversacion_id) si la ruta se atiende en modo asíncrono."""
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            return None
+        ruta = scope['path']
+        if ruta in RUTAS_CONVERSACION:
+            return RUTAS_CONVERSACION[ruta], None
+        if ruta.startswith(PREFIJO_CONVERSACION_ID) and ruta not in RUTAS_SOLO_WSGI:
+            conversacion_id = ruta[len(PREFIJO_CONVERSACION_ID):]
+            if id_valido(conversacion_id):
+                return False, conversacion_id
+        return None
+
+    def _token_canal_valido(self, scope):
+        """Misma comprobación que token_requerido('CANALES_API_TOKEN') en la ruta WSGI."""
+        cabecera = CABECERA_TOKEN.lower().encode('latin1')
+        recibido = next((valor.decode('latin1') for nombre, valor in scope.get('headers', [])
+                         if nombre.lower() == cabecera), None)
+        return token_valido('CANALES_API_TOKEN', recibido, self.flask_app)
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                cerrar = getattr(gateway_llm.backend, 'cerrar_async', None)
+                if cerrar is not None:
+                    await cerrar()
+                self.ejecutor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _en_hilo(self, funcion, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.ejecutor, funcion, *args)
+
+    async def _conversacion(self, scope, receive, send, con_eventos, conversacion_id):
+        if conversacion_id is not None and not self._token_canal_valido(scope):
+            await self._enviar_json(send, 401, {'error': 'Token de API inválido o ausente'})
+            return
+        cuerpo = bytearray()
+        while True:
+            mensaje = await receive()
+            cuerpo.extend(mensaje.get('body', b''))
+            if not mensaje.get('more_body'):
+                break
+        environ = construir_environ(scope, bytes(cuerpo))
+
+        try:
+            turno, cabeceras = await self._en_hilo(self._despachar, environ, conversacion_id)
+            if turno.flujo is None or not con_eventos:
+                respuesta = turno.respuesta
+                if turno.flujo is not None:
+                    respuesta = ''.join([fragmento async for fragmento in self._fragmentos(turno)])
+                datos = {'message': respuesta}
+                if conversacion_id is not None:
+                    datos.update(conversacion_id=conversacion_id, finalizada=turno.finalizar)
+                await self._enviar_json(send, 200, datos, cabeceras)
+                return
+        except ConversacionOcupada:
+            await self._enviar_json(send, 409, {'error': 'La conversación está procesando otro mensaje'})
+            return
+        except Exception as e:
+            self.flask_app.logger.error(f"Error en la ruta '{scope['path']}': {str(e)}\n{traceback.format_exc()}")
+            await self._enviar_json(send, 500, {'error': str(e)})
+            return
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                        (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')] + cabeceras,
+        })
+        try:
+            async for fragmento in self._fragmentos(turno):
+                await self._enviar_evento(send, None, {'delta': fragmento})
+            await self._enviar_evento(send, 'fin', {'message': turno.respuesta})
+        except Exception as e:
+            self.flask_app.logger.error(f"Error en la ruta '{scope['path']}': {str(e)}\n{traceback.format_exc()}")
+            await self._enviar_evento(send, 'error', {'error': str(e)})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def _despachar(self, environ, conversacion_id):
+        """Ejecuta el turno dentro de un request de Flask para leer y guardar la misma sesión que la app WSGI."""
+        with self.flask_app.request_context(environ):
+            user_message = (request.get_json(silent=True) or {}).get('message')
+            if not user_message:
+                registrar_interaccion(None, '', MENSAJE_BIENVENIDA, True)
+                turno = Turno(MENSAJE_BIENVENIDA)
+            elif conversacion_id is not None:
+                turno = procesar_mensaje(conversacion_id, user_message)
+            else:
+                turno = handle_message_stream(user_message)
+            respuesta = self.flask_app.process_response(self.flask_app.response_class())
+            cabeceras = [(nombre.lower().encode('latin1'), valor.encode('latin1'))
+                         for nombre, valor in respuesta.headers.items() if nombre.lower() in CABECERAS_SESION]
+        return turno, cabeceras
+
+    async def _fragmentos(self, turno):
+        partes = []
+        if hasattr(turno.flujo, '__aiter__'):
+            async for fragmento in turno.flujo:
+                partes.append(fragmento)
+                yield fragmento
+        else:
+            for fragmento in await self._en_hilo(list, turno.flujo):
+                partes.append(fragmento)
+                yield fragmento
+        await self._en_hilo(self._terminar, turno, partes)
+
+    def _terminar(self, turno, partes):
+        with self.flask_app.app_context():
+            turno.terminar(partes)
+
+    @staticmethod
+    async def _enviar_json(send, estado, datos, cabeceras=()):
+        await send({
+            'type': 'http.response.start',
+            'status': estado,
+            'headers': [(b'content-type', b'application/json')] + list(cabeceras),
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps(datos).encode('utf-8')})
+
+    @staticmethod
+    async def _enviar_evento(send, evento, datos):
+        texto = f"data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+        if evento:
+            texto = f"event: {evento}\n" + texto
+        await send({'type': 'http.response.body', 'body': texto.encode('utf-8'), 'more_body': True})
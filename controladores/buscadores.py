@@ -0,0 +1,183 @@
+"""Buscadores intercambiables para los índices de intenciones.
+
+Todos reciben documentos ya normalizados y exponen la misma interfaz:
+
+- buscar(consulta, top_k): lista de (posición, similitud) ordenada de mayor a menor.
+- buscar_lote(consultas, top_k): una de esas listas por consulta.
+
+'tfidf' puntúa la consulta contra todas las filas de la matriz (exacto, coste lineal en el
+corpus). 'invertido' usa los mismos pesos TF-IDF pero recorre solo las listas de
+documentos (postings) de los términos de la consulta, así que su coste depende de lo
+frecuentes que sean esos términos y no del tamaño del corpus. 'ngramas' es un índice
+invertido sobre n-gramas de caracteres: tolera errores de tipeo ("frenso", "aseite") a
+cambio de listas de postings más largas y similitudes más altas en general.
+
+Un buscador se ajusta sobre los documentos (ajustar) o se reconstruye a partir de los
+arreglos que devuelve arreglos() (desde_arreglos), que es como se abre un artefacto de
+controladores.artefacto_indices sin copiar la matriz a la memoria de cada worker.
+"""
+import numpy as np
+from scipy.sparse import csc_matrix, csr_matrix
+from controladores.vectorizador import VectorizadorTfidf
+
+# Máximo de similitudes (consultas x documentos) que puede producir un bloque de buscar_lote
+ELEMENTOS_POR_BLOQUE = 4_000_000
+
+
+def mejores(puntajes, top_k, posiciones=None):
+    """Los top_k (posición, puntaje) de mayor a menor; ante empates gana la posición menor."""
+    if posiciones is None:
+        posiciones = np.arange(len(puntajes))
+    if not len(puntajes):
+        return []
+    if top_k == 1:
+        mejor = int(puntajes.argmax())
+        return [(int(posiciones[mejor]), float(puntajes[mejor]))]
+    if top_k < len(puntajes):
+        candidatos = np.argpartition(-puntajes, top_k - 1)[:top_k]
+    else:
+        candidatos = np.arange(len(puntajes))
+    candidatos = candidatos[np.lexsort((posiciones[candidatos], -puntajes[candidatos]))]
+    return list(zip(posiciones[candidatos].tolist(), puntajes[candidatos].tolist()))
+
+
+def _matriz(tipo, arreglos, prefijo, filas, columnas):
+    # copy=False: con arreglos abiertos con mmap la matriz usa directamente las páginas del archivo
+    return tipo((arreglos[f'{prefijo}_datos'], arreglos[f'{prefijo}_indices'], arreglos[f'{prefijo}_indptr']),
+                shape=(filas, columnas), copy=False)
+
+
+class BuscadorTfidf:
+    """Similitud coseno TF-IDF de palabras contra todo el corpus."""
+    nombre = 'tfidf'
+    analizador = 'palabras'
+    ngramas = (1, 1)
+    sublineal = False
+
+    def __init__(self, vectorizador, matriz):
+        self.vectorizador = vectorizador
+        self.matriz = matriz
+
+    @classmethod
+    def crear_vectorizador(cls, terminos=None, idf=None):
+        return VectorizadorTfidf(cls.analizador, cls.ngramas, cls.sublineal, terminos, idf)
+
+    @classmethod
+    def ajustar(cls, docs):
+        vectorizador = cls.crear_vectorizador()
+        return cls(vectorizador, vectorizador.ajustar(docs))
+
+    def arreglos(self):
+        """Arreglos que bastan para reconstruir el buscador con desde_arreglos."""
+        return {
+            'terminos': self.vectorizador.terminos,
+            'idf': self.vectorizador.idf,
+            'matriz_datos': self.matriz.data,
+            'matriz_indices': self.matriz.indices,
+            'matriz_indptr': self.matriz.indptr,
+        }
+
+    @classmethod
+    def desde_arreglos(cls, arreglos):
+        vectorizador = cls.crear_vectorizador(arreglos['terminos'], arreglos['idf'])
+        return cls(vectorizador, _matriz(csr_matrix, arreglos, 'matriz', len(arreglos['matriz_indptr']) - 1,
+                                         len(arreglos['terminos'])))
+
+    def __len__(self):
+        return self.matriz.shape[0]
+
+    def vectorizar(self, consultas):
+        return self.vectorizador.transformar(consultas)
+
+    def buscar(self, consulta, top_k=1):
+        return self.buscar_lote([consulta], top_k)[0]
+
+    def buscar_lote(self, consultas, top_k=1, tamano_bloque=1000):
+        """Puntúa cada bloque de consultas con una sola multiplicación dispersa.
+
+        El producto se mantiene disperso y cada fila se recorre desde indptr: solo aparecen los
+        documentos con algún término en común (similitud > 0), como en 'invertido'. El bloque
+        se limita para que, aun si todas las consultas tocaran todo el corpus, el producto no
+        supere ELEMENTOS_POR_BLOQUE.
+        """
+        top_k = max(1, min(top_k, len(self)))
+        tamano_bloque = max(1, min(tamano_bloque, ELEMENTOS_POR_BLOQUE // max(len(self), 1)))
+        resultados = []
+        for inicio in range(0, len(consultas), tamano_bloque):
+            consultas_vec = self.vectorizar(consultas[inicio:inicio + tamano_bloque])
+            # Los vectores TF-IDF están normalizados (L2): el producto punto es la similitud coseno
+            similitudes = (consultas_vec @ self.matriz.T).tocsr()
+            for fila in range(similitudes.shape[0]):
+                desde, hasta = similitudes.indptr[fila], similitudes.indptr[fila + 1]
+                resultados.append(mejores(similitudes.data[desde:hasta], top_k, similitudes.indices[desde:hasta]))
+        return resultados
+
+
+class BuscadorInvertido(BuscadorTfidf):
+    """Mismos pesos que 'tfidf', puntuados solo sobre los postings de los términos de la consulta."""
+    nombre = 'invertido'
+
+    def __init__(self, vectorizador, matriz, postings=None):
+        super().__init__(vectorizador, matriz)
+        # En CSC cada columna (término) es su lista de postings: documentos y pesos contiguos
+        self.postings = postings if postings is not None else matriz.tocsc()
+        self.inicios = self.postings.indptr
+        self.documentos = self.postings.indices
+        self.pesos = self.postings.data
+
+    def arreglos(self):
+        arreglos = super().arreglos()
+        arreglos.update(postings_datos=self.pesos, postings_indices=self.documentos, postings_indptr=self.inicios)
+        return arreglos
+
+    @classmethod
+    def desde_arreglos(cls, arreglos):
+        buscador = super().desde_arreglos(arreglos)
+        forma = buscador.matriz.shape
+        return cls(buscador.vectorizador, buscador.matriz, _matriz(csc_matrix, arreglos, 'postings', *forma))
+
+    def buscar_lote(self, consultas, top_k=1, tamano_bloque=1000):
+        top_k = max(1, top_k)
+        resultados = []
+        for inicio in range(0, len(consultas), tamano_bloque):
+            consultas_vec = self.vectorizar(consultas[inicio:inicio + tamano_bloque]).tocsr()
+            for fila in range(consultas_vec.shape[0]):
+                desde, hasta = consultas_vec.indptr[fila], consultas_vec.indptr[fila + 1]
+                resultados.append(self._puntuar(consultas_vec.indices[desde:hasta],
+                                                consultas_vec.data[desde:hasta], top_k))
+        return resultados
+
+    def _puntuar(self, terminos, pesos_consulta, top_k):
+        if not len(terminos):
+            return []
+        documentos = []
+        aportes = []
+        for termino, peso in zip(terminos.tolist(), pesos_consulta.tolist()):
+            desde, hasta = self.inicios[termino], self.inicios[termino + 1]
+            documentos.append(self.documentos[desde:hasta])
+            aportes.append(self.pesos[desde:hasta] * peso)
+        documentos = np.concatenate(documentos)
+        if not len(documentos):
+            return []
+        # Acumula los aportes por documento sin recorrer los documentos que no comparten términos
+        candidatos, posiciones = np.unique(documentos, return_inverse=True)
+        puntajes = np.bincount(posiciones, weights=np.concatenate(aportes))
+        return mejores(puntajes, top_k, candidatos)
+
+
+class BuscadorNgramas(BuscadorInvertido):
+    """Índice invertido sobre n-gramas de 3 y 4 caracteres, tolerante a errores de tipeo."""
+    nombre = 'ngramas'
+    analizador = 'char_wb'
+    ngramas = (3, 4)
+    sublineal = True
+
+
+BUSCADORES = {buscador.nombre: buscador for buscador in (BuscadorTfidf, BuscadorInvertido, BuscadorNgramas)}
+
+
+def obtener_buscador(nombre):
+    try:
+        return BUSCADORES[nombre]
+    except KeyError:
+        raise ValueError(f"Buscador desconocido: '{nombre}' (disponibles: {', '.join(BUSCADORES)})") from None
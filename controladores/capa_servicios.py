@@ -0,0 +1,230 @@
+from datetime import datetime, date
+from flask import current_app
+from sqlalchemy import update
+from modelos.models import db, Usuario, Vehiculo, Slot, Reserva, RegistroUsuario, RegistroServicio
+from controladores.disponibilidad import invalidar_disponibilidad
+
+
+class ConflictoReserva(Exception):
+    """El slot solicitado ya fue reservado por otra solicitud."""
+
+
+class ErrorRegistro(Exception):
+    """No se pudo registrar al cliente; 'etapa' indica si falló el usuario o el vehículo."""
+
+    def __init__(self, mensaje, etapa='usuario'):
+        super().__init__(mensaje)
+        self.etapa = etapa
+
+
+def _a_datetime(valor):
+    if isinstance(valor, datetime) or valor is None:
+        return valor
+    return datetime.fromisoformat(valor)
+
+
+def _a_fecha(valor):
+    if isinstance(valor, date) or not valor:
+        return valor or None
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+class UsuarioService:
+    """Alta de usuarios compartida por las rutas JSON y el chatbot."""
+
+    @staticmethod
+    def crear(data, commit=True):
+        usuario = Usuario(
+            nombre=data['nombre'],
+            apellido=data['apellido'],
+            email=data['email'],
+            telefono=data['telefono'],
+            direccion=data.get('direccion'),
+            ciudad=data.get('ciudad'),
+            profesion=data.get('profesion'),
+            pais=data.get('pais'),
+            fecha_nacimiento=_a_fecha(data.get('fecha_nacimiento')),
+            genero=data.get('genero'),
+            preferencias_servicio=data.get('preferencias_servicio'),
+            rol=data.get('rol', 'usuario'),
+            activo=data.get('activo', True),
+            estado=data.get('estado', 'inicio')
+        )
+        if data.get('password'):
+            usuario.set_password(data['password'])
+        db.session.add(usuario)
+        db.session.flush()
+        if commit:
+            db.session.commit()
+        return usuario
+
+
+class VehiculoService:
+    """Alta de vehículos compartida por las rutas JSON y el chatbot."""
+
+    @staticmethod
+    def crear(data, commit=True):
+        vehiculo = Vehiculo(
+            usuario_id=data['usuario_id'],
+            marca=data['marca'],
+            modelo=data['modelo'],
+            año=data['año']
+        )
+        db.session.add(vehiculo)
+        db.session.flush()
+        if commit:
+            db.session.commit()
+        return vehiculo
+
+
+class ReservaService:
+    """Creación de reservas con reclamo atómico del slot."""
+
+    @staticmethod
+    def reclamar_slot(slot_id):
+        """Marca el slot como reservado con un UPDATE condicional; devuelve False si ya estaba tomado."""
+        resultado = db.session.execute(
+            update(Slot)
+            .where(Slot.id == slot_id, Slot.reservado.is_(False))
+            .values(reservado=True)
+        )
+        return resultado.rowcount == 1
+
+    @staticmethod
+    def liberar_slot(slot_id):
+        resultado = db.session.execute(
+            update(Slot)
+            .where(Slot.id == slot_id, Slot.reservado.is_(True))
+            .values(reservado=False)
+        )
+        return resultado.rowcount == 1
+
+    @classmethod
+    def crear(cls, usuario_id, vehiculo_id, servicio_id, slot_id, problema, fecha_hora, commit=True):
+        """Reclama el slot y crea la reserva en la misma transacción.
+
+        Lanza ConflictoReserva si otro request reservó el slot primero.
+        """
+        if not cls.reclamar_slot(slot_id):
+            db.session.rollback()
+            raise ConflictoReserva(f"El slot {slot_id} ya está reservado")
+        reserva = Reserva(
+            usuario_id=usuario_id,
+            vehiculo_id=vehiculo_id,
+            servicio_id=servicio_id,
+            slot_id=slot_id,
+            problema=problema,
+            fecha_hora=_a_datetime(fecha_hora)
+        )
+        db.session.add(reserva)
+        db.session.flush()
+        if commit:
+            db.session.commit()
+            cls.invalidar_cache(slot_id)
+        return reserva
+
+    @staticmethod
+    def invalidar_cache(slot_id):
+        slot = db.session.get(Slot, slot_id)
+        if slot is not None:
+            invalidar_disponibilidad(slot.servicio_id, slot.fecha)
+
+
+class ClienteReservasLocal:
+    """Registro y reserva del chatbot dentro del mismo proceso, cada uno en una sola transacción."""
+
+    def registrar_cliente(self, usuario_data, vehiculo_data, tiempo_inicio_registro):
+        """Crea usuario, vehículo y RegistroUsuario; devuelve (usuario_id, vehiculo_id)."""
+        try:
+            usuario = UsuarioService.crear(usuario_data, commit=False)
+            vehiculo = VehiculoService.crear(dict(vehiculo_data, usuario_id=usuario.id), commit=False)
+            db.session.add(RegistroUsuario(
+                usuario_id=usuario.id,
+                tiempo_inicio=tiempo_inicio_registro,
+                tiempo_fin=datetime.now()
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise ErrorRegistro(str(e)) from e
+        return usuario.id, vehiculo.id
+
+    def reservar(self, reserva_data, tiempo_inicio_servicio):
+        """Crea la reserva y su RegistroServicio; devuelve el id de la reserva."""
+        reserva = ReservaService.crear(**reserva_data, commit=False)
+        db.session.add(RegistroServicio(
+            reserva_id=reserva.id,
+            tiempo_inicio=tiempo_inicio_servicio,
+            tiempo_fin=datetime.now()
+        ))
+        db.session.commit()
+        ReservaService.invalidar_cache(reserva_data['slot_id'])
+        return reserva.id
+
+
+class ClienteReservasRemoto:
+    """Modo remoto: usa la API JSON de RESERVAS_API_URL con conexiones reutilizadas y timeout."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        import requests  # Solo se importa en modo remoto
+        self.http = requests.Session()
+
+    def _post(self, ruta, data):
+        return self.http.post(f'{self.base_url}{ruta}', json=data, timeout=self.timeout)
+
+    def registrar_cliente(self, usuario_data, vehiculo_data, tiempo_inicio_registro):
+        import requests
+        try:
+            response_usuario = self._post('/usuarios', usuario_data)
+        except requests.RequestException as e:
+            raise ErrorRegistro(str(e)) from e
+        if response_usuario.status_code != 200:
+            raise ErrorRegistro(response_usuario.text)
+        usuario_id = response_usuario.json()['usuario']
+
+        try:
+            response_vehiculo = self._post('/vehiculos', dict(vehiculo_data, usuario_id=usuario_id))
+        except requests.RequestException as e:
+            raise ErrorRegistro(str(e), etapa='vehiculo') from e
+        if response_vehiculo.status_code != 200:
+            raise ErrorRegistro(response_vehiculo.text, etapa='vehiculo')
+
+        db.session.add(RegistroUsuario(
+            usuario_id=usuario_id,
+            tiempo_inicio=tiempo_inicio_registro,
+            tiempo_fin=datetime.now()
+        ))
+        db.session.commit()
+        return usuario_id, response_vehiculo.json()['vehiculo']
+
+    def reservar(self, reserva_data, tiempo_inicio_servicio):
+        data = dict(reserva_data)
+        if isinstance(data.get('fecha_hora'), datetime):
+            data['fecha_hora'] = data['fecha_hora'].strftime('%Y-%m-%d %H:%M:%S')
+        response = self._post('/reservas', data)
+        if response.status_code == 409:
+            raise ConflictoReserva(response.json().get('error'))
+        response.raise_for_status()
+        reserva_id = response.json()['reserva']
+        db.session.add(RegistroServicio(
+            reserva_id=reserva_id,
+            tiempo_inicio=tiempo_inicio_servicio,
+            tiempo_fin=datetime.now()
+        ))
+        db.session.commit()
+        return reserva_id
+
+
+# Función para obtener el cliente de reservas según RESERVAS_MODO ('local' o 'remoto')
+def obtener_cliente_reservas(app=None):
+    app = app or current_app
+    cliente = app.extensions.get('cliente_reservas')
+    if cliente is None:
+        if app.config.get('RESERVAS_MODO', 'local') == 'remoto':
+            cliente = ClienteReservasRemoto(app.config['RESERVAS_API_URL'], app.config.get('RESERVAS_API_TIMEOUT', 10))
+        else:
+            cliente = ClienteReservasLocal()
+        app.extensions['cliente_reservas'] = cliente
+    return cliente
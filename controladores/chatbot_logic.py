@@ -1,7 +1,9 @@
 from flask import Flask, request, jsonify, session
 from flask_session import Session
+from controladores.conversacion import terminar_conversacion_de_la_sesion
+from controladores.enrutador_intenciones import enrutador_intenciones, CONFIRMAR, DESPEDIDA, AGRADECER, OTRO_SERVICIO
 
-VALID_KEYWORDS = ['gracias', 'sí', 'no', 'reservar otro servicio']
+VALID_INTENTS = frozenset((AGRADECER, CONFIRMAR, DESPEDIDA, OTRO_SERVICIO))
 
 def initialize_app():
     app = Flask(__name__)
@@ -14,15 +16,15 @@ app = initialize_app()
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    user_input = request.json.get('message', '').strip().lower()
+    intent = enrutador_intenciones.clasificar(request.json.get('message', ''))
     
-    if user_input not in VALID_KEYWORDS:
-        session.clear()  # Finalizar sesión
+    if intent not in VALID_INTENTS:
+        terminar_conversacion_de_la_sesion()  # Finalizar solo la conversación, no el login
         return jsonify({"response": "❌ **El servicio que has solicitado no está disponible.** Por favor, elige 🛠️ Reservar otro servicio."})
     
     # Procesar la entrada válida
-    if user_input == 'gracias':
-        session.clear()  # Finalizar sesión
+    if intent == AGRADECER:
+        terminar_conversacion_de_la_sesion()  # Finalizar solo la conversación, no el login
         return jsonify({"response": "😊 **¡De nada!** Tu sesión ha sido finalizada. ¡Hasta luego!"})
     
     # Otros casos de uso aquí
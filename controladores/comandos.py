@@ -0,0 +1,198 @@
+import csv
+import sys
+import click
+from modelos.models import db, Interaccion
+from controladores.conversacion import clasificar_lote, maquina, indice_problemas, indice_servicios
+from controladores.planificador_slots import aprovisionar_slots, planificador_slots
+from controladores.notificaciones import TrabajadorNotificaciones
+from controladores import analitica
+
+def register_commands(app):
+    @app.cli.command('clasificar-interacciones')
+    @click.option('--top-k', default=3, show_default=True, help='Resultados por mensaje.')
+    @click.option('--umbral', 'umbrales', multiple=True, type=float, default=(0.1, 0.2, 0.3, 0.4),
+                  show_default=True, help='Umbrales de similitud a evaluar.')
+    @click.option('--limite', default=None, type=int, help='Máximo de interacciones a reproducir.')
+    @click.option('--lote', default=1000, show_default=True, help='Mensajes por llamada vectorizada.')
+    @click.option('--salida', default=None, type=click.Path(dir_okay=False), help='Archivo CSV con los resultados.')
+    def clasificar_interacciones(top_k, umbrales, limite, lote, salida):
+        """Reproduce los mensajes de Interaccion contra el índice de intenciones."""
+        consulta = (db.session.query(Interaccion.id, Interaccion.mensaje_usuario)
+                    .filter(Interaccion.mensaje_usuario != '', Interaccion.mensaje_usuario != '********')
+                    .order_by(Interaccion.id))
+        if limite:
+            consulta = consulta.limit(limite)
+
+        archivo = open(salida, 'w', newline='', encoding='utf-8') if salida else sys.stdout
+        writer = csv.writer(archivo)
+        writer.writerow(['interaccion_id', 'mensaje', 'rango', 'problema', 'servicio', 'similitud'])
+        cubiertos = {umbral: 0 for umbral in umbrales}
+        total = 0
+
+        def procesar(filas):
+            nonlocal total
+            clasificaciones = clasificar_lote([mensaje for _, mensaje in filas], top_k=top_k)
+            for (interaccion_id, mensaje), candidatos in zip(filas, clasificaciones):
+                total += 1
+                mejor = candidatos[0][2] if candidatos else 0
+                for umbral in umbrales:
+                    if mejor >= umbral:
+                        cubiertos[umbral] += 1
+                for rango, (problema, servicio, similitud) in enumerate(candidatos, start=1):
+                    writer.writerow([interaccion_id, mensaje, rango, problema or '', servicio, f'{similitud:.4f}'])
+
+        try:
+            filas = []
+            for fila in consulta.yield_per(lote):
+                filas.append(fila)
+                if len(filas) >= lote:
+                    procesar(filas)
+                    filas = []
+            if filas:
+                procesar(filas)
+        finally:
+            if salida:
+                archivo.close()
+
+        click.echo(f'Interacciones procesadas: {total}', err=True)
+        for umbral in umbrales:
+            porcentaje = (cubiertos[umbral] / total * 100) if total else 0
+            click.echo(f'  umbral {umbral:.2f}: {cubiertos[umbral]} ({porcentaje:.1f}%) sobre el umbral', err=True)
+
+    @app.cli.command('verificar-estados')
+    def verificar_estados():
+        """Muestra el grafo de transiciones de la conversación y valida que sea consistente."""
+        for estado in maquina.estados:
+            destinos = ', '.join(sorted(maquina.transiciones(estado))) or '-'
+            click.echo(f'{estado} -> {destinos}')
+        errores = maquina.verificar()
+        for error in errores:
+            click.echo(f'ERROR: {error}', err=True)
+        if errores:
+            sys.exit(1)
+
+    @app.cli.command('aprovisionar-slots')
+    @click.option('--dias', default=None, type=int, help='Días de horizonte (por defecto SLOTS_HORIZONTE_DIAS).')
+    def aprovisionar_slots_comando(dias):
+        """Genera los slots faltantes de todos los servicios para los próximos días."""
+        ejecucion = aprovisionar_slots(dias or app.config['SLOTS_HORIZONTE_DIAS'])
+        if not ejecucion.exitosa:
+            click.echo(f'Error al aprovisionar slots: {ejecucion.error}', err=True)
+            sys.exit(1)
+        click.echo(f'{ejecucion.slots_creados} slots creados para {ejecucion.servicios} servicios '
+                   f'entre {ejecucion.fecha_desde} y {ejecucion.fecha_hasta}')
+
+    @app.cli.command('planificador-slots')
+    def planificador_slots_comando():
+        """Aprovisiona slots cada SLOTS_PLANIFICADOR_INTERVALO_MIN minutos hasta que se detenga el proceso."""
+        if app.config['SLOTS_PLANIFICADOR_INTERVALO_MIN'] <= 0:
+            click.echo('SLOTS_PLANIFICADOR_INTERVALO_MIN debe ser mayor que 0.', err=True)
+            sys.exit(1)
+        click.echo(f"Planificador de slots iniciado (cada {app.config['SLOTS_PLANIFICADOR_INTERVALO_MIN']} min).")
+        planificador_slots.ejecutar()
+
+    @app.cli.command('consolidar-analitica')
+    @click.option('--dias', default=1, show_default=True, help='Días anteriores a hoy a recalcular.')
+    def consolidar_analitica(dias):
+        """Guarda los resúmenes diarios en ResumenDiario y recalcula los totales del dashboard."""
+        for resumen in analitica.consolidar(dias):
+            click.echo(f'{resumen.fecha}: {resumen.interacciones} interacciones, {resumen.registros} registros, '
+                       f'{resumen.reservas} reservas, {resumen.conversiones_realizadas} conversiones')
+
+    @app.cli.command('prueba-carga')
+    @click.option('--conversaciones', default=200, show_default=True, help='Conversaciones a simular.')
+    @click.option('--concurrencia', default=8, show_default=True, help='Conversaciones simultáneas.')
+    @click.option('--modo', type=click.Choice(['http', 'funcion']), default='http', show_default=True,
+                  help="'http' usa POST /conversacion; 'funcion' llama a procesar_mensaje directamente.")
+    @click.option('--mezcla', default='registro=1,recurrente=2,precio=1,consulta=1', show_default=True,
+                  help='Peso de cada escenario.')
+    @click.option('--latencia-llm', default=0.0, show_default=True, help='Segundos de espera del LLM falso.')
+    @click.option('--dias', default=7, show_default=True, help='Días con slots disponibles para reservar.')
+    @click.option('--semilla', default=0, show_default=True, help='Semilla para repetir la misma prueba.')
+    @click.option('--salida', default=None, type=click.Path(dir_okay=False), help='Archivo JSON con el informe.')
+    def prueba_carga(conversaciones, concurrencia, modo, mezcla, latencia_llm, dias, semilla, salida):
+        """Simula conversaciones completas y mide latencia por estado (SQLite temporal, sin red)."""
+        from controladores.prueba_carga import ESCENARIOS, ejecutar_prueba, formatear_informe, guardar_informe
+        try:
+            pesos = {nombre.strip(): float(peso) for nombre, peso in (par.split('=') for par in mezcla.split(','))}
+        except ValueError:
+            raise click.BadParameter("Use el formato escenario=peso,escenario=peso", param_hint='--mezcla')
+        desconocidos = set(pesos) - set(ESCENARIOS)
+        if desconocidos:
+            raise click.BadParameter(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}", param_hint='--mezcla')
+        datos = ejecutar_prueba(conversaciones, concurrencia, modo, pesos, latencia_llm, dias, semilla)
+        click.echo(formatear_informe(datos))
+        if salida:
+            guardar_informe(datos, salida)
+
+    @app.cli.command('construir-indices')
+    @click.option('--directorio', default=None, type=click.Path(file_okay=False),
+                  help='Directorio de artefactos (por defecto INDICES_DIR).')
+    @click.option('--conservar', default=2, show_default=True, help='Versiones a conservar por índice.')
+    def construir_indices(directorio, conservar):
+        """Vectoriza los corpus de datos/ y escribe los artefactos que los workers abren con mmap."""
+        from controladores import artefacto_indices
+        directorio = directorio or app.config.get('INDICES_DIR')
+        for indice in (indice_servicios, indice_problemas):
+            manifiesto = artefacto_indices.construir(indice, directorio, conservar)
+            click.echo(f"{indice.nombre}: {manifiesto['documentos']} documentos, {manifiesto['terminos']} términos, "
+                       f"buscador {manifiesto['buscador']} -> v{manifiesto['formato']}-{manifiesto['huella']}")
+
+    @app.cli.command('comparar-buscadores')
+    @click.option('--tamanos', default='577,5000,20000', show_default=True, help='Tamaños de corpus a comparar.')
+    @click.option('--consultas', default=300, show_default=True, help='Consultas por tamaño.')
+    @click.option('--top-k', default=5, show_default=True, help='Resultados por consulta para el recall.')
+    @click.option('--errores', default=0.3, show_default=True, help='Fracción de consultas con un error de tipeo.')
+    @click.option('--buscadores', default=None, help='Buscadores separados por comas (por defecto, todos).')
+    @click.option('--semilla', default=0, show_default=True, help='Semilla para repetir la misma comparación.')
+    @click.option('--salida', default=None, type=click.Path(dir_okay=False), help='Archivo JSON con el informe.')
+    def comparar_buscadores(tamanos, consultas, top_k, errores, buscadores, semilla, salida):
+        """Compara recall y latencia de los buscadores de intenciones en corpus sintéticos."""
+        from controladores.buscadores import BUSCADORES
+        from controladores.comparacion_buscadores import ejecutar_comparacion, formatear_informe
+        from controladores.prueba_carga import guardar_informe
+        try:
+            tamanos = [int(tamano) for tamano in tamanos.split(',')]
+        except ValueError:
+            raise click.BadParameter('Use enteros separados por comas', param_hint='--tamanos')
+        nombres = [nombre.strip() for nombre in buscadores.split(',')] if buscadores else None
+        desconocidos = set(nombres or ()) - set(BUSCADORES)
+        if desconocidos:
+            raise click.BadParameter(f"Buscadores desconocidos: {', '.join(sorted(desconocidos))}", param_hint='--buscadores')
+        datos = ejecutar_comparacion(tamanos, consultas, top_k, errores, nombres, semilla)
+        click.echo(formatear_informe(datos))
+        if salida:
+            guardar_informe(datos, salida)
+
+    @app.cli.command('medir-arranque')
+    @click.option('--repeticiones', default=5, show_default=True, help='Arranques en frío a medir.')
+    @click.option('--config', 'nombre_config', default='prod', show_default=True, help='Configuración de create_app.')
+    @click.option('--importaciones', default=0, show_default=True,
+                  help='Mostrar los N paquetes que más tardan en importarse (python -X importtime).')
+    @click.option('--salida', default=None, type=click.Path(dir_okay=False), help='Archivo JSON con el informe.')
+    def medir_arranque(repeticiones, nombre_config, importaciones, salida):
+        """Mide el arranque en frío de un worker web (importar app.py, create_app, primera búsqueda)."""
+        from controladores.medicion_arranque import medir_arranque as medir, formatear_informe
+        from controladores.prueba_carga import guardar_informe
+        datos = medir(repeticiones, nombre_config, importaciones)
+        click.echo(formatear_informe(datos))
+        if salida:
+            guardar_informe(datos, salida)
+
+    @app.cli.command('notificaciones-worker')
+    @click.option('--una-vez', is_flag=True, help='Procesar la cola pendiente y terminar.')
+    @click.option('--nombre', default=None,
+                  help='Nombre único del trabajador (por defecto DYNO o el host más el PID).')
+    def notificaciones_worker(una_vez, nombre):
+        """Envía los correos encolados con reintentos y lista de fallidos."""
+        trabajador = TrabajadorNotificaciones(app, nombre=nombre)
+        if trabajador.redis is None:
+            click.echo('Se requiere Redis (REDIS_URL) para la cola de notificaciones.', err=True)
+            sys.exit(1)
+        if una_vez:
+            trabajador.recuperar_pendientes()
+            while trabajador.procesar_una_vez(timeout=1) is not None:
+                pass
+            return
+        click.echo('Trabajador de notificaciones iniciado.')
+        trabajador.ejecutar()
@@ -0,0 +1,161 @@
+"""Comparación de los buscadores de intenciones en corpus de distinto tamaño.
+
+Amplía datos/problemas.txt con variantes sintéticas (palabras reordenadas, omitidas o
+combinadas con otra descripción del mismo servicio, como las de los tickets del taller)
+hasta cada tamaño pedido y mide, por buscador:
+
+- construcción del índice;
+- latencia de una consulta (el camino del chat) y rendimiento en lote;
+- recall@k frente al TF-IDF exacto;
+- acierto del servicio en la primera posición, con consultas que incluyen errores de tipeo.
+
+Se ejecuta con 'python manage.py comparar-buscadores'.
+"""
+import os
+import random
+import time
+from controladores.buscadores import BUSCADORES
+from controladores.conversacion import cargar_problemas_servicios
+from controladores.indice_intenciones import DATOS_DIR
+from controladores.normalizacion import normalizar_intencion
+from controladores.prueba_carga import percentil
+
+_PREFIJOS = ('', '', 'cliente indica que', 'el cliente reporta que', 'segun el ticket', 'urgente')
+
+
+def _variante(texto, otro, aleatorio):
+    palabras = texto.split()
+    operacion = aleatorio.random()
+    if operacion < 0.3 and len(palabras) > 3:
+        del palabras[aleatorio.randrange(len(palabras))]
+    elif operacion < 0.6 and len(palabras) > 2:
+        i = aleatorio.randrange(len(palabras) - 1)
+        palabras[i], palabras[i + 1] = palabras[i + 1], palabras[i]
+    else:
+        palabras += otro.split()[:aleatorio.randint(1, 3)]
+    return ' '.join(filter(None, [aleatorio.choice(_PREFIJOS)] + palabras))
+
+
+def generar_corpus(problemas, tamano, aleatorio):
+    """Lista de (texto, servicio) con las descripciones originales y variantes hasta 'tamano'."""
+    corpus = list(problemas.items())[:tamano]
+    por_servicio = {}
+    for texto, servicio in problemas.items():
+        por_servicio.setdefault(servicio, []).append(texto)
+    while len(corpus) < tamano:
+        texto, servicio = aleatorio.choice(corpus[:len(problemas)])
+        corpus.append((_variante(texto, aleatorio.choice(por_servicio[servicio]), aleatorio), servicio))
+    return corpus
+
+
+def con_error_tipeo(texto, aleatorio):
+    """Intercambia o elimina una letra de una palabra de al menos cuatro letras."""
+    palabras = texto.split()
+    largas = [i for i, palabra in enumerate(palabras) if len(palabra) >= 4]
+    if not largas:
+        return texto
+    i = aleatorio.choice(largas)
+    palabra = palabras[i]
+    j = aleatorio.randrange(1, len(palabra) - 1)
+    if aleatorio.random() < 0.5:
+        palabras[i] = palabra[:j] + palabra[j + 1] + palabra[j] + palabra[j + 2:]
+    else:
+        palabras[i] = palabra[:j] + palabra[j + 1:]
+    return ' '.join(palabras)
+
+
+def generar_consultas(corpus, cantidad, tasa_errores, aleatorio):
+    """Lista de (consulta, servicio esperado); una fracción 'tasa_errores' lleva un error de tipeo."""
+    consultas = []
+    for texto, servicio in aleatorio.sample(corpus, min(cantidad, len(corpus))):
+        texto = _variante(texto, texto, aleatorio)
+        if aleatorio.random() < tasa_errores:
+            texto = con_error_tipeo(texto, aleatorio)
+        consultas.append((texto, servicio))
+    return consultas
+
+
+def _recall(resultado, exacto, puntajes_exactos):
+    """Fracción del top_k exacto recuperada; un documento empatado con el k-ésimo también cuenta."""
+    positivos = [similitud for _, similitud in exacto if similitud > 0]
+    if not positivos:
+        return 1.0
+    corte = positivos[-1] - 1e-9
+    return sum(1 for puntaje in puntajes_exactos if puntaje >= corte) / len(positivos)
+
+
+def medir_buscador(clase, docs, servicios_corpus, consultas, esperados, top_k, referencia, exactos):
+    """Métricas de un buscador; 'referencia' es el TF-IDF exacto y 'exactos' sus top_k por consulta."""
+    inicio = time.perf_counter()
+    buscador = clase.ajustar(docs)
+    construccion = time.perf_counter() - inicio
+
+    latencias = []
+    resultados = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultados.append(buscador.buscar(consulta, top_k))
+        latencias.append(time.perf_counter() - inicio)
+    inicio = time.perf_counter()
+    buscador.buscar_lote(consultas, top_k)
+    lote = time.perf_counter() - inicio
+
+    recall = aciertos = 0
+    consultas_vec = referencia.vectorizar(consultas)
+    for numero, (resultado, exacto, servicio) in enumerate(zip(resultados, exactos, esperados)):
+        # Puntaje TF-IDF exacto de lo recuperado: los empates con el k-ésimo no penalizan
+        posiciones = [posicion for posicion, similitud in resultado if similitud > 0]
+        puntajes_exactos = (referencia.matriz[posiciones] @ consultas_vec[numero].T).toarray().ravel()
+        recall += _recall(resultado, exacto, puntajes_exactos)
+        if resultado and resultado[0][1] > 0 and servicios_corpus[resultado[0][0]] == servicio:
+            aciertos += 1
+    latencias.sort()
+    return {
+        'construccion_s': construccion,
+        'p50_ms': percentil(latencias, 50) * 1000,
+        'p95_ms': percentil(latencias, 95) * 1000,
+        'lote_consultas_por_segundo': len(consultas) / lote if lote else 0.0,
+        'recall': recall / len(consultas),
+        'acierto_servicio': aciertos / len(consultas),
+    }
+
+
+def ejecutar_comparacion(tamanos=(577, 5000, 20000), consultas=300, top_k=5, tasa_errores=0.3,
+                         buscadores=None, semilla=0):
+    """Compara los buscadores en cada tamaño de corpus y devuelve el informe como diccionario."""
+    buscadores = buscadores or list(BUSCADORES)
+    problemas = cargar_problemas_servicios(os.path.join(DATOS_DIR, 'problemas.txt'))
+    filas = []
+    for tamano in tamanos:
+        aleatorio = random.Random(semilla)
+        corpus = generar_corpus(problemas, tamano, aleatorio)
+        docs = [normalizar_intencion(texto) for texto, _ in corpus]
+        servicios_corpus = [servicio for _, servicio in corpus]
+        muestra = generar_consultas(corpus, consultas, tasa_errores, aleatorio)
+        normalizadas = [normalizar_intencion(consulta) for consulta, _ in muestra]
+        esperados = [servicio for _, servicio in muestra]
+        referencia = BUSCADORES['tfidf'].ajustar(docs)
+        exactos = referencia.buscar_lote(normalizadas, top_k)
+        for nombre in buscadores:
+            fila = medir_buscador(BUSCADORES[nombre], docs, servicios_corpus, normalizadas, esperados, top_k,
+                                  referencia, exactos)
+            fila.update(tamano=len(corpus), buscador=nombre)
+            filas.append(fila)
+    return {'consultas': consultas, 'top_k': top_k, 'tasa_errores': tasa_errores, 'semilla': semilla,
+            'resultados': filas}
+
+
+def formatear_informe(datos):
+    lineas = [
+        f"{datos['consultas']} consultas por tamaño, top {datos['top_k']}, "
+        f"{datos['tasa_errores']:.0%} con errores de tipeo (recall frente al TF-IDF exacto)",
+        '',
+        f"{'tamaño':>8}  {'buscador':<10}{'construir s':>12}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'lote q/s':>11}{'recall':>8}{'acierto':>9}",
+    ]
+    for fila in datos['resultados']:
+        lineas.append(f"{fila['tamano']:>8}  {fila['buscador']:<10}{fila['construccion_s']:>12.2f}"
+                      f"{fila['p50_ms']:>9.2f}{fila['p95_ms']:>9.2f}{fila['lote_consultas_por_segundo']:>11.0f}"
+                      f"{fila['recall']:>8.2f}{fila['acierto_servicio']:>9.2f}")
+    return '\n'.join(lineas)
+
@@ -1,86 +1,56 @@
-import openai
-import requests
 import re
 import os
-from datetime import datetime, timedelta
-from modelos.models import db, Usuario, Vehiculo, Servicio, Slot, Reserva, RegistroUsuario, RegistroServicio, Interaccion
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from flask import Blueprint, request, jsonify, current_app as app, redirect, url_for, session
-from openai.error import OpenAIError
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-
-# Configuración de la API de OpenAI
-openai.api_key = os.getenv('API_KEY')
-
-RESERVAS_API_URL = os.getenv('RESERVAS_API_URL')
-SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
-
-# Función para enviar un correo electrónico
-def enviar_correo(destinatario, asunto, contenido_html):
-    message = Mail(
-        from_email='tucorreo@tuempresa.com',  # Cambia esto por tu correo verificado en SendGrid
-        to_emails=destinatario,
-        subject=asunto,
-        html_content=contenido_html)
-    try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
-        print(response.status_code)
-        print(response.body)
-        print(response.headers)
-    except Exception as e:
-        print(str(e))
-
-# Función para interactuar con OpenAI
+import threading
+import time
+import uuid
+from datetime import datetime
+from modelos.models import db, Usuario, Vehiculo, Servicio, Slot
+from controladores.indice_intenciones import IndiceIntenciones, DATOS_DIR
+from controladores.maquina_estados import MaquinaEstados, Turno
+from controladores.estado_conversacion import EstadoConversacion, obtener_almacen_estados
+from controladores import analitica, metricas
+from controladores.analitica import CONTADORES_CONVERSACION
+from controladores.metricas import medir
+from controladores.normalizacion import normalizar_intencion
+from controladores.enrutador_intenciones import (
+    enrutador_intenciones, CONFIRMAR, DESPEDIDA, AGRADECER, PRECIO, OTRO_SERVICIO, CONSULTA)
+from controladores.registro_interacciones import cola_interacciones
+from controladores.disponibilidad import horarios_libres
+from controladores.notificaciones import encolar_correo
+from controladores.gateway_llm import gateway_llm, RespuestaLLM
+from controladores.capa_servicios import obtener_cliente_reservas, ConflictoReserva, ErrorRegistro
+from flask import current_app as app, session
+
+MENSAJE_BIENVENIDA = "¡Hola! 👋 **Soy tu asistente para la reserva de servicios automotrices.** 🚗 ¿Cómo te puedo ayudar hoy? "
+
+# Función para interactuar con OpenAI (a través del gateway con caché y coalescencia)
 def interactuar_con_openai(consulta):
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": consulta}
-            ],
-            max_tokens=100,
-            temperature=0.5,
-        )
-        return response.choices[0].message['content'].strip()
-    except openai.error.RateLimitError:
-        return "❌ **Lo siento, hemos superado nuestro límite de solicitudes por ahora. Por favor, intenta de nuevo más tarde.**"
-    except openai.error.OpenAIError as e:
-        print(f"Error interacting with OpenAI: {e}")
-        return "❌ **Ha ocurrido un error al interactuar con OpenAI. Por favor, intenta de nuevo más tarde.**"
-
-# Función para registrar interacciones
+    return gateway_llm.consultar(consulta)
+
+# Función para registrar interacciones (se encolan y se insertan en bloque en segundo plano)
 def registrar_interaccion(usuario_id, mensaje_usuario, respuesta_bot, es_exitosa):
-    nueva_interaccion = Interaccion(
-        usuario_id=usuario_id,
-        mensaje_usuario=mensaje_usuario,
-        respuesta_bot=respuesta_bot,
-        es_exitosa=es_exitosa
-    )
-    db.session.add(nueva_interaccion)
-    db.session.commit()
-
-# Función para preprocesar el texto
+    cola_interacciones.encolar({
+        'usuario_id': usuario_id,
+        'mensaje_usuario': mensaje_usuario,
+        'respuesta_bot': respuesta_bot,
+        'es_exitosa': es_exitosa,
+        'timestamp': datetime.now()
+    })
+
+# Función para preprocesar el texto como lo hacen los índices de intenciones
 def preprocesar_texto(texto):
-    texto = texto.lower()
-    texto = re.sub(r'\d+', '', texto)  # eliminar números
-    texto = re.sub(r'\s+', ' ', texto)  # eliminar espacios adicionales
-    texto = re.sub(r'[^\w\s]', '', texto)  # eliminar caracteres especiales
-    return texto
+    return normalizar_intencion(texto)
 
 # Función para cargar servicios desde el archivo de texto
-def cargar_servicios():
+def cargar_servicios(ruta='datos/servicios.txt'):
     servicios = {}
     try:
-        with open('datos/servicios.txt', 'r', encoding='utf-8') as file:
+        with open(ruta, 'r', encoding='utf-8') as file:
             for line in file:
                 line = line.strip()
                 if ':' in line:
                     nombre, descripcion = line.split(':', 1)
-                    servicios[preprocesar_texto(nombre.strip())] = preprocesar_texto(descripcion.strip())
+                    servicios[nombre.strip()] = descripcion.strip()  # El índice normaliza el texto al vectorizar
                 else:
                     print(f"Línea ignorada por formato incorrecto: {line}")
     except FileNotFoundError:
@@ -90,17 +60,17 @@ def cargar_servicios():
     return servicios
 
 # Función para cargar problemas y servicios desde el archivo de texto
-def cargar_problemas_servicios():
+def cargar_problemas_servicios(ruta='datos/problemas.txt'):
     problemas_servicios = {}
     try:
-        with open('datos/problemas.txt', 'r', encoding='utf-8') as file:
+        with open(ruta, 'r', encoding='utf-8') as file:
             for line in file:
                 line = line.strip()
                 if not line:  # Ignorar líneas en blanco
                     continue
                 if ':' in line:
                     problema, servicio = line.split(':', 1)
-                    problemas_servicios[preprocesar_texto(problema.strip())] = preprocesar_texto(servicio.strip())
+                    problemas_servicios[problema.strip()] = servicio.strip()
                 else:
                     print(f"Línea ignorada por formato incorrecto: '{line}'")
     except FileNotFoundError:
@@ -109,513 +79,415 @@ def cargar_problemas_servicios():
         print(f"Error al cargar problemas y servicios: {e}")
     return problemas_servicios
 
+# Índices TF-IDF precalculados: se vectorizan una vez por worker y se recargan si cambia el archivo
+indice_servicios = IndiceIntenciones(os.path.join(DATOS_DIR, 'servicios.txt'), cargar_servicios, campo='valores')
+indice_problemas = IndiceIntenciones(os.path.join(DATOS_DIR, 'problemas.txt'), cargar_problemas_servicios, campo='claves')
+
 # Función para encontrar servicio basado en la consulta
-def encontrar_servicio(servicios, consulta, umbral_similitud=0.2):
-    vectorizer = TfidfVectorizer()
-    docs = list(servicios.values())
-    tfidf_matrix = vectorizer.fit_transform(docs)
-    consulta_vec = vectorizer.transform([preprocesar_texto(consulta)])
-    similarities = cosine_similarity(consulta_vec, tfidf_matrix).flatten()
-    
-    index = similarities.argmax()
-    if similarities[index] >= umbral_similitud:
-        servicio_principal = list(servicios.keys())[index]
-        return servicio_principal, similarities[index]
+def encontrar_servicio(indice, consulta, umbral_similitud=0.2):
+    snapshot, index, similitud = indice.buscar(consulta)
+    if index is not None and similitud >= umbral_similitud:
+        servicio_principal = snapshot.claves[index]
+        return servicio_principal, similitud
     else:
         return None, 0
 
 # Función para encontrar problema basado en la consulta
-def encontrar_problema(problemas_servicios, consulta, umbral_similitud=0.2):
-    vectorizer = TfidfVectorizer()
-    problemas = list(problemas_servicios.keys())
-    servicios = list(problemas_servicios.values())
-
-    # Preprocesa los problemas
-    problemas_preprocesados = [preprocesar_texto(problema) for problema in problemas]
-
-    tfidf_matrix = vectorizer.fit_transform(problemas_preprocesados)
-    consulta_vec = vectorizer.transform([preprocesar_texto(consulta)])
-    similarities = cosine_similarity(consulta_vec, tfidf_matrix).flatten()
-    
-    index = similarities.argmax()
-    if similarities[index] >= umbral_similitud:
-        problema = problemas[index]
-        servicio_recomendado = problemas_servicios[problema]
-        return problema, servicio_recomendado, similarities[index]
+def encontrar_problema(indice, consulta, umbral_similitud=0.2):
+    snapshot, index, similitud = indice.buscar(consulta)
+    if index is not None and similitud >= umbral_similitud:
+        problema = snapshot.claves[index]
+        servicio_recomendado = snapshot.valores[index]
+        return problema, servicio_recomendado, similitud
     else:
         return None, None, 0
 
-# Función para generar slots automáticamente
-def generar_slots(servicio_id, fecha_inicio, fecha_fin):
-    horario_inicio_manana = datetime.strptime("09:00", '%H:%M').time()
-    horario_fin_manana = datetime.strptime("12:00", '%H:%M').time()
-    horario_inicio_tarde = datetime.strptime("13:00", '%H:%M').time()
-    horario_fin_tarde = datetime.strptime("18:00", '%H:%M').time()
-
-    fecha_inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-    fecha_fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    delta = timedelta(days=1)
-
-    while fecha_inicio <= fecha_fin:
-        current_time = datetime.combine(fecha_inicio, horario_inicio_manana)
-        while current_time.time() < horario_fin_manana:
-            new_slot = Slot(
-                servicio_id=servicio_id,
-                fecha=fecha_inicio,
-                hora_inicio=current_time.time(),
-                hora_fin=(datetime.combine(fecha_inicio, current_time.time()) + timedelta(minutes=60)).time(),
-                reservado=False
-            )
-            db.session.add(new_slot)
-            db.session.commit()
-            current_time += timedelta(minutes=60)
-
-        current_time = datetime.combine(fecha_inicio, horario_inicio_tarde)
-        while current_time.time() < horario_fin_tarde:
-            new_slot = Slot(
-                servicio_id=servicio_id,
-                fecha=fecha_inicio,
-                hora_inicio=current_time.time(),
-                hora_fin=(datetime.combine(fecha_inicio, current_time.time()) + timedelta(minutes=60)).time(),
-                reservado=False
-            )
-            db.session.add(new_slot)
-            db.session.commit()
-            current_time += timedelta(minutes=60)
-
-        fecha_inicio += delta
+# Función para clasificar muchos mensajes en una sola pasada vectorizada
+def clasificar_lote(mensajes, top_k=3):
+    """Devuelve, por mensaje, los top_k (problema, servicio, similitud) ordenados de mayor a menor.
+
+    Combina coincidencias de problemas.txt y de servicios.txt como lo hace 'reservar_servicio';
+    las coincidencias directas de servicio tienen problema None.
+    """
+    consultas = [mensaje.strip() for mensaje in mensajes]
+    snapshot_problemas, resultados_problemas = indice_problemas.buscar_lote(consultas, top_k)
+    snapshot_servicios, resultados_servicios = indice_servicios.buscar_lote(consultas, top_k)
+
+    clasificaciones = []
+    for por_problema, por_servicio in zip(resultados_problemas, resultados_servicios):
+        candidatos = [
+            (snapshot_problemas.claves[i], snapshot_problemas.valores[i], similitud)
+            for i, similitud in por_problema if similitud > 0
+        ]
+        candidatos += [
+            (None, snapshot_servicios.claves[i], similitud)
+            for i, similitud in por_servicio if similitud > 0
+        ]
+        candidatos.sort(key=lambda candidato: candidato[2], reverse=True)
+        clasificaciones.append(candidatos[:top_k])
+    return clasificaciones
+
+# Estado inicial de una conversación nueva
+def nuevo_estado_conversacion(conversacion_id=None):
+    return EstadoConversacion(conversacion_id)
+
+UMBRAL_SIMILITUD = 0.2
+
+# Máquina de estados de la conversación: un manejador por estado
+maquina = MaquinaEstados(estado_inicial="inicio")
+_turno_actual = threading.local()
+
+@maquina.antes
+def _iniciar_medicion(conversation_state, message):
+    _turno_actual.inicio = time.perf_counter()
+    _turno_actual.contadores = tuple(conversation_state[campo] for campo in CONTADORES_CONVERSACION)
+
+@maquina.despues
+def _medir_turno(conversation_state, message, turno, estado_anterior):
+    metricas.turnos.observar(time.perf_counter() - _turno_actual.inicio, estado=estado_anterior)
+    metricas.transiciones.inc(origen=estado_anterior, destino=conversation_state["estado"])
+    metricas.resultados_turno.inc(estado=estado_anterior, exitosa=str(turno.es_exitosa).lower())
+
+@maquina.despues
+def _acumular_analitica(conversation_state, message, turno, estado_anterior):
+    # Los contadores de la conversación se suman a los del día (el estado expira con la conversación)
+    analitica.registrar_turno(_turno_actual.contadores, conversation_state, estado_anterior)
+
+@maquina.despues
+def _registrar_turno(conversation_state, message, turno, estado_anterior):
+    mensaje_registro = message if turno.mensaje_registro is None else turno.mensaje_registro
+    usuario_id = conversation_state["usuario_id"]
+    # Con respuestas incrementales se registra cuando el texto completo ya se envió
+    turno.cuando_complete(lambda t: registrar_interaccion(usuario_id, mensaje_registro, t.respuesta, t.es_exitosa))
+
+@maquina.despues
+def _persistir_estado(conversation_state, message, turno, estado_anterior):
+    almacen = obtener_almacen_estados()
+    with medir('estado_guardado'):
+        if turno.finalizar:
+            almacen.eliminar(conversation_state.id)  # Eliminar el estado al finalizar
+        else:
+            almacen.guardar(conversation_state)  # Solo se escriben los campos que cambiaron
+
+# Función para procesar un mensaje de cualquier canal; el estado se identifica solo por conversacion_id
+def procesar_mensaje(conversacion_id, message):
+    """Ejecuta un turno y devuelve el Turno; si turno.flujo no es None la respuesta se puede enviar por fragmentos.
+
+    Los turnos de una misma conversación se serializan, así que un canal puede reintentar o
+    enviar mensajes seguidos sin perder actualizaciones del estado.
+    """
+    almacen = obtener_almacen_estados()
+    with almacen.bloquear(conversacion_id):
+        with medir('estado_carga'):
+            conversation_state = almacen.cargar(conversacion_id) or nuevo_estado_conversacion(conversacion_id)
+        return maquina.despachar(conversation_state, message)
+
+# Función para terminar una conversación sin tocar el resto de la sesión (p. ej. el login)
+def terminar_conversacion(conversacion_id):
+    obtener_almacen_estados().eliminar(conversacion_id)
+
+# Adaptador para el widget web: la sesión de Flask solo guarda el identificador de la conversación
+def _conversacion_de_la_sesion():
+    conversacion_id = session.get('conversacion_id')
+    if conversacion_id is None:
+        conversacion_id = session['conversacion_id'] = uuid.uuid4().hex
+    return conversacion_id
+
+def terminar_conversacion_de_la_sesion():
+    conversacion_id = session.pop('conversacion_id', None)
+    if conversacion_id is not None:
+        terminar_conversacion(conversacion_id)
 
 # Función para manejar los mensajes del usuario
-# Manejo del estado de la conversación
 def handle_message(message):
-    global conversation_state
-    conversation_state = session.get('conversation_state', {
-        "usuario_id": None,
-        "vehiculo_id": None,
-        "nombre_completo": None,
-        "email": None,
-        "telefono": None,
-        "direccion": None,
-        "pais": None,
-        "fecha_nacimiento": None,
-        "genero": None,
-        "problema": None,
-        "servicio_id": None,
-        "fecha_reserva": None,
-        "estado": "inicio",
-        "consultas_iniciadas": 0,
-        "solicitudes_atendidas": 0,
-        "conversiones_realizadas": 0,
-        "servicio_principal": None,
-        "servicio_precio": None,
-        "tiempo_inicio_registro": None,
-        "tiempo_inicio_servicio": None,
-        "password": None,
-        "password_confirmacion": None
-    })
-
-    servicios = cargar_servicios()
-    problemas_servicios = cargar_problemas_servicios()
-
-    es_exitosa = False
-    UMBRAL_SIMILITUD = 0.2
-
-    if conversation_state["estado"] == "inicio" and message.strip() == '':
-        respuesta_bot = "¡Hola! 👋 **Soy tu asistente para la reserva de servicios automotrices.** 🚗 ¿Cómo te puedo ayudar hoy?"
-        es_exitosa = True
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    if conversation_state["estado"] == "inicio":
-        conversation_state["estado"] = "solicitar_email"
-        conversation_state["consultas_iniciadas"] += 1
-        conversation_state["tiempo_inicio_registro"] = datetime.now()
-        respuesta_bot = "Por favor, proporcióname tu correo electrónico. 📧"
-        es_exitosa = True
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_email":
-        email = message.strip()
-        if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
-            respuesta_bot = "❌ **Por favor, proporciona un correo electrónico válido.**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        conversation_state["email"] = email
-        usuario = Usuario.query.filter_by(email=email).first()
-        if usuario:
-            conversation_state["estado"] = "reservar_servicio"
-            conversation_state["usuario_id"] = usuario.id
-            vehiculo = Vehiculo.query.filter_by(usuario_id=usuario.id).first()
-            if vehiculo:
-                conversation_state["vehiculo_id"] = vehiculo.id
-            else:
-                respuesta_bot = "**No tienes un vehículo registrado.** 🚗 Por favor, registra tu vehículo primero."
-                conversation_state["estado"] = "solicitar_marca"
-                registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-                session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-                return respuesta_bot  # Devuelve cadena de texto
-            respuesta_bot = f"¡Hola de nuevo, **{usuario.nombre}!** 👋 ¿Qué servicio deseas reservar hoy o cuéntame qué problema tiene tu auto?"
-            es_exitosa = True
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
+    return procesar_mensaje(_conversacion_de_la_sesion(), message).completar()  # Devuelve cadena de texto
+
+# Igual que handle_message, pero devuelve el Turno: si turno.flujo no es None la respuesta se puede enviar por fragmentos
+def handle_message_stream(message):
+    return procesar_mensaje(_conversacion_de_la_sesion(), message)
+
+@maquina.estado("inicio", transiciones=("solicitar_email",))
+def _inicio(conversation_state, message):
+    if message.strip() == '':
+        return Turno("¡Hola! 👋 **Soy tu asistente para la reserva de servicios automotrices.** 🚗 ¿Cómo te puedo ayudar hoy?", es_exitosa=True)
+    conversation_state["estado"] = "solicitar_email"
+    conversation_state["consultas_iniciadas"] += 1
+    conversation_state["tiempo_inicio_registro"] = datetime.now()
+    return Turno("Por favor, proporcióname tu correo electrónico. 📧", es_exitosa=True)
+
+@maquina.estado("solicitar_email", transiciones=("reservar_servicio", "solicitar_marca", "solicitar_nombre"))
+def _solicitar_email(conversation_state, message):
+    email = message.strip()
+    if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+        return Turno("❌ **Por favor, proporciona un correo electrónico válido.**")
+    conversation_state["email"] = email
+    usuario = Usuario.query.filter_by(email=email).first()
+    if usuario:
+        conversation_state["estado"] = "reservar_servicio"
+        conversation_state["usuario_id"] = usuario.id
+        vehiculo = Vehiculo.query.filter_by(usuario_id=usuario.id).first()
+        if vehiculo:
+            conversation_state["vehiculo_id"] = vehiculo.id
         else:
-            conversation_state["estado"] = "solicitar_nombre"
-            respuesta_bot = f"**¡Encantado de conocerte!** 😊 Parece que eres un cliente nuevo. Por favor, dime tu nombre completo y apellido."
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_nombre":
-        conversation_state["nombre_completo"] = message.strip()
-        conversation_state["estado"] = "solicitar_telefono"
-        respuesta_bot = f"Gracias, **{conversation_state['nombre_completo']}** 🙏. Ahora, ¿puedes proporcionarme tu número de teléfono? 📞"
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_telefono":
-        telefono = message.strip()
-        if not re.match(r"^\d{9}$", telefono):
-            respuesta_bot = "❌ **El número de teléfono debe tener 9 dígitos.** Por favor, proporciona un número de teléfono válido."
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        conversation_state["telefono"] = telefono
-        conversation_state["estado"] = "solicitar_direccion"
-        respuesta_bot = f"**Excelente.** 🏡 ¿Cuál es la dirección de tu domicilio?"
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_direccion":
-        conversation_state["direccion"] = message.strip()
-        conversation_state["estado"] = "solicitar_pais"
-        respuesta_bot = f"**Genial.** 🌍 ¿De qué país eres?"
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_pais":
-        conversation_state["pais"] = message.strip()
-        conversation_state["estado"] = "solicitar_fecha_nacimiento"
-        respuesta_bot = f"**Perfecto.** 🎂 ¿Cuál es tu fecha de nacimiento? (formato: AAAA-MM-DD)"
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_fecha_nacimiento":
-        fecha_nacimiento = message.strip()
-        try:
-            datetime.strptime(fecha_nacimiento, '%Y-%m-%d')
-            conversation_state["fecha_nacimiento"] = fecha_nacimiento
-            conversation_state["estado"] = "solicitar_genero"
-            respuesta_bot = f"Gracias. 🙏 ¿Cuál es tu género? (F para Femenino, M para Masculino, Otro)"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        except ValueError:
-            respuesta_bot = "❌ **Formato de fecha incorrecto.** Por favor, proporciona tu fecha de nacimiento en el formato AAAA-MM-DD."
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_genero":
-        genero = message.strip().upper()
-        if genero in ['F', 'M', 'OTRO']:
-            conversation_state["genero"] = genero
             conversation_state["estado"] = "solicitar_marca"
-            respuesta_bot = f"Gracias. 🚗 **¿Cuál es la marca de tu vehículo?**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        else:
-            respuesta_bot = "❌ **Por favor, elige una opción válida:** F para Femenino, M para Masculino, Otro."
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_marca":
-        conversation_state["marca"] = message.strip()
-        conversation_state["estado"] = "solicitar_modelo"
-        respuesta_bot = f"**Ok, ahora dime.** 🚗 **¿Cuál es el modelo de tu vehículo?**"
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_modelo":
-        conversation_state["modelo"] = message.strip()
-        conversation_state["estado"] = "solicitar_año"
-        respuesta_bot = f"**Está bien.** 🗓️ **¿Cuál es el año de tu vehículo?**"
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_año":
-        try:
-            conversation_state["año"] = int(message.strip())
-            if conversation_state["año"] > datetime.now().year:
-                respuesta_bot = "❌ **El año del vehículo no puede ser en el futuro.** Por favor, proporciona un año válido."
-                registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-                session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-                return respuesta_bot  # Devuelve cadena de texto
-            nombre, apellido = conversation_state["nombre_completo"].split(" ", 1) if " " in conversation_state["nombre_completo"] else (conversation_state["nombre_completo"], "")
-            conversation_state["estado"] = "solicitar_password"
-            respuesta_bot = "🔒 **Por favor, proporciona una contraseña para tu cuenta.**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        except ValueError:
-            respuesta_bot = "❌ **Por favor, proporciona un año válido.**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_password":
-        conversation_state["password"] = message.strip()
-        conversation_state["estado"] = "confirmar_password"
-        respuesta_bot = "🔒 **Por favor, confirma tu contraseña.**"
-        registrar_interaccion(conversation_state["usuario_id"], '********', respuesta_bot, es_exitosa)
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "confirmar_password":
-        conversation_state["password_confirmacion"] = message.strip()
-        if conversation_state["password"] != conversation_state["password_confirmacion"]:
-            conversation_state["estado"] = "solicitar_password"
-            respuesta_bot = "❌ **Las contraseñas no coinciden.** Por favor, proporciona una contraseña para tu cuenta."
-            registrar_interaccion(conversation_state["usuario_id"], '********', respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-
-        nombre, apellido = conversation_state["nombre_completo"].split(" ", 1) if " " in conversation_state["nombre_completo"] else (conversation_state["nombre_completo"], "")
-        usuario_data = {
-            'nombre': nombre,
-            'apellido': apellido,
-            'email': conversation_state["email"],
-            'telefono': conversation_state["telefono"],
-            'direccion': conversation_state["direccion"],
-            'pais': conversation_state["pais"],
-            'fecha_nacimiento': conversation_state["fecha_nacimiento"],
-            'genero': conversation_state["genero"],
-            'password': conversation_state["password"],
-            'estado': 'inicio'
-        }
-        response_usuario = requests.post(f'{RESERVAS_API_URL}/usuarios', json=usuario_data)
-
-        if response_usuario.status_code == 200:
-            conversation_state["usuario_id"] = response_usuario.json()['usuario']
-            vehiculo_data = {
-                'usuario_id': conversation_state["usuario_id"],
-                'marca': conversation_state["marca"],
-                'modelo': conversation_state["modelo"],
-                'año': conversation_state["año"]
-            }
-            response_vehiculo = requests.post(f'{RESERVAS_API_URL}/vehiculos', json=vehiculo_data)
-            if response_vehiculo.status_code == 200:
-                conversation_state["vehiculo_id"] = response_vehiculo.json()['vehiculo']
-                conversation_state["estado"] = "reservar_servicio"
-                tiempo_fin_registro = datetime.now()
-                nuevo_registro = RegistroUsuario(
-                    usuario_id=conversation_state["usuario_id"],
-                    tiempo_inicio=conversation_state["tiempo_inicio_registro"],
-                    tiempo_fin=tiempo_fin_registro
-                )
-                db.session.add(nuevo_registro)
-                db.session.commit()
-                respuesta_bot = f"**Muchas gracias {conversation_state['nombre_completo']}** 🙌. **Hemos registrado tu información. Cuéntame,** **¿Qué servicio deseas reservar hoy o cuéntame qué problema tiene tu auto?** 🚗"
-                es_exitosa = True
-                registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-                session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-                return respuesta_bot  # Devuelve cadena de texto
-            else:
-                respuesta_bot = "❌ **Hubo un error al registrar tu vehículo.** Por favor, intenta de nuevo."
-                registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-                session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-                return respuesta_bot  # Devuelve cadena de texto
+            return Turno("**No tienes un vehículo registrado.** 🚗 Por favor, registra tu vehículo primero.")
+        return Turno(f"¡Hola de nuevo, **{usuario.nombre}!** 👋 ¿Qué servicio deseas reservar hoy o cuéntame qué problema tiene tu auto?", es_exitosa=True)
+    conversation_state["estado"] = "solicitar_nombre"
+    return Turno("**¡Encantado de conocerte!** 😊 Parece que eres un cliente nuevo. Por favor, dime tu nombre completo y apellido.")
+
+@maquina.estado("solicitar_nombre", transiciones=("solicitar_telefono",))
+def _solicitar_nombre(conversation_state, message):
+    conversation_state["nombre_completo"] = message.strip()
+    conversation_state["estado"] = "solicitar_telefono"
+    return Turno(f"Gracias, **{conversation_state['nombre_completo']}** 🙏. Ahora, ¿puedes proporcionarme tu número de teléfono? 📞")
+
+@maquina.estado("solicitar_telefono", transiciones=("solicitar_direccion",))
+def _solicitar_telefono(conversation_state, message):
+    telefono = message.strip()
+    if not re.match(r"^\d{9}$", telefono):
+        return Turno("❌ **El número de teléfono debe tener 9 dígitos.** Por favor, proporciona un número de teléfono válido.")
+    conversation_state["telefono"] = telefono
+    conversation_state["estado"] = "solicitar_direccion"
+    return Turno("**Excelente.** 🏡 ¿Cuál es la dirección de tu domicilio?")
+
+@maquina.estado("solicitar_direccion", transiciones=("solicitar_pais",))
+def _solicitar_direccion(conversation_state, message):
+    conversation_state["direccion"] = message.strip()
+    conversation_state["estado"] = "solicitar_pais"
+    return Turno("**Genial.** 🌍 ¿De qué país eres?")
+
+@maquina.estado("solicitar_pais", transiciones=("solicitar_fecha_nacimiento",))
+def _solicitar_pais(conversation_state, message):
+    conversation_state["pais"] = message.strip()
+    conversation_state["estado"] = "solicitar_fecha_nacimiento"
+    return Turno("**Perfecto.** 🎂 ¿Cuál es tu fecha de nacimiento? (formato: AAAA-MM-DD)")
+
+@maquina.estado("solicitar_fecha_nacimiento", transiciones=("solicitar_genero",))
+def _solicitar_fecha_nacimiento(conversation_state, message):
+    fecha_nacimiento = message.strip()
+    try:
+        datetime.strptime(fecha_nacimiento, '%Y-%m-%d')
+    except ValueError:
+        return Turno("❌ **Formato de fecha incorrecto.** Por favor, proporciona tu fecha de nacimiento en el formato AAAA-MM-DD.")
+    conversation_state["fecha_nacimiento"] = fecha_nacimiento
+    conversation_state["estado"] = "solicitar_genero"
+    return Turno("Gracias. 🙏 ¿Cuál es tu género? (F para Femenino, M para Masculino, Otro)")
+
+@maquina.estado("solicitar_genero", transiciones=("solicitar_marca",))
+def _solicitar_genero(conversation_state, message):
+    genero = message.strip().upper()
+    if genero not in ['F', 'M', 'OTRO']:
+        return Turno("❌ **Por favor, elige una opción válida:** F para Femenino, M para Masculino, Otro.")
+    conversation_state["genero"] = genero
+    conversation_state["estado"] = "solicitar_marca"
+    return Turno("Gracias. 🚗 **¿Cuál es la marca de tu vehículo?**")
+
+@maquina.estado("solicitar_marca", transiciones=("solicitar_modelo",))
+def _solicitar_marca(conversation_state, message):
+    conversation_state["marca"] = message.strip()
+    conversation_state["estado"] = "solicitar_modelo"
+    return Turno("**Ok, ahora dime.** 🚗 **¿Cuál es el modelo de tu vehículo?**")
+
+@maquina.estado("solicitar_modelo", transiciones=("solicitar_año",))
+def _solicitar_modelo(conversation_state, message):
+    conversation_state["modelo"] = message.strip()
+    conversation_state["estado"] = "solicitar_año"
+    return Turno("**Está bien.** 🗓️ **¿Cuál es el año de tu vehículo?**")
+
+@maquina.estado("solicitar_año", transiciones=("solicitar_password",))
+def _solicitar_anio(conversation_state, message):
+    try:
+        conversation_state["año"] = int(message.strip())
+    except ValueError:
+        return Turno("❌ **Por favor, proporciona un año válido.**")
+    if conversation_state["año"] > datetime.now().year:
+        return Turno("❌ **El año del vehículo no puede ser en el futuro.** Por favor, proporciona un año válido.")
+    conversation_state["estado"] = "solicitar_password"
+    return Turno("🔒 **Por favor, proporciona una contraseña para tu cuenta.**")
+
+@maquina.estado("solicitar_password", transiciones=("confirmar_password",))
+def _solicitar_password(conversation_state, message):
+    conversation_state["password"] = message.strip()
+    conversation_state["estado"] = "confirmar_password"
+    return Turno("🔒 **Por favor, confirma tu contraseña.**", mensaje_registro='********')
+
+@maquina.estado("confirmar_password", transiciones=("solicitar_password", "reservar_servicio"))
+def _confirmar_password(conversation_state, message):
+    conversation_state["password_confirmacion"] = message.strip()
+    if conversation_state["password"] != conversation_state["password_confirmacion"]:
+        # Las contraseñas en claro no se dejan en el almacén de estados (Redis)
+        conversation_state["password"] = None
+        conversation_state["password_confirmacion"] = None
+        conversation_state["estado"] = "solicitar_password"
+        return Turno("❌ **Las contraseñas no coinciden.** Por favor, proporciona una contraseña para tu cuenta.", mensaje_registro='********')
+
+    nombre, apellido = conversation_state["nombre_completo"].split(" ", 1) if " " in conversation_state["nombre_completo"] else (conversation_state["nombre_completo"], "")
+    usuario_data = {
+        'nombre': nombre,
+        'apellido': apellido,
+        'email': conversation_state["email"],
+        'telefono': conversation_state["telefono"],
+        'direccion': conversation_state["direccion"],
+        'pais': conversation_state["pais"],
+        'fecha_nacimiento': conversation_state["fecha_nacimiento"],
+        'genero': conversation_state["genero"],
+        'password': conversation_state["password"],
+        'estado': 'inicio'
+    }
+    vehiculo_data = {
+        'marca': conversation_state["marca"],
+        'modelo': conversation_state["modelo"],
+        'año': conversation_state["año"]
+    }
+    try:
+        with medir('registro_cliente'):
+            usuario_id, vehiculo_id = obtener_cliente_reservas().registrar_cliente(
+                usuario_data, vehiculo_data, conversation_state["tiempo_inicio_registro"])
+    except ErrorRegistro as e:
+        if e.etapa == 'vehiculo':
+            return Turno("❌ **Hubo un error al registrar tu vehículo.** Por favor, intenta de nuevo.")
+        return Turno("❌ **Hubo un error al registrar tu información.** Por favor, intenta de nuevo.")
+
+    conversation_state["usuario_id"] = usuario_id
+    conversation_state["vehiculo_id"] = vehiculo_id
+    conversation_state["password"] = None
+    conversation_state["password_confirmacion"] = None
+    conversation_state["estado"] = "reservar_servicio"
+    return Turno(f"**Muchas gracias {conversation_state['nombre_completo']}** 🙌. **Hemos registrado tu información. Cuéntame,** **¿Qué servicio deseas reservar hoy o cuéntame qué problema tiene tu auto?** 🚗", es_exitosa=True)
+
+@maquina.estado("reservar_servicio", transiciones=("confirmar_servicio",))
+def _reservar_servicio(conversation_state, message):
+    consulta = message.strip().lower()
+    conversation_state["problema"] = consulta
+    conversation_state["tiempo_inicio_servicio"] = datetime.now()
+
+    with medir('clasificacion_tfidf'):
+        problema, servicio_recomendado, similitud_problema = encontrar_problema(indice_problemas, consulta, umbral_similitud=UMBRAL_SIMILITUD)
+        servicio_principal, similitud_servicio = encontrar_servicio(indice_servicios, consulta, umbral_similitud=UMBRAL_SIMILITUD)
+
+    if similitud_problema > similitud_servicio and similitud_problema >= UMBRAL_SIMILITUD:
+        servicio = Servicio.query.filter_by(nombre=servicio_recomendado).first()
+        if servicio:
+            conversation_state["servicio_principal"] = servicio.nombre
+            conversation_state["servicio_id"] = servicio.id
+            conversation_state["servicio_precio"] = servicio.precio
+            respuesta_bot = f"**Posible problema puede ser** '{servicio.nombre}' 🔧. **¿Deseas 🚗Reservar este servicio,🛠️ Reservar otro servicio,💰 Consultar precio 🚗o tienes una🔍 CONSULTA ESPECIFICA🔍 de servicios o problemas automotrices?** 🚗"
         else:
-            respuesta_bot = "❌ **Hubo un error al registrar tu información.** Por favor, intenta de nuevo."
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "reservar_servicio":
-        consulta = message.strip().lower()
-        conversation_state["problema"] = consulta
-        conversation_state["tiempo_inicio_servicio"] = datetime.now()
-
-        problema, servicio_recomendado, similitud_problema = encontrar_problema(problemas_servicios, consulta, umbral_similitud=UMBRAL_SIMILITUD)
-        servicio_principal, similitud_servicio = encontrar_servicio(servicios, consulta, umbral_similitud=UMBRAL_SIMILITUD)
-
-        if similitud_problema > similitud_servicio and similitud_problema >= UMBRAL_SIMILITUD:
-            servicio = Servicio.query.filter_by(nombre=servicio_recomendado).first()
-            if servicio:
-                conversation_state["servicio_principal"] = servicio.nombre
-                conversation_state["servicio_id"] = servicio.id
-                conversation_state["servicio_precio"] = servicio.precio
-                respuesta_bot = f"**Posible problema puede ser** '{servicio.nombre}' 🔧. **¿Deseas 🚗Reservar este servicio,🛠️ Reservar otro servicio,💰 Consultar precio 🚗o tienes una🔍 CONSULTA ESPECIFICA🔍 de servicios o problemas automotrices?** 🚗"
-            else:
-                respuesta_bot = "❌ **El servicio que has solicitado no está disponible.** Por favor, elige 🛠️Reservar otro servicio."
-        elif similitud_servicio >= UMBRAL_SIMILITUD:
-            servicio = Servicio.query.filter_by(nombre=servicio_principal).first()
-            if servicio:
-                conversation_state["servicio_principal"] = servicio_principal
-                conversation_state["servicio_id"] = servicio.id
-                conversation_state["servicio_precio"] = servicio.precio
-                respuesta_bot = f"**Sí, tenemos el servicio de** '{servicio_principal}' 🔧. **¿Deseas 🚗 Reservar este servicio, 🛠️ Reservar otro servicio,💰 consultar precio 🚗o tienes una 🔍CONSULTA ESPECIFICA 🔍 de servicios o problemas automotrices?** 🚗"
-            else:
-                respuesta_bot = "❌ **El servicio que has solicitado no está disponible.** Por favor, elige 🛠️ Reservar otro servicio."
+            respuesta_bot = "❌ **El servicio que has solicitado no está disponible.** Por favor, elige 🛠️Reservar otro servicio."
+    elif similitud_servicio >= UMBRAL_SIMILITUD:
+        servicio = Servicio.query.filter_by(nombre=servicio_principal).first()
+        if servicio:
+            conversation_state["servicio_principal"] = servicio_principal
+            conversation_state["servicio_id"] = servicio.id
+            conversation_state["servicio_precio"] = servicio.precio
+            respuesta_bot = f"**Sí, tenemos el servicio de** '{servicio_principal}' 🔧. **¿Deseas 🚗 Reservar este servicio, 🛠️ Reservar otro servicio,💰 consultar precio 🚗o tienes una 🔍CONSULTA ESPECIFICA 🔍 de servicios o problemas automotrices?** 🚗"
         else:
             respuesta_bot = "❌ **El servicio que has solicitado no está disponible.** Por favor, elige 🛠️ Reservar otro servicio."
+    else:
+        respuesta_bot = "❌ **El servicio que has solicitado no está disponible.** Por favor, elige 🛠️ Reservar otro servicio."
+
+    conversation_state["estado"] = "confirmar_servicio"
+    return Turno(respuesta_bot)
+
+# Las respuestas cortas se clasifican con el enrutador de intenciones (datos/intenciones.txt)
+@maquina.estado("confirmar_servicio", transiciones=("solicitar_fecha", "reservar_servicio", "interactuar_con_openai"))
+def _confirmar_servicio(conversation_state, message):
+    intencion = enrutador_intenciones.clasificar(message)
+    if intencion == PRECIO:
+        return Turno(f"💰 **El servicio** '{conversation_state['servicio_principal']}' **tiene un costo de** {conversation_state['servicio_precio']} **soles. ¿Deseas 🚗 Reservar este servicio, 🛠️Reservar otro servicio🚗 o tienes una 🔍CONSULTA ESPECIFICA 🔍de servicios o problemas automotrices?**")
+    elif intencion == CONFIRMAR:
+        conversation_state["estado"] = "solicitar_fecha"
+        return Turno("📅 **Por favor, proporciona la fecha para tu reserva (AAAA-MM-DD).**")
+    elif intencion == OTRO_SERVICIO:
+        conversation_state["estado"] = "reservar_servicio"
+        return Turno("🛠️ **¿Cuál es el otro servicio que deseas reservar?**")
+    elif intencion == CONSULTA:
+        conversation_state["estado"] = "interactuar_con_openai"
+        return Turno("🔍 **¿Preguntame tu consulta específica,💡que deseas saber sobre sobre problemas y servicios automotriz🛠️?**")
+    else:
+        return Turno("❌ **No entiendo tu respuesta. Por favor, elige una opción:🔧 Reservar el servicio,🛠️ Reservar otro servicio, o 🔍CONSULTA ESPECIFICA 🔍.**")
+
+@maquina.estado("interactuar_con_openai", transiciones=("confirmar_servicio",))
+def _interactuar_con_openai(conversation_state, message):
+    consulta = message.strip().lower()
+    conversation_state["estado"] = "confirmar_servicio"
+    conversation_state["solicitudes_atendidas"] += 1
+    cierre = f". ¿💡Hay algo más que quieras saber🔍CONSULTA ESPECIFICA 🔍 o deseas proceder con 🚗Reservar el servicio🛠️ '{conversation_state['servicio_principal']}'? 🚗"
+    return Turno(None, flujo=RespuestaLLM(consulta, prefijo="ℹ️ ", sufijo=cierre))
+
+@maquina.estado("solicitar_fecha", transiciones=("solicitar_hora",))
+def _solicitar_fecha(conversation_state, message):
+    try:
+        conversation_state["fecha_reserva"] = datetime.strptime(message.strip(), '%Y-%m-%d').date()
+    except ValueError:
+        return Turno("❌ **Formato de fecha incorrecto.** Por favor, proporciona la fecha para tu reserva (AAAA-MM-DD).")
+    # Los slots los genera el planificador (aprovisionar-slots); el chat solo consulta la disponibilidad
+    with medir('disponibilidad'):
+        horas_libres = horarios_libres(conversation_state["servicio_id"], conversation_state["fecha_reserva"])
+    if not horas_libres:
+        return Turno("❌ **Lo siento, no hay slots disponibles para el servicio en la fecha solicitada.** Por favor, elige otra fecha.")
+    horarios_disponibles = [hora.strftime('%H:%M') for hora in horas_libres]
+    conversation_state["estado"] = "solicitar_hora"
+    return Turno(f"🕒 **Para la fecha** {conversation_state['fecha_reserva']}, **tenemos estos horarios disponibles:** {', '.join(horarios_disponibles)}. **Por favor, selecciona uno de estos horarios (HH:MM).**")
+
+@maquina.estado("solicitar_hora", transiciones=("despedida",))
+def _solicitar_hora(conversation_state, message):
+    hora_reserva = message.strip()
+    try:
+        fecha_hora_reserva = datetime.strptime(f"{conversation_state['fecha_reserva']} {hora_reserva}", '%Y-%m-%d %H:%M')
+    except ValueError:
+        return Turno("❌ **Formato de hora incorrecto.** Por favor, proporciona la hora para tu reserva (HH:MM).")
+    slot = Slot.query.filter_by(servicio_id=conversation_state["servicio_id"], fecha=conversation_state["fecha_reserva"], reservado=False, hora_inicio=fecha_hora_reserva.time()).first()
+    if not slot:
+        return Turno("❌ **Lo siento, no hay slots disponibles para el servicio en la fecha y hora solicitada.** Por favor, elige otra fecha u hora.")
+
+    reserva_data = {
+        'usuario_id': conversation_state["usuario_id"],
+        'vehiculo_id': conversation_state["vehiculo_id"],
+        'servicio_id': conversation_state["servicio_id"],
+        'slot_id': slot.id,
+        'problema': conversation_state["problema"],
+        'fecha_hora': fecha_hora_reserva
+    }
+    try:
+        with medir('reserva'):
+            codigo_reserva = obtener_cliente_reservas().reservar(reserva_data, conversation_state["tiempo_inicio_servicio"])
+    except ConflictoReserva:
+        return Turno("❌ **Lo siento, ese horario acaba de ser reservado por otro cliente.** Por favor, elige otra hora.")
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error al registrar la reserva: {e}")
+        return Turno("❌ **Hubo un error al registrar tu reserva.** Por favor, intenta de nuevo.")
+
+    servicio_principal = Servicio.query.get(conversation_state["servicio_id"]).nombre
+    respuesta_bot = f"**Reserva creada exitosamente con código** {codigo_reserva} ✅ **para el servicio** '{servicio_principal}' **el** {fecha_hora_reserva.strftime('%Y-%m-%d a las %H:%M')}. **¿Necesitas algo más?** 😊"
+
+    # Encolar correo de confirmación (lo envía el trabajador de notificaciones)
+    with medir('correo_encolado'):
+        encolar_correo(
+            destinatario=conversation_state["email"],
+            asunto="Confirmación de Reserva de Servicio",
+            contenido_html=f"""
+            <p>Estimado/a {conversation_state['nombre_completo']},</p>
+            <p>Tu reserva ha sido creada exitosamente con el código {codigo_reserva} para el servicio '{servicio_principal}' el {fecha_hora_reserva.strftime('%Y-%m-%d a las %H:%M')}.</p>
+            <p>Gracias por confiar en nosotros.</p>
+            <p>Saludos,</p>
+            <p>Tu Centro de Servicios Automotriz</p>
+            """
+        )
 
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        conversation_state["estado"] = "confirmar_servicio"
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "confirmar_servicio":
-        confirmacion = message.strip().lower()
-        if "cuanto cuesta" in confirmacion or "costo" in confirmacion or "precio" in confirmacion:
-            respuesta_bot = f"💰 **El servicio** '{conversation_state['servicio_principal']}' **tiene un costo de** {conversation_state['servicio_precio']} **soles. ¿Deseas 🚗 Reservar este servicio, 🛠️Reservar otro servicio🚗 o tienes una 🔍CONSULTA ESPECIFICA 🔍de servicios o problemas automotrices?**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        elif confirmacion in ['si', 'ok', 'por supuesto', 'reservar el servicio', 'reservar', 'sí.', 'si.', 'esta bien', ' si esta bien', 'deseo proceder con la reserva de servicio', 'claro', 'reservar', 'procedo con la reserva', 'claro', 'reservar este servicio', 'deseo reservar este servicio']:
-            conversation_state["estado"] = "solicitar_fecha"
-            respuesta_bot = "📅 **Por favor, proporciona la fecha para tu reserva (AAAA-MM-DD).**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        elif "reservar otro servicio" in confirmacion or "Reservar otro servicio" in confirmacion or "nuevo servicio" in confirmacion:
-            conversation_state["estado"] = "reservar_servicio"
-            respuesta_bot = "🛠️ **¿Cuál es el otro servicio que deseas reservar?**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        elif "consulta especifica" in confirmacion:
-            conversation_state["estado"] = "interactuar_con_openai"
-            respuesta_bot = "🔍 **¿Preguntame tu consulta específica,💡que deseas saber sobre sobre problemas y servicios automotriz🛠️?**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        else:
-            respuesta_bot = "❌ **No entiendo tu respuesta. Por favor, elige una opción:🔧 Reservar el servicio,🛠️ Reservar otro servicio, o 🔍CONSULTA ESPECIFICA 🔍.**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "interactuar_con_openai":
-        consulta = message.strip().lower()
-        respuesta_openai = interactuar_con_openai(consulta)
-        respuesta_bot = f"ℹ️ {respuesta_openai}. ¿💡Hay algo más que quieras saber🔍CONSULTA ESPECIFICA 🔍 o deseas proceder con 🚗Reservar el servicio🛠️ '{conversation_state['servicio_principal']}'? 🚗"
-        registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-        conversation_state["estado"] = "confirmar_servicio"
-        session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-        return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_fecha":
-        try:
-            conversation_state["fecha_reserva"] = datetime.strptime(message.strip(), '%Y-%m-%d').date()
-            slots_disponibles = Slot.query.filter_by(fecha=conversation_state["fecha_reserva"], reservado=False).all()
-            if not slots_disponibles:
-                generar_slots(conversation_state["servicio_id"], str(conversation_state["fecha_reserva"]), str(conversation_state["fecha_reserva"]))
-                slots_disponibles = Slot.query.filter_by(fecha=conversation_state["fecha_reserva"], reservado=False).all()
-                if not slots_disponibles:
-                    respuesta_bot = "❌ **Lo siento, no hay slots disponibles para el servicio en la fecha solicitada.** Por favor, elige otra fecha."
-                    registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-                    session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-                    return respuesta_bot  # Devuelve cadena de texto
-            horarios_disponibles = [slot.hora_inicio.strftime('%H:%M') for slot in slots_disponibles]
-            conversation_state["estado"] = "solicitar_hora"
-            respuesta_bot = f"🕒 **Para la fecha** {conversation_state['fecha_reserva']}, **tenemos estos horarios disponibles:** {', '.join(horarios_disponibles)}. **Por favor, selecciona uno de estos horarios (HH:MM).**"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-        except ValueError:
-            respuesta_bot = "❌ **Formato de fecha incorrecto.** Por favor, proporciona la fecha para tu reserva (AAAA-MM-DD)."
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot  # Devuelve cadena de texto
-
-    elif conversation_state["estado"] == "solicitar_hora":
-        hora_reserva = message.strip()
-        try:
-            fecha_hora_reserva = datetime.strptime(f"{conversation_state['fecha_reserva']} {hora_reserva}", '%Y-%m-%d %H:%M')
-            slot = Slot.query.filter_by(fecha=conversation_state["fecha_reserva"], hora_inicio=fecha_hora_reserva.time(), reservado=False).first()
-            if not slot:
-                respuesta_bot = "❌ **Lo siento, no hay slots disponibles para el servicio en la fecha y hora solicitada.** Por favor, elige otra fecha u hora."
-                registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-                session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-                return respuesta_bot
-
-            reserva_data = {
-                'usuario_id': conversation_state["usuario_id"],
-                'vehiculo_id': conversation_state["vehiculo_id"],
-                'servicio_id': conversation_state["servicio_id"],
-                'slot_id': slot.id,
-                'problema': conversation_state["problema"],
-                'fecha_hora': fecha_hora_reserva.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            response = requests.post(f'{RESERVAS_API_URL}/reservas', json=reserva_data)
-
-            if response.status_code == 200:
-                slot.reservado = True
-                db.session.commit()
-                tiempo_fin_servicio = datetime.now()
-                nuevo_registro_servicio = RegistroServicio(
-                    reserva_id=response.json()['reserva'],
-                    tiempo_inicio=conversation_state["tiempo_inicio_servicio"],
-                    tiempo_fin=tiempo_fin_servicio
-                )
-                db.session.add(nuevo_registro_servicio)
-                db.session.commit()
-
-                servicio_principal = Servicio.query.get(conversation_state["servicio_id"]).nombre
-                codigo_reserva = response.json()['reserva']
-                respuesta_bot = f"**Reserva creada exitosamente con código** {codigo_reserva} ✅ **para el servicio** '{servicio_principal}' **el** {fecha_hora_reserva.strftime('%Y-%m-%d a las %H:%M')}. **¿Necesitas algo más?** 😊"
-
-                # Enviar correo de confirmación
-                enviar_correo(
-                    destinatario=conversation_state["email"],
-                    asunto="Confirmación de Reserva de Servicio",
-                    contenido_html=f"""
-                    <p>Estimado/a {conversation_state['nombre_completo']},</p>
-                    <p>Tu reserva ha sido creada exitosamente con el código {codigo_reserva} para el servicio '{servicio_principal}' el {fecha_hora_reserva.strftime('%Y-%m-%d a las %H:%M')}.</p>
-                    <p>Gracias por confiar en nosotros.</p>
-                    <p>Saludos,</p>
-                    <p>Tu Centro de Servicios Automotriz</p>
-                    """
-                )
-
-                es_exitosa = True
-                registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-                conversation_state["estado"] = "despedida"
-                session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-                return respuesta_bot
-            else:
-                respuesta_bot = "❌ **Hubo un error al registrar tu reserva.** Por favor, intenta de nuevo."
-                registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-                session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-                return respuesta_bot
-        except ValueError:
-            respuesta_bot = "❌ **Formato de hora incorrecto.** Por favor, proporciona la hora para tu reserva (HH:MM)."
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-            return respuesta_bot
-
-    elif conversation_state["estado"] == "despedida":
-        if message.strip().lower() in ['no', 'ninguna', 'gracias', 'nada', 'nada gracias', 'nada más', 'no gracias']:
-            respuesta_bot = "**Muchas gracias, no dudes en escribirnos. Estamos para servirte.** 🙌"
-            registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-            session.pop('conversation_state', None)  # Eliminar estado de la sesión al finalizar
-            return respuesta_bot  # Devuelve cadena de texto
-        else:
-           conversation_state["estado"] = "reservar_servicio"
-           respuesta_bot = "🔧 **¿En qué más puedo ayudarte?**"
-           registrar_interaccion(conversation_state["usuario_id"], message, respuesta_bot, es_exitosa)
-           session['conversation_state'] = conversation_state  # Guardar estado en la sesión
-           return respuesta_bot  # Devuelve cadena de texto
+    conversation_state["estado"] = "despedida"
+    conversation_state["conversiones_realizadas"] += 1
+    return Turno(respuesta_bot, es_exitosa=True)
+
+@maquina.estado("despedida", transiciones=("reservar_servicio",))
+def _despedida(conversation_state, message):
+    if enrutador_intenciones.clasificar(message) in (DESPEDIDA, AGRADECER):
+        return Turno("**Muchas gracias, no dudes en escribirnos. Estamos para servirte.** 🙌", finalizar=True)
+    conversation_state["estado"] = "reservar_servicio"
+    return Turno("🔧 **¿En qué más puedo ayudarte?**")
+
+# Validar el grafo de transiciones al cargar el módulo
+_errores_maquina = maquina.verificar()
+if _errores_maquina:
+    raise RuntimeError("Máquina de estados inválida:\n" + "\n".join(_errores_maquina))
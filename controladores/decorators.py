@@ -1,5 +1,8 @@
+import hmac
 from functools import wraps
-from flask import session, redirect, url_for, flash
+from flask import session, redirect, url_for, flash, request, jsonify, current_app
+
+CABECERA_TOKEN = 'X-Api-Token'
 
 def login_required(f):
     @wraps(f)
@@ -18,3 +21,21 @@ def admin_required(f):
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
     return decorated_function
+
+def token_valido(opcion, recibido, app=None):
+    """Compara 'recibido' con el secreto app.config[opcion]; sin secreto configurado no se acepta ninguno."""
+    esperado = (app or current_app).config.get(opcion)
+    if not esperado or not recibido:
+        return False
+    return hmac.compare_digest(recibido.encode('utf-8'), esperado.encode('utf-8'))
+
+def token_requerido(opcion):
+    """Rutas de la API para servicios (gateways, integraciones): exige la cabecera X-Api-Token."""
+    def decorador(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not token_valido(opcion, request.headers.get(CABECERA_TOKEN)):
+                return jsonify({'error': 'Token de API inválido o ausente'}), 401
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorador
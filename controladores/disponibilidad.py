@@ -0,0 +1,108 @@
+from datetime import timedelta
+import redis
+from flask import current_app
+from modelos.models import db, Slot
+from controladores.redis_cliente import obtener_redis
+from controladores.slots import horarios_del_dia
+
+PREFIJO_CLAVE = 'disponibilidad'
+
+
+def _clave(servicio_id, fecha, total_horarios):
+    # El número de horarios del día forma parte de la clave: si cambia Config.HORARIO_* no se leen mapas antiguos
+    return f'{PREFIJO_CLAVE}:{total_horarios}:{servicio_id}:{fecha.isoformat()}'
+
+
+def _clave_generacion(servicio_id, fecha):
+    # Contador que invalidar_disponibilidad incrementa; un mapa calculado antes del cambio no se guarda
+    return f'{PREFIJO_CLAVE}:generacion:{servicio_id}:{fecha.isoformat()}'
+
+
+def _codificar(posiciones_libres, total):
+    # Mismo orden de bits que SETBIT/GETBIT de Redis (bit 0 = bit más significativo del primer byte)
+    mapa = bytearray((total + 7) // 8)
+    for posicion in posiciones_libres:
+        mapa[posicion // 8] |= 0x80 >> (posicion % 8)
+    return bytes(mapa)
+
+
+def _decodificar(mapa, total):
+    return [posicion for posicion in range(total) if mapa[posicion // 8] & (0x80 >> (posicion % 8))]
+
+
+def _consultar_libres(servicio_id, fecha):
+    return [hora for (hora,) in db.session.query(Slot.hora_inicio)
+            .filter(Slot.servicio_id == servicio_id, Slot.fecha == fecha, Slot.reservado.is_(False))
+            .order_by(Slot.hora_inicio)]
+
+
+# Función para obtener los horarios libres de un servicio en una fecha
+def horarios_libres(servicio_id, fecha):
+    """Devuelve las horas de inicio libres, leyendo el mapa de bits de Redis cuando existe."""
+    horarios = [hora_inicio for hora_inicio, _ in horarios_del_dia()]
+    total = len(horarios)
+    cliente = obtener_redis()
+    clave = _clave(servicio_id, fecha, total)
+
+    if cliente is not None:
+        try:
+            mapa = cliente.get(clave)
+            if mapa is not None:
+                return [horarios[posicion] for posicion in _decodificar(mapa, total)]
+        except redis.RedisError as e:
+            current_app.logger.warning(f"No se pudo leer la disponibilidad en Redis: {e}")
+            cliente = None
+
+    if cliente is None:
+        return _consultar_libres(servicio_id, fecha)
+
+    # WATCH sobre la generación del día antes de leer la base: si una reserva la invalida entre
+    # la lectura y el SET, EXEC falla y el mapa (ya desactualizado) se descarta
+    libres = None
+    try:
+        with cliente.pipeline() as pipe:
+            pipe.watch(_clave_generacion(servicio_id, fecha))
+            libres = _consultar_libres(servicio_id, fecha)
+            posiciones = {hora: posicion for posicion, hora in enumerate(horarios)}
+            # Solo se cachea si todos los slots libres caen en la grilla de Config.HORARIO_*
+            if all(hora in posiciones for hora in libres):
+                pipe.multi()
+                pipe.set(clave, _codificar((posiciones[hora] for hora in libres), total),
+                         ex=current_app.config.get('DISPONIBILIDAD_CACHE_TTL', 300))
+                pipe.execute()
+    except redis.WatchError:
+        pass
+    except redis.RedisError as e:
+        current_app.logger.warning(f"No se pudo guardar la disponibilidad en Redis: {e}")
+    return libres if libres is not None else _consultar_libres(servicio_id, fecha)
+
+
+# Función para invalidar la disponibilidad cacheada tras reservar, cancelar o generar slots
+def invalidar_disponibilidad(servicio_id, fecha, fecha_hasta=None):
+    cliente = obtener_redis()
+    if cliente is None:
+        return
+    total = len(horarios_del_dia())
+    servicio_ids = servicio_id if isinstance(servicio_id, (list, tuple, set)) else [servicio_id]
+    claves = []
+    generaciones = []
+    actual = fecha
+    while actual <= (fecha_hasta or fecha):
+        claves.extend(_clave(sid, actual, total) for sid in servicio_ids)
+        generaciones.extend(_clave_generacion(sid, actual) for sid in servicio_ids)
+        actual += timedelta(days=1)
+    try:
+        for inicio in range(0, len(claves), 1000):
+            pipe = cliente.pipeline(transaction=False)
+            pipe.delete(*claves[inicio:inicio + 1000])
+            for generacion in generaciones[inicio:inicio + 1000]:
+                pipe.incr(generacion)
+                pipe.expire(generacion, 86400)
+            pipe.execute()
+    except redis.RedisError as e:
+        current_app.logger.warning(f"No se pudo invalidar la disponibilidad en Redis: {e}")
+
+
+def invalidar_slot(slot):
+    if slot is not None:
+        invalidar_disponibilidad(slot.servicio_id, slot.fecha)
@@ -0,0 +1,145 @@
+"""Enrutador de respuestas cortas del chat (confirmar, despedirse, pedir el precio, ...).
+
+Las frases viven en datos/intenciones.txt. Al cargarlas se normalizan con el mismo
+normalizar_texto que los mensajes y se compilan en un diccionario de frases exactas y una
+sola expresión regular con todas las frases de tipo 'contiene', así que clasificar un
+mensaje cuesta una búsqueda en el diccionario y, como mucho, una pasada de la regex.
+"""
+import os
+import re
+import threading
+from collections import Counter
+from controladores import metricas
+from controladores.indice_intenciones import DATOS_DIR
+from controladores.normalizacion import normalizar_texto
+
+CONFIRMAR = 'confirmar'
+DESPEDIDA = 'despedida'
+AGRADECER = 'agradecer'
+PRECIO = 'precio'
+OTRO_SERVICIO = 'otro_servicio'
+CONSULTA = 'consulta'
+INTENCIONES = frozenset((CONFIRMAR, DESPEDIDA, AGRADECER, PRECIO, OTRO_SERVICIO, CONSULTA))
+SIN_INTENCION = 'ninguna'  # Etiqueta de los mensajes que no coinciden con ninguna frase
+
+MODOS = ('exacta', 'contiene')
+
+
+def cargar_intenciones(ruta):
+    """Lee el archivo de intenciones y devuelve ({frase: intención} exactas, [(frase, intención)] contenidas)."""
+    exactas = {}
+    contenidas = []
+    modo = None
+    try:
+        with open(ruta, 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith('[') and line.endswith(']'):
+                    modo = line[1:-1].strip()
+                    if modo not in MODOS:
+                        print(f"Sección desconocida en intenciones.txt: '{line}'")
+                        modo = None
+                    continue
+                if ':' not in line or modo is None:
+                    print(f"Línea ignorada por formato incorrecto: '{line}'")
+                    continue
+                frase, intencion = line.rsplit(':', 1)
+                frase, intencion = normalizar_texto(frase), intencion.strip()
+                if intencion not in INTENCIONES or not frase:
+                    print(f"Línea ignorada por intención desconocida: '{line}'")
+                    continue
+                if modo == 'exacta':
+                    exactas.setdefault(frase, intencion)  # La primera aparición gana
+                else:
+                    contenidas.append((frase, intencion))
+    except FileNotFoundError:
+        print("El archivo intenciones.txt no fue encontrado.")
+    except Exception as e:
+        print(f"Error al cargar intenciones: {e}")
+    return exactas, contenidas
+
+
+class _Tabla:
+    """Frases ya compiladas de una versión del archivo."""
+    __slots__ = ('mtime', 'exactas', 'patron', 'intencion_frase', 'prioridad')
+
+    def __init__(self, mtime, exactas, contenidas):
+        self.mtime = mtime
+        self.exactas = exactas
+        self.intencion_frase = {}
+        self.prioridad = {}
+        for posicion, (frase, intencion) in enumerate(contenidas):
+            if frase not in self.intencion_frase:
+                self.intencion_frase[frase] = intencion
+                self.prioridad[frase] = posicion
+        # Las frases largas primero para que, en la misma posición, gane la más específica
+        frases = sorted(self.intencion_frase, key=len, reverse=True)
+        self.patron = re.compile(r'\b(?:' + '|'.join(map(re.escape, frases)) + r')') if frases else None
+
+
+class EnrutadorIntenciones:
+    """Clasifica un mensaje en una de las INTENCIONES y cuenta los aciertos de cada una.
+
+    Igual que los índices de intenciones, la tabla se compila una vez por worker y se
+    reemplaza de forma atómica cuando cambia el mtime del archivo.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._tabla = None
+        self._lock = threading.Lock()
+        self._contadores = Counter()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return None
+
+    def obtener(self):
+        tabla = self._tabla
+        mtime = self._mtime()
+        if tabla is not None and tabla.mtime == mtime:
+            return tabla
+        with self._lock:
+            tabla = self._tabla
+            if tabla is None or tabla.mtime != mtime:
+                tabla = _Tabla(mtime, *cargar_intenciones(self.ruta))
+                self._tabla = tabla
+        return tabla
+
+    def clasificar(self, mensaje):
+        """Devuelve la intención del mensaje o None.
+
+        Una frase exacta tiene prioridad sobre las contenidas; entre varias frases contenidas
+        gana la que aparece antes en el archivo.
+        """
+        tabla = self.obtener()
+        texto = normalizar_texto(mensaje)
+        intencion = tabla.exactas.get(texto)
+        if intencion is None and tabla.patron is not None:
+            encontradas = [coincidencia.group() for coincidencia in tabla.patron.finditer(texto)]
+            if encontradas:
+                intencion = tabla.intencion_frase[min(encontradas, key=tabla.prioridad.__getitem__)]
+        with self._lock:
+            self._contadores[intencion or SIN_INTENCION] += 1
+        return intencion
+
+    def estadisticas(self):
+        """Aciertos por intención desde el arranque del worker."""
+        with self._lock:
+            return dict(self._contadores)
+
+
+enrutador_intenciones = EnrutadorIntenciones(os.path.join(DATOS_DIR, 'intenciones.txt'))
+
+
+@metricas.registro.colector
+def _metricas_enrutador():
+    datos = enrutador_intenciones.estadisticas()
+    return [
+        ('intenciones_total', 'counter', 'Mensajes clasificados por el enrutador de intenciones.',
+         [({'intencion': intencion}, datos[intencion]) for intencion in sorted(datos)]),
+    ]
@@ -0,0 +1,303 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+import redis
+from flask import current_app
+from controladores.redis_cliente import obtener_redis
+
+VERSION_ESQUEMA = 1
+PREFIJO_CLAVE = 'conversacion:'
+PREFIJO_BLOQUEO = 'conversacion-bloqueo:'
+# Identificadores aceptados: uuid, número de teléfono, id de otro canal ('whatsapp:+51987...')
+PATRON_ID = re.compile(r'^[A-Za-z0-9_.:+@-]{1,128}$')
+CAMPO_VERSION = b'_v'
+
+# (campo, código en el hash de Redis). Solo se agregan campos al final; cambiar un código
+# o el significado de un campo exige subir VERSION_ESQUEMA.
+CAMPOS = (
+    ('estado', 'e'),
+    ('usuario_id', 'u'),
+    ('vehiculo_id', 'vh'),
+    ('nombre_completo', 'n'),
+    ('email', 'm'),
+    ('telefono', 't'),
+    ('direccion', 'd'),
+    ('pais', 'p'),
+    ('fecha_nacimiento', 'fn'),
+    ('genero', 'g'),
+    ('marca', 'ma'),
+    ('modelo', 'mo'),
+    ('año', 'an'),
+    ('password', 'pw'),
+    ('password_confirmacion', 'pc'),
+    ('problema', 'pr'),
+    ('servicio_id', 's'),
+    ('servicio_principal', 'sp'),
+    ('servicio_precio', 'sv'),
+    ('fecha_reserva', 'fr'),
+    ('consultas_iniciadas', 'ci'),
+    ('solicitudes_atendidas', 'sa'),
+    ('conversiones_realizadas', 'cr'),
+    ('tiempo_inicio_registro', 'tr'),
+    ('tiempo_inicio_servicio', 'ts'),
+)
+NOMBRES = tuple(nombre for nombre, _ in CAMPOS)
+_CODIGOS = {nombre: codigo.encode() for nombre, codigo in CAMPOS}
+_NOMBRES_POR_CODIGO = {codigo: nombre for nombre, codigo in _CODIGOS.items()}
+_CONTADORES = ('consultas_iniciadas', 'solicitudes_atendidas', 'conversiones_realizadas')
+
+
+def codificar_valor(valor):
+    """Codifica un valor como bytes con un prefijo de tipo de un byte (sin pickle)."""
+    if isinstance(valor, bool):
+        return b'b1' if valor else b'b0'
+    if isinstance(valor, int):
+        return b'i' + str(valor).encode()
+    if isinstance(valor, Decimal):
+        return b'm' + str(valor).encode()
+    if isinstance(valor, datetime):
+        return b't' + valor.isoformat().encode()
+    if isinstance(valor, date):
+        return b'd' + valor.isoformat().encode()
+    if isinstance(valor, str):
+        return b's' + valor.encode('utf-8')
+    raise TypeError(f"Tipo no soportado en el estado de la conversación: {type(valor).__name__}")
+
+
+def decodificar_valor(crudo):
+    tipo, cuerpo = crudo[:1], crudo[1:]
+    if tipo == b's':
+        return cuerpo.decode('utf-8')
+    if tipo == b'i':
+        return int(cuerpo)
+    if tipo == b'm':
+        return Decimal(cuerpo.decode())
+    if tipo == b't':
+        return datetime.fromisoformat(cuerpo.decode())
+    if tipo == b'd':
+        return date.fromisoformat(cuerpo.decode())
+    if tipo == b'b':
+        return cuerpo == b'1'
+    raise ValueError(f"Tipo desconocido en el estado de la conversación: {tipo!r}")
+
+
+class EstadoConversacion:
+    """Estado de una conversación del chatbot.
+
+    Admite acceso tipo diccionario (estado["email"]) para los manejadores de la máquina de
+    estados y registra qué campos cambiaron, de modo que solo esos se escriben en Redis.
+    """
+    __slots__ = NOMBRES + ('id', '_modificados')
+
+    def __init__(self, id=None):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, '_modificados', {'estado'})
+        for nombre in NOMBRES:
+            object.__setattr__(self, nombre, 0 if nombre in _CONTADORES else None)
+        object.__setattr__(self, 'estado', 'inicio')
+
+    def __setattr__(self, nombre, valor):
+        if nombre in _CODIGOS and getattr(self, nombre, None) != valor:
+            self._modificados.add(nombre)
+        object.__setattr__(self, nombre, valor)
+
+    def __getitem__(self, nombre):
+        if nombre not in _CODIGOS:
+            raise KeyError(nombre)
+        return getattr(self, nombre)
+
+    def __setitem__(self, nombre, valor):
+        if nombre not in _CODIGOS:
+            raise KeyError(nombre)
+        setattr(self, nombre, valor)
+
+    def __contains__(self, nombre):
+        return nombre in _CODIGOS
+
+    def get(self, nombre, defecto=None):
+        valor = getattr(self, nombre, None) if nombre in _CODIGOS else None
+        return defecto if valor is None else valor
+
+    def a_dict(self):
+        return {nombre: getattr(self, nombre) for nombre in NOMBRES}
+
+    @property
+    def modificados(self):
+        return frozenset(self._modificados)
+
+    def cambios(self):
+        """Devuelve (campos a escribir, códigos a borrar) con los campos modificados desde la última carga."""
+        escribir, borrar = {}, []
+        for nombre in self._modificados:
+            valor = getattr(self, nombre)
+            if valor is None:
+                borrar.append(_CODIGOS[nombre])
+            else:
+                escribir[_CODIGOS[nombre]] = codificar_valor(valor)
+        return escribir, borrar
+
+    def marcar_guardado(self):
+        self._modificados.clear()
+
+    @classmethod
+    def desde_hash(cls, id, datos):
+        """Reconstruye el estado desde un hash de Redis; devuelve None si es de otra versión del esquema."""
+        version = datos.get(CAMPO_VERSION)
+        if version is None or int(version) != VERSION_ESQUEMA:
+            return None
+        estado = cls(id)
+        for codigo, crudo in datos.items():
+            nombre = _NOMBRES_POR_CODIGO.get(codigo)
+            if nombre is not None:
+                object.__setattr__(estado, nombre, decodificar_valor(crudo))
+        estado.marcar_guardado()
+        return estado
+
+
+class ConversacionOcupada(Exception):
+    """Otro turno de la misma conversación sigue en curso."""
+
+
+def id_valido(conversacion_id):
+    return bool(conversacion_id) and PATRON_ID.match(conversacion_id) is not None
+
+
+class AlmacenEstadosRedis:
+    """Un hash de Redis por conversación; cada turno escribe solo los campos que cambiaron.
+
+    La expiración la hace Redis con el TTL de cada hash, así que limpiar() no tiene nada que hacer.
+    """
+
+    def __init__(self, cliente, ttl, espera_bloqueo=10):
+        self.redis = cliente
+        self.ttl = ttl
+        self.espera_bloqueo = espera_bloqueo
+
+    @contextmanager
+    def bloquear(self, conversacion_id):
+        """Serializa los turnos de una conversación entre workers (p. ej. reintentos de un canal)."""
+        bloqueo = self.redis.lock(PREFIJO_BLOQUEO + conversacion_id, timeout=30, blocking_timeout=self.espera_bloqueo)
+        if not bloqueo.acquire():
+            raise ConversacionOcupada(conversacion_id)
+        try:
+            yield
+        finally:
+            try:
+                bloqueo.release()
+            except redis.exceptions.LockError:
+                pass  # El bloqueo expiró antes de terminar el turno
+
+    def activas(self):
+        return sum(1 for _ in self.redis.scan_iter(match=PREFIJO_CLAVE + '*', count=1000))
+
+    def limpiar(self):
+        return 0
+
+    def cargar(self, conversacion_id):
+        datos = self.redis.hgetall(PREFIJO_CLAVE + conversacion_id)
+        return EstadoConversacion.desde_hash(conversacion_id, datos) if datos else None
+
+    def guardar(self, estado):
+        escribir, borrar = estado.cambios()
+        clave = PREFIJO_CLAVE + estado.id
+        with self.redis.pipeline(transaction=False) as pipe:
+            if borrar:
+                pipe.hdel(clave, *borrar)
+            escribir[CAMPO_VERSION] = str(VERSION_ESQUEMA).encode()
+            pipe.hset(clave, mapping=escribir)
+            pipe.expire(clave, self.ttl)
+            pipe.execute()
+        estado.marcar_guardado()
+
+    def eliminar(self, conversacion_id):
+        self.redis.delete(PREFIJO_CLAVE + conversacion_id)
+
+
+class AlmacenEstadosMemoria:
+    """Almacén en el proceso para desarrollo y pruebas sin Redis; mismo formato que el hash de Redis."""
+
+    LIMPIAR_CADA = 1000  # Guardados entre barridos de conversaciones expiradas
+
+    def __init__(self, ttl, espera_bloqueo=10):
+        self.ttl = ttl
+        self.espera_bloqueo = espera_bloqueo
+        self._datos = {}  # id -> (expira, {codigo: bytes})
+        self._bloqueos = {}
+        self._lock = threading.Lock()
+        self._guardados = 0
+
+    @contextmanager
+    def bloquear(self, conversacion_id):
+        with self._lock:
+            bloqueo = self._bloqueos.setdefault(conversacion_id, threading.Lock())
+        if not bloqueo.acquire(timeout=self.espera_bloqueo):
+            raise ConversacionOcupada(conversacion_id)
+        try:
+            yield
+        finally:
+            bloqueo.release()
+
+    def activas(self):
+        ahora = time.time()
+        with self._lock:
+            return sum(1 for expira, _ in self._datos.values() if expira >= ahora)
+
+    def limpiar(self):
+        """Elimina las conversaciones expiradas y devuelve cuántas se eliminaron."""
+        ahora = time.time()
+        with self._lock:
+            expiradas = [conversacion_id for conversacion_id, (expira, _) in self._datos.items() if expira < ahora]
+            for conversacion_id in expiradas:
+                del self._datos[conversacion_id]
+                bloqueo = self._bloqueos.get(conversacion_id)
+                if bloqueo is not None and not bloqueo.locked():
+                    del self._bloqueos[conversacion_id]
+        return len(expiradas)
+
+    def cargar(self, conversacion_id):
+        with self._lock:
+            entrada = self._datos.get(conversacion_id)
+            if entrada is None:
+                return None
+            if entrada[0] < time.time():
+                del self._datos[conversacion_id]
+                return None
+            datos = dict(entrada[1])
+        return EstadoConversacion.desde_hash(conversacion_id, datos)
+
+    def guardar(self, estado):
+        escribir, borrar = estado.cambios()
+        escribir[CAMPO_VERSION] = str(VERSION_ESQUEMA).encode()
+        with self._lock:
+            _, datos = self._datos.get(estado.id, (None, {}))
+            for codigo in borrar:
+                datos.pop(codigo, None)
+            datos.update(escribir)
+            self._datos[estado.id] = (time.time() + self.ttl, datos)
+            self._guardados += 1
+            barrer = self._guardados % self.LIMPIAR_CADA == 0
+        estado.marcar_guardado()
+        if barrer:
+            self.limpiar()
+
+    def eliminar(self, conversacion_id):
+        with self._lock:
+            self._datos.pop(conversacion_id, None)
+            bloqueo = self._bloqueos.get(conversacion_id)
+            if bloqueo is not None and not bloqueo.locked():
+                del self._bloqueos[conversacion_id]
+
+
+# Función para obtener el almacén de estados: Redis si está configurado, memoria del proceso si no
+def obtener_almacen_estados(app=None):
+    app = app or current_app
+    almacen = app.extensions.get('almacen_estados')
+    if almacen is None:
+        ttl = app.config.get('CONVERSACION_TTL', 3600)
+        cliente = obtener_redis(app)
+        almacen = AlmacenEstadosRedis(cliente, ttl) if cliente is not None else AlmacenEstadosMemoria(ttl)
+        app.extensions['almacen_estados'] = almacen
+    return almacen
@@ -0,0 +1,172 @@
+"""Exportación de clientes, reservas e interacciones a CSV o Excel sin cargar la tabla en memoria.
+
+Las filas se leen por lotes con un cursor del lado del servidor (yield_per) y solo con las
+columnas exportadas, sin construir objetos del ORM. El CSV se envía a medida que se genera;
+el Excel se escribe con XlsxWriter en modo constant_memory a un archivo temporal propio de
+cada solicitud, que se elimina al cerrar la respuesta.
+"""
+import csv
+import io
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from flask import Response, send_file, stream_with_context
+from sqlalchemy import select
+from modelos.models import db, Usuario, Vehiculo, Servicio, Reserva, Interaccion
+
+LOTE = 1000
+FILAS_POR_HOJA = 1048575  # Límite de Excel (1.048.576) menos la fila de encabezados
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+FORMATOS = ('csv', 'xlsx')
+_PREFIJOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Exportacion:
+    """Columnas (título, expresión SQL) y consulta base de una exportación."""
+
+    def __init__(self, nombre, columnas, origen=None, orden=None, columna_fecha=None):
+        self.nombre = nombre
+        self.columnas = columnas
+        self.origen = origen or (lambda consulta: consulta)  # Agrega FROM/JOIN al select de columnas
+        self.orden = orden
+        self.columna_fecha = columna_fecha
+
+    @property
+    def titulos(self):
+        return [titulo for titulo, _ in self.columnas]
+
+    def consulta(self, desde=None, hasta=None):
+        consulta = self.origen(select(*(columna for _, columna in self.columnas)))
+        if self.columna_fecha is not None and desde is not None:
+            consulta = consulta.where(self.columna_fecha >= desde)
+        if self.columna_fecha is not None and hasta is not None:
+            consulta = consulta.where(self.columna_fecha < hasta)
+        return consulta.order_by(self.orden)
+
+    def filas(self, desde=None, hasta=None, lote=LOTE):
+        # yield_per activa stream_results: el driver no trae todo el resultado de una vez
+        resultado = db.session.execute(self.consulta(desde, hasta).execution_options(yield_per=lote))
+        for particion in resultado.partitions():
+            yield from particion
+
+
+EXPORTACIONES = {
+    'clientes': Exportacion('clientes', [
+        ('ID', Usuario.id),
+        ('Nombre', Usuario.nombre),
+        ('Apellido', Usuario.apellido),
+        ('Email', Usuario.email),
+        ('Teléfono', Usuario.telefono),
+        ('Dirección', Usuario.direccion),
+        ('Género', Usuario.genero),
+        ('Fecha de Nacimiento', Usuario.fecha_nacimiento),
+        ('País', Usuario.pais),
+        ('Fecha de Registro', Usuario.fecha_registro),
+    ], orden=Usuario.id, columna_fecha=Usuario.fecha_registro),
+    'reservas': Exportacion('reservas', [
+        ('ID', Reserva.id),
+        ('Email', Usuario.email),
+        ('Nombre', Usuario.nombre),
+        ('Apellido', Usuario.apellido),
+        ('Marca', Vehiculo.marca),
+        ('Modelo', Vehiculo.modelo),
+        ('Servicio', Servicio.nombre),
+        ('Fecha y Hora', Reserva.fecha_hora),
+        ('Estado', Reserva.estado),
+        ('Problema', Reserva.problema),
+    ], origen=lambda consulta: (consulta.select_from(Reserva)
+                                .join(Usuario, Reserva.usuario_id == Usuario.id)
+                                .join(Vehiculo, Reserva.vehiculo_id == Vehiculo.id)
+                                .join(Servicio, Reserva.servicio_id == Servicio.id)),
+        orden=Reserva.id, columna_fecha=Reserva.fecha_hora),
+    'interacciones': Exportacion('interacciones', [
+        ('ID', Interaccion.id),
+        ('Usuario', Interaccion.usuario_id),
+        ('Fecha y Hora', Interaccion.timestamp),
+        ('Exitosa', Interaccion.es_exitosa),
+        ('Mensaje', Interaccion.mensaje_usuario),
+        ('Respuesta', Interaccion.respuesta_bot),
+    ], orden=Interaccion.id, columna_fecha=Interaccion.timestamp),
+}
+
+
+def _texto_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, str) and valor.startswith(_PREFIJOS_FORMULA):
+        return "'" + valor  # Evita que Excel interprete el texto como fórmula
+    return valor
+
+
+def generar_csv(exportacion, filas):
+    """Genera el CSV por trozos de aproximadamente un lote de filas."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write('\ufeff')  # BOM para que Excel detecte UTF-8
+    escritor.writerow(exportacion.titulos)
+    for numero, fila in enumerate(filas, 1):
+        escritor.writerow([_texto_csv(valor) for valor in fila])
+        if numero % LOTE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def escribir_xlsx(exportacion, filas, archivo):
+    """Escribe las filas en 'archivo' con memoria constante; abre otra hoja al llegar al límite de Excel."""
+    import xlsxwriter  # Solo lo necesitan las exportaciones a Excel
+    libro = xlsxwriter.Workbook(archivo, {'constant_memory': True})
+    formato_fecha = libro.add_format({'num_format': 'yyyy-mm-dd'})
+    formato_fecha_hora = libro.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+    hoja = None
+    hojas = 0
+    fila_actual = FILAS_POR_HOJA
+    for fila in filas:
+        if fila_actual >= FILAS_POR_HOJA:
+            hojas += 1
+            hoja = libro.add_worksheet(exportacion.nombre if hojas == 1 else f'{exportacion.nombre} {hojas}')
+            hoja.write_row(0, 0, exportacion.titulos)
+            fila_actual = 0
+        fila_actual += 1
+        for columna, valor in enumerate(fila):
+            # En constant_memory las celdas se escriben en orden; write_string evita que un texto
+            # que empieza por '=' se guarde como fórmula
+            if valor is None:
+                continue
+            if isinstance(valor, str):
+                hoja.write_string(fila_actual, columna, valor)
+            elif isinstance(valor, datetime):
+                hoja.write_datetime(fila_actual, columna, valor, formato_fecha_hora)
+            elif isinstance(valor, date):
+                hoja.write_datetime(fila_actual, columna, valor, formato_fecha)
+            elif isinstance(valor, bool):
+                hoja.write_boolean(fila_actual, columna, valor)
+            elif isinstance(valor, (int, float, Decimal)):
+                hoja.write_number(fila_actual, columna, float(valor))
+            else:
+                hoja.write_string(fila_actual, columna, str(valor))
+    if hoja is None:
+        libro.add_worksheet(exportacion.nombre).write_row(0, 0, exportacion.titulos)
+    libro.close()
+
+
+def respuesta_exportacion(nombre, formato, desde=None, hasta=None):
+    """Response con la exportación 'nombre' en 'formato' ('csv' o 'xlsx')."""
+    exportacion = EXPORTACIONES[nombre]
+    archivo_descarga = f'{nombre}-{date.today().isoformat()}.{formato}'
+    if formato == 'csv':
+        contenido = stream_with_context(generar_csv(exportacion, exportacion.filas(desde, hasta)))
+        return Response(contenido, mimetype='text/csv', headers={
+            'Content-Disposition': f'attachment; filename={archivo_descarga}',
+            'X-Accel-Buffering': 'no',
+        })
+    # Archivo temporal anónimo por solicitud: se borra solo al cerrarlo send_file
+    temporal = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        escribir_xlsx(exportacion, exportacion.filas(desde, hasta), temporal)
+    except Exception:
+        temporal.close()
+        raise
+    temporal.seek(0)
+    return send_file(temporal, mimetype=TIPO_XLSX, as_attachment=True, download_name=archivo_descarga)
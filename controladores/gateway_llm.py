@@ -0,0 +1,677 @@
+import asyncio
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+import redis
+from flask import current_app
+from controladores.redis_cliente import obtener_redis
+from controladores import metricas
+from controladores.normalizacion import Normalizador
+
+MENSAJE_LIMITE = "❌ **Lo siento, hemos superado nuestro límite de solicitudes por ahora. Por favor, intenta de nuevo más tarde.**"
+MENSAJE_ERROR = "❌ **Ha ocurrido un error al interactuar con OpenAI. Por favor, intenta de nuevo más tarde.**"
+PREFIJO_CACHE = 'llm:cache:'
+# Consultas normalizadas guardadas recientemente por cualquier worker, para el índice de similares
+CLAVE_CONSULTAS_RECIENTES = 'llm:consultas_recientes'
+URL_OPENAI = 'https://api.openai.com/v1'
+
+
+class ErrorLLM(Exception):
+    """Error del proveedor de LLM."""
+
+
+class ErrorLimiteLLM(ErrorLLM):
+    """El proveedor rechazó la solicitud por límite de uso."""
+
+
+class BackendOpenAI:
+    def __init__(self, api_key, modelo='gpt-4', max_tokens=100, temperatura=0.5):
+        self.api_key = api_key
+        self.modelo = modelo
+        self.max_tokens = max_tokens
+        self.temperatura = temperatura
+        self._cliente_async = None
+
+    def _crear(self, consulta, stream=False):
+        import openai
+        openai.api_key = self.api_key
+        try:
+            return openai.ChatCompletion.create(
+                model=self.modelo,
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": consulta}
+                ],
+                max_tokens=self.max_tokens,
+                temperature=self.temperatura,
+                stream=stream,
+            )
+        except openai.error.RateLimitError as e:
+            raise ErrorLimiteLLM(str(e)) from e
+        except openai.error.OpenAIError as e:
+            raise ErrorLLM(str(e)) from e
+
+    def completar(self, consulta):
+        return self._crear(consulta).choices[0].message['content'].strip()
+
+    def completar_flujo(self, consulta):
+        """Genera los fragmentos de texto a medida que llegan del proveedor."""
+        import openai
+        respuesta = self._crear(consulta, stream=True)
+        inicio = True
+        try:
+            for chunk in respuesta:
+                fragmento = chunk.choices[0].delta.get('content')
+                if not fragmento:
+                    continue
+                if inicio:
+                    fragmento = fragmento.lstrip()
+                    inicio = not fragmento
+                if fragmento:
+                    yield fragmento
+        except openai.error.OpenAIError as e:
+            raise ErrorLLM(str(e)) from e
+
+
+    async def completar_flujo_async(self, consulta):
+        """Igual que completar_flujo(), pero con httpx.AsyncClient sobre la API REST de OpenAI."""
+        import httpx
+        if self._cliente_async is None:
+            self._cliente_async = httpx.AsyncClient(base_url=URL_OPENAI, timeout=httpx.Timeout(60.0, connect=5.0))
+        cuerpo = {
+            'model': self.modelo,
+            'messages': [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": consulta}
+            ],
+            'max_tokens': self.max_tokens,
+            'temperature': self.temperatura,
+            'stream': True,
+        }
+        inicio = True
+        try:
+            async with self._cliente_async.stream('POST', '/chat/completions', json=cuerpo,
+                                                  headers={'Authorization': f'Bearer {self.api_key}'}) as respuesta:
+                if respuesta.status_code == 429:
+                    raise ErrorLimiteLLM(await respuesta.aread())
+                if respuesta.status_code >= 400:
+                    raise ErrorLLM(await respuesta.aread())
+                async for linea in respuesta.aiter_lines():
+                    if not linea.startswith('data:'):
+                        continue
+                    datos = linea[5:].strip()
+                    if datos == '[DONE]':
+                        break
+                    fragmento = json.loads(datos)['choices'][0]['delta'].get('content')
+                    if not fragmento:
+                        continue
+                    if inicio:
+                        fragmento = fragmento.lstrip()
+                        inicio = not fragmento
+                    if fragmento:
+                        yield fragmento
+        except httpx.HTTPError as e:
+            raise ErrorLLM(str(e)) from e
+
+    async def cerrar_async(self):
+        if self._cliente_async is not None:
+            await self._cliente_async.aclose()
+            self._cliente_async = None
+
+
+class BackendFalso:
+    """Backend local para pruebas y desarrollo: responde sin llamar a ningún servicio externo."""
+
+    def __init__(self, respuestas=None, latencia=0.0):
+        self.respuestas = respuestas or {}
+        self.latencia = latencia
+        self.llamadas = 0
+
+    def completar(self, consulta):
+        self.llamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        return self.respuestas.get(consulta, f"Respuesta de prueba para: {consulta}")
+
+    def completar_flujo(self, consulta):
+        respuesta = self.completar(consulta)
+        palabras = respuesta.split(' ')
+        for i, palabra in enumerate(palabras):
+            yield palabra if i == 0 else ' ' + palabra
+
+    async def completar_flujo_async(self, consulta):
+        self.llamadas += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        respuesta = self.respuestas.get(consulta, f"Respuesta de prueba para: {consulta}")
+        for i, palabra in enumerate(respuesta.split(' ')):
+            yield palabra if i == 0 else ' ' + palabra
+
+
+# Clave de caché: los números se conservan ("aceite 5w30" no es "aceite")
+normalizar_consulta = Normalizador(quitar_numeros=False)
+
+
+# Palabras que no aportan a la similitud: cortesías, artículos, posesivos y nexos ("cambio de
+# aceite" es "cambio el aceite"). Los interrogativos y las preposiciones con significado
+# ("cuando"/"como", "con"/"para") se conservan; las negaciones y los números son guardas
+PALABRAS_RELLENO = frozenset((
+    'hola', 'oye', 'porfa', 'porfavor', 'gracias', 'buenas', 'disculpa', 'disculpe',
+    'el', 'la', 'los', 'las', 'lo', 'unos', 'unas', 'de', 'del', 'al', 'a', 'en', 'y', 'e', 'o', 'u',
+    'mi', 'mis', 'tu', 'tus', 'su', 'sus', 'me', 'te', 'se', 'le', 'les', 'yo', 'es', 'muy', 'ya',
+))
+PALABRAS_GUARDA = frozenset((
+    'no', 'ni', 'nunca', 'jamas', 'tampoco', 'nada', 'ningun', 'ninguna', 'ninguno', 'si', 'sin',
+    'cero', 'uno', 'una', 'dos', 'tres', 'cuatro', 'cinco', 'seis', 'siete', 'ocho', 'nueve', 'diez',
+    'once', 'doce', 'quince', 'veinte', 'treinta', 'cuarenta', 'cincuenta', 'cien', 'mil', 'medio', 'media',
+))
+
+
+def terminos_consulta(normalizada):
+    """Devuelve (contenido, guardas) de una consulta normalizada.
+
+    'guardas' son las negaciones y los números (en cifras o en palabras); dos consultas solo
+    pueden considerarse casi idénticas si tienen exactamente las mismas. 'contenido' es el
+    resto de palabras, sin las de PALABRAS_RELLENO, sobre el que se mide la similitud.
+    """
+    contenido = set()
+    guardas = set()
+    for palabra in f' {normalizada} '.replace(' por favor ', ' ').split():
+        if palabra in PALABRAS_GUARDA or any(caracter.isdigit() for caracter in palabra):
+            guardas.add(palabra)
+        elif palabra not in PALABRAS_RELLENO:
+            contenido.add(palabra)
+    return frozenset(contenido), frozenset(guardas)
+
+
+class IndiceSimilares:
+    """Índice invertido incremental de las consultas con respuesta en caché, para buscar casi duplicados.
+
+    La similitud es el coseno TF-IDF (tf binario, idf de las propias consultas indexadas) entre
+    los términos de contenido, y solo se comparan consultas con las mismas guardas: "no arranca"
+    nunca coincide con "si arranca" ni "5w30" con "10w40". Cada inserción actualiza las listas
+    de postings, así que no hay que reajustar nada; una búsqueda solo recorre las consultas que
+    comparten algún término.
+    """
+
+    def __init__(self, max_entradas=1000):
+        self.max_entradas = max_entradas
+        self._consultas = OrderedDict()  # normalizada -> (contenido, guardas)
+        self._postings = {}  # término -> conjunto de consultas normalizadas
+        self._lock = threading.Lock()
+
+    def __contains__(self, normalizada):
+        return normalizada in self._consultas
+
+    def agregar(self, normalizada):
+        contenido, guardas = terminos_consulta(normalizada)
+        if not contenido:
+            return
+        with self._lock:
+            if normalizada in self._consultas:
+                self._consultas.move_to_end(normalizada)
+                return
+            self._consultas[normalizada] = (contenido, guardas)
+            for termino in contenido:
+                self._postings.setdefault(termino, set()).add(normalizada)
+            while len(self._consultas) > self.max_entradas:
+                self._quitar(next(iter(self._consultas)))
+
+    def quitar(self, normalizada):
+        with self._lock:
+            self._quitar(normalizada)
+
+    def _quitar(self, normalizada):
+        # Llamar con self._lock tomado
+        terminos = self._consultas.pop(normalizada, None)
+        if terminos is None:
+            return
+        for termino in terminos[0]:
+            consultas = self._postings.get(termino)
+            if consultas is not None:
+                consultas.discard(normalizada)
+                if not consultas:
+                    del self._postings[termino]
+
+    def buscar(self, normalizada, umbral):
+        """La consulta indexada más parecida con similitud >= umbral, o None."""
+        contenido, guardas = terminos_consulta(normalizada)
+        if not contenido:
+            return None
+        with self._lock:
+            total = len(self._consultas)
+            pesos = {}
+
+            def peso(termino):
+                if termino not in pesos:
+                    frecuencia = len(self._postings.get(termino, ()))
+                    pesos[termino] = (math.log((1 + total) / (1 + frecuencia)) + 1) ** 2
+                return pesos[termino]
+
+            norma_consulta = sum(peso(termino) for termino in contenido)
+            candidatos = set()
+            for termino in contenido:
+                candidatos.update(self._postings.get(termino, ()))
+            mejor, mejor_similitud = None, umbral
+            for candidata in candidatos:
+                contenido_candidata, guardas_candidata = self._consultas[candidata]
+                if guardas_candidata != guardas or candidata == normalizada:
+                    continue
+                comun = sum(peso(termino) for termino in contenido & contenido_candidata)
+                norma = math.sqrt(norma_consulta * sum(peso(termino) for termino in contenido_candidata))
+                similitud = comun / norma
+                if similitud >= mejor_similitud:
+                    mejor, mejor_similitud = candidata, similitud
+            return mejor
+
+
+class CacheRespuestas:
+    """Caché de respuestas por consulta normalizada.
+
+    Coincidencia exacta en Redis (compartida entre workers, con TTL) y en un LRU local. Las
+    consultas casi idénticas se buscan en un IndiceSimilares con las consultas cacheadas por
+    este worker y, con Redis, con las que los demás publican en CLAVE_CONSULTAS_RECIENTES; esa
+    lista se relee como mucho cada 'intervalo_sincronizacion' segundos. La respuesta de la
+    consulta encontrada se lee con la búsqueda exacta.
+    """
+
+    def __init__(self, ttl=86400, max_entradas=1000, umbral_similitud=0.9, intervalo_sincronizacion=30):
+        self.ttl = ttl
+        self._similares = IndiceSimilares(max_entradas)
+        self.umbral_similitud = umbral_similitud
+        self.intervalo_sincronizacion = intervalo_sincronizacion
+        self.redis = None
+        self._lru = OrderedDict()  # clave -> (expira, consulta_normalizada, respuesta)
+        self._lock = threading.Lock()
+        self._proxima_sincronizacion = 0.0
+        self._sincronizando = threading.Lock()
+
+    @property
+    def max_entradas(self):
+        return self._similares.max_entradas
+
+    @max_entradas.setter
+    def max_entradas(self, valor):
+        # El índice de similares tiene el mismo tamaño que el LRU local
+        self._similares.max_entradas = valor
+
+    @staticmethod
+    def clave(normalizada):
+        return hashlib.sha1(normalizada.encode('utf-8')).hexdigest()
+
+    def _leer_local(self, clave):
+        with self._lock:
+            entrada = self._lru.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] < time.time():
+                del self._lru[clave]
+                return None
+            self._lru.move_to_end(clave)
+            return entrada[2]
+
+    def obtener_exacta(self, normalizada):
+        clave = self.clave(normalizada)
+        respuesta = self._leer_local(clave)
+        if respuesta is not None or self.redis is None:
+            return respuesta
+        try:
+            valor = self.redis.get(PREFIJO_CACHE + clave)
+        except redis.RedisError:
+            return None
+        if valor is None:
+            return None
+        respuesta = valor.decode('utf-8')
+        self._guardar_local(clave, normalizada, respuesta)
+        return respuesta
+
+    def obtener_similar(self, normalizada):
+        """Respuesta de una consulta casi idéntica (ver IndiceSimilares), o None."""
+        self._sincronizar()
+        candidata = self._similares.buscar(normalizada, self.umbral_similitud)
+        if candidata is None:
+            return None
+        respuesta = self.obtener_exacta(candidata)
+        if respuesta is None:
+            self._similares.quitar(candidata)  # Expiró en Redis o salió del LRU
+        return respuesta
+
+    def _sincronizar(self):
+        """Incorpora las consultas que otros workers guardaron en Redis desde la última lectura."""
+        if self.redis is None or time.time() < self._proxima_sincronizacion:
+            return
+        # Un solo hilo relee la lista; los demás siguen con el índice que ya tienen
+        if not self._sincronizando.acquire(blocking=False):
+            return
+        try:
+            self._proxima_sincronizacion = time.time() + self.intervalo_sincronizacion
+            recientes = self.redis.lrange(CLAVE_CONSULTAS_RECIENTES, 0, self.max_entradas - 1)
+        except redis.RedisError:
+            return
+        finally:
+            self._sincronizando.release()
+        for crudo in reversed(recientes):
+            normalizada = crudo.decode('utf-8')
+            if normalizada not in self._similares:
+                self._similares.agregar(normalizada)
+
+    def _guardar_local(self, clave, normalizada, respuesta):
+        with self._lock:
+            self._lru[clave] = (time.time() + self.ttl, normalizada, respuesta)
+            self._lru.move_to_end(clave)
+            while len(self._lru) > self.max_entradas:
+                self._lru.popitem(last=False)
+        self._similares.agregar(normalizada)
+
+    def guardar(self, normalizada, respuesta):
+        clave = self.clave(normalizada)
+        self._guardar_local(clave, normalizada, respuesta)
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.set(PREFIJO_CACHE + clave, respuesta.encode('utf-8'), ex=self.ttl)
+                pipe.lpush(CLAVE_CONSULTAS_RECIENTES, normalizada.encode('utf-8'))
+                pipe.ltrim(CLAVE_CONSULTAS_RECIENTES, 0, self.max_entradas - 1)
+                pipe.execute()
+            except redis.RedisError:
+                pass
+
+
+class _Vuelo:
+    """Consulta en curso compartida por las solicitudes idénticas concurrentes.
+
+    Los hilos esperan el evento; las corrutinas, un Future de su propio bucle que terminar()
+    resuelve con call_soon_threadsafe, así que no ocupan un hilo mientras esperan.
+    """
+    __slots__ = ('evento', 'respuesta', '_esperas', '_lock')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.respuesta = None
+        self._esperas = []  # (bucle, futuro) de las corrutinas en espera
+        self._lock = threading.Lock()
+
+    def esperar_async(self):
+        """Future del bucle actual que se resuelve cuando el líder termina."""
+        bucle = asyncio.get_running_loop()
+        futuro = bucle.create_future()
+        with self._lock:
+            if self.evento.is_set():
+                futuro.set_result(None)
+            else:
+                self._esperas.append((bucle, futuro))
+        return futuro
+
+    def terminar(self):
+        with self._lock:
+            self.evento.set()
+            esperas, self._esperas = self._esperas, []
+        for bucle, futuro in esperas:
+            bucle.call_soon_threadsafe(_resolver, futuro)
+
+
+def _resolver(futuro):
+    if not futuro.done():  # La corrutina pudo cancelarse mientras esperaba
+        futuro.set_result(None)
+
+
+class GatewayLLM:
+    """Punto único de acceso al LLM: caché, coalescencia de consultas en vuelo y contadores."""
+
+    def __init__(self, backend=None, cache=None):
+        self.backend = backend
+        self.cache = cache or CacheRespuestas()
+        self.app = None
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+        self._contadores = {
+            'solicitudes': 0,
+            'aciertos_exactos': 0,
+            'aciertos_similares': 0,
+            'coalescidas': 0,
+            'llamadas_backend': 0,
+            'errores': 0,
+        }
+
+    def init_app(self, app):
+        self.cache.ttl = app.config.get('LLM_CACHE_TTL', self.cache.ttl)
+        self.cache.max_entradas = app.config.get('LLM_CACHE_MAX_ENTRADAS', self.cache.max_entradas)
+        self.cache.umbral_similitud = app.config.get('LLM_CACHE_UMBRAL_SIMILITUD', self.cache.umbral_similitud)
+        self.cache.intervalo_sincronizacion = app.config.get('LLM_CACHE_SINCRONIZACION_SEGUNDOS',
+                                                             self.cache.intervalo_sincronizacion)
+        self.cache.redis = obtener_redis(app)
+        if self.backend is None:
+            if app.config.get('LLM_BACKEND', 'openai') == 'falso':
+                self.backend = BackendFalso()
+            else:
+                self.backend = BackendOpenAI(
+                    api_key=app.config.get('OPENAI_API_KEY'),
+                    modelo=app.config.get('LLM_MODELO', 'gpt-4'),
+                    max_tokens=app.config.get('LLM_MAX_TOKENS', 100),
+                    temperatura=app.config.get('LLM_TEMPERATURA', 0.5)
+                )
+        self.app = app
+        app.extensions['gateway_llm'] = self
+
+    def _contar(self, contador):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def _buscar_en_cache(self, normalizada):
+        respuesta = self.cache.obtener_exacta(normalizada)
+        if respuesta is not None:
+            self._contar('aciertos_exactos')
+            return respuesta
+        respuesta = self.cache.obtener_similar(normalizada)
+        if respuesta is not None:
+            self._contar('aciertos_similares')
+        return respuesta
+
+    def _registrar_vuelo(self, normalizada):
+        """Devuelve (vuelo, lider); solo el líder consulta al backend, el resto espera su respuesta."""
+        with self._lock:
+            vuelo = self._en_vuelo.get(normalizada)
+            if vuelo is None:
+                vuelo = self._en_vuelo[normalizada] = _Vuelo()
+                return vuelo, True
+            self._contadores['coalescidas'] += 1
+            return vuelo, False
+
+    def _cerrar_vuelo(self, normalizada, vuelo):
+        with self._lock:
+            del self._en_vuelo[normalizada]
+        vuelo.terminar()
+
+    def consultar(self, consulta):
+        """Devuelve la respuesta del LLM para la consulta, usando la caché cuando es posible."""
+        self._contar('solicitudes')
+        normalizada = normalizar_consulta(consulta)
+        respuesta = self._buscar_en_cache(normalizada)
+        if respuesta is not None:
+            return respuesta
+
+        vuelo, lider = self._registrar_vuelo(normalizada)
+        if not lider:
+            vuelo.evento.wait()
+            return vuelo.respuesta
+
+        try:
+            # Otra solicitud pudo completar la misma consulta justo antes de registrarnos como líder
+            vuelo.respuesta = self.cache.obtener_exacta(normalizada) or self._llamar_backend(consulta, normalizada)
+        finally:
+            self._cerrar_vuelo(normalizada, vuelo)
+        return vuelo.respuesta
+
+    def consultar_flujo(self, consulta):
+        """Como consultar(), pero genera la respuesta por fragmentos a medida que llega del LLM.
+
+        Los aciertos de caché y las consultas coalescidas se entregan en un solo fragmento.
+        """
+        self._contar('solicitudes')
+        normalizada = normalizar_consulta(consulta)
+        respuesta = self._buscar_en_cache(normalizada)
+        if respuesta is not None:
+            yield respuesta
+            return
+
+        vuelo, lider = self._registrar_vuelo(normalizada)
+        if not lider:
+            vuelo.evento.wait()
+            if vuelo.respuesta is not None:
+                yield vuelo.respuesta
+            else:
+                # El líder se interrumpió (p. ej. el cliente cerró la conexión): consultar por cuenta propia
+                yield from self._llamar_backend_flujo(consulta, normalizada)
+            return
+
+        try:
+            partes = []
+            for fragmento in self._llamar_backend_flujo(consulta, normalizada):
+                partes.append(fragmento)
+                yield fragmento
+            vuelo.respuesta = ''.join(partes)
+        finally:
+            self._cerrar_vuelo(normalizada, vuelo)
+
+    async def consultar_flujo_async(self, consulta):
+        """Versión asyncio de consultar_flujo() para el modo ASGI.
+
+        Con un backend asíncrono no ocupa un hilo mientras espera al LLM ni a una consulta
+        idéntica en vuelo; solo las lecturas y escrituras de la caché (Redis es síncrono) pasan
+        por el pool de hilos.
+        """
+        self._contar('solicitudes')
+        normalizada = normalizar_consulta(consulta)
+        respuesta = await asyncio.to_thread(self._buscar_en_cache, normalizada)
+        if respuesta is not None:
+            yield respuesta
+            return
+
+        vuelo, lider = self._registrar_vuelo(normalizada)
+        if not lider:
+            await vuelo.esperar_async()
+            if vuelo.respuesta is not None:
+                yield vuelo.respuesta
+            else:
+                async for fragmento in self._llamar_backend_flujo_async(consulta, normalizada):
+                    yield fragmento
+            return
+
+        try:
+            partes = []
+            async for fragmento in self._llamar_backend_flujo_async(consulta, normalizada):
+                partes.append(fragmento)
+                yield fragmento
+            vuelo.respuesta = ''.join(partes)
+        finally:
+            self._cerrar_vuelo(normalizada, vuelo)
+
+    def _llamar_backend_flujo(self, consulta, normalizada):
+        if self.backend is None:
+            self.init_app(current_app)
+        if not hasattr(self.backend, 'completar_flujo'):
+            yield self._llamar_backend(consulta, normalizada)
+            return
+        self._contar('llamadas_backend')
+        partes = []
+        inicio = time.perf_counter()
+        try:
+            for fragmento in self.backend.completar_flujo(consulta):
+                partes.append(fragmento)
+                yield fragmento
+        except Exception as e:
+            yield self._mensaje_error(e, partes)
+            return
+        finally:
+            metricas.etapas.observar(time.perf_counter() - inicio, etapa='llm')
+        self.cache.guardar(normalizada, ''.join(partes))
+
+    async def _llamar_backend_flujo_async(self, consulta, normalizada):
+        if not hasattr(self.backend, 'completar_flujo_async'):
+            # Backend sin cliente asíncrono: se consulta en un hilo del pool por defecto
+            yield await asyncio.to_thread(self._llamar_backend, consulta, normalizada)
+            return
+        self._contar('llamadas_backend')
+        partes = []
+        inicio = time.perf_counter()
+        try:
+            async for fragmento in self.backend.completar_flujo_async(consulta):
+                partes.append(fragmento)
+                yield fragmento
+        except Exception as e:
+            yield self._mensaje_error(e, partes)
+            return
+        finally:
+            metricas.etapas.observar(time.perf_counter() - inicio, etapa='llm')
+        await asyncio.to_thread(self.cache.guardar, normalizada, ''.join(partes))
+
+    def _mensaje_error(self, error, partes):
+        self._contar('errores')
+        if isinstance(error, ErrorLimiteLLM):
+            mensaje = MENSAJE_LIMITE
+        else:
+            # El flujo asíncrono se consume fuera del contexto de la aplicación: se usa la app de init_app
+            (self.app or current_app).logger.error(f"Error al consultar el LLM: {error}")
+            mensaje = MENSAJE_ERROR
+        return mensaje if not partes else ' ' + mensaje
+
+    def _llamar_backend(self, consulta, normalizada):
+        if self.backend is None:
+            self.init_app(current_app)
+        self._contar('llamadas_backend')
+        try:
+            with metricas.medir('llm'):
+                respuesta = self.backend.completar(consulta)
+        except Exception as e:
+            return self._mensaje_error(e, [])
+        self.cache.guardar(normalizada, respuesta)
+        return respuesta
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self._contadores)
+        aciertos = datos['aciertos_exactos'] + datos['aciertos_similares']
+        datos['tasa_aciertos'] = (aciertos / datos['solicitudes']) if datos['solicitudes'] else 0.0
+        return datos
+
+
+class RespuestaLLM:
+    """Respuesta del LLM envuelta entre un prefijo y un sufijo fijos.
+
+    Se puede recorrer con 'for' (WSGI) o con 'async for' (ASGI); el fragmento del medio
+    llega del gateway a medida que el LLM lo genera.
+    """
+
+    def __init__(self, consulta, prefijo='', sufijo='', gateway=None):
+        self.consulta = consulta
+        self.prefijo = prefijo
+        self.sufijo = sufijo
+        self.gateway = gateway or gateway_llm
+
+    def __iter__(self):
+        yield self.prefijo
+        yield from self.gateway.consultar_flujo(self.consulta)
+        yield self.sufijo
+
+    async def __aiter__(self):
+        yield self.prefijo
+        async for fragmento in self.gateway.consultar_flujo_async(self.consulta):
+            yield fragmento
+        yield self.sufijo
+
+
+gateway_llm = GatewayLLM()
+
+
+@metricas.registro.colector
+def _metricas_gateway():
+    datos = gateway_llm.estadisticas()
+    return [
+        ('llm_consultas_total', 'counter', 'Consultas al gateway LLM por resultado.',
+         [({'resultado': clave}, datos[clave]) for clave in sorted(datos) if clave != 'tasa_aciertos']),
+        ('llm_tasa_aciertos_cache', 'gauge', 'Fracción de consultas resueltas desde la caché.',
+         [({}, datos['tasa_aciertos'])]),
+    ]
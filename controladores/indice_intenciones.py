@@ -0,0 +1,108 @@
+import os
+import threading
+from controladores.metricas import medir
+from controladores.normalizacion import normalizar_intencion
+
+# Directorio donde se encuentran los corpus de intenciones
+DATOS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datos')
+# Directorio por defecto de los artefactos precalculados (python manage.py construir-indices)
+INDICES_DIR = os.path.join(DATOS_DIR, 'indices')
+
+
+class _Snapshot:
+    """Estado inmutable de un índice ya vectorizado."""
+    __slots__ = ('mtime', 'claves', 'valores', 'buscador')
+
+    def __init__(self, mtime, claves, valores, buscador):
+        self.mtime = mtime
+        self.claves = claves
+        self.valores = valores
+        self.buscador = buscador
+
+
+class IndiceIntenciones:
+    """Índice de un corpus 'clave: valor' que se recarga al cambiar el archivo.
+
+    El buscador ('tfidf', 'invertido' o 'ngramas', ver controladores.buscadores) se abre con
+    mmap desde el artefacto precalculado si existe y está al día, o se construye una sola vez
+    por worker. Se reemplaza de forma atómica cuando cambia el mtime del archivo de origen o
+    el buscador configurado.
+    """
+
+    def __init__(self, ruta, cargador, campo='claves', normalizador=None, buscador='tfidf', artefactos=INDICES_DIR):
+        self.ruta = ruta
+        self.nombre = os.path.splitext(os.path.basename(ruta))[0]
+        self.cargador = cargador
+        self.campo = campo
+        self.normalizador = normalizador or normalizar_intencion
+        self.nombre_buscador = buscador
+        self.artefactos = artefactos
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, opcion_buscador=None):
+        """Toma de la configuración el directorio de artefactos y, si se indica, la opción del buscador."""
+        self.artefactos = app.config.get('INDICES_DIR', self.artefactos)
+        nombre = app.config.get(opcion_buscador) if opcion_buscador else None
+        if nombre:
+            self.nombre_buscador = nombre
+        self._snapshot = None
+
+    @property
+    def buscador(self):
+        # numpy y scipy se importan al construir el primer índice, no al arrancar el worker
+        from controladores.buscadores import obtener_buscador
+        return obtener_buscador(self.nombre_buscador)
+
+    def _mtime(self):
+        try:
+            return os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return None
+
+    def _construir(self, mtime):
+        if self.artefactos:
+            from controladores import artefacto_indices
+            cargado = artefacto_indices.cargar(self, self.artefactos)
+            if cargado is not None:
+                return _Snapshot(mtime, *cargado)
+        datos = self.cargador(self.ruta)
+        claves = list(datos.keys())
+        valores = list(datos.values())
+        docs = claves if self.campo == 'claves' else valores
+        if not docs:
+            return _Snapshot(mtime, claves, valores, None)
+        return _Snapshot(mtime, claves, valores, self.buscador.ajustar([self.normalizador(doc) for doc in docs]))
+
+    def obtener(self):
+        """Devuelve el snapshot vigente, reconstruyéndolo si el archivo cambió."""
+        snapshot = self._snapshot
+        mtime = self._mtime()
+        if snapshot is not None and snapshot.mtime == mtime:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.mtime != mtime:
+                with medir('carga_indice'):
+                    snapshot = self._construir(mtime)
+                self._snapshot = snapshot
+        return snapshot
+
+    def buscar(self, consulta):
+        """Devuelve (snapshot, posición, similitud) del documento más parecido."""
+        snapshot = self.obtener()
+        if snapshot.buscador is None:
+            return snapshot, None, 0
+        resultado = snapshot.buscador.buscar(self.normalizador(consulta))
+        if not resultado:
+            return snapshot, None, 0
+        index, similitud = resultado[0]
+        return snapshot, index, similitud
+
+    def buscar_lote(self, consultas, top_k=1, tamano_bloque=1000):
+        """Devuelve, por consulta, una lista de (posición, similitud) con los top_k resultados."""
+        snapshot = self.obtener()
+        if snapshot.buscador is None or not consultas:
+            return snapshot, [[] for _ in consultas]
+        normalizadas = [self.normalizador(consulta) for consulta in consultas]
+        return snapshot, snapshot.buscador.buscar_lote(normalizadas, top_k, tamano_bloque)
@@ -0,0 +1,136 @@
+class Turno:
+    """Resultado de un manejador de estado.
+
+    Si 'flujo' es un iterable de fragmentos, la respuesta se genera de forma incremental:
+    'respuesta' tiene el texto completo solo después de consumir fragmentos() o completar().
+    """
+    __slots__ = ('respuesta', 'es_exitosa', 'mensaje_registro', 'finalizar', 'flujo', '_al_completar')
+
+    def __init__(self, respuesta, es_exitosa=False, mensaje_registro=None, finalizar=False, flujo=None):
+        self.respuesta = respuesta
+        self.es_exitosa = es_exitosa
+        self.mensaje_registro = mensaje_registro  # Texto a registrar en lugar del mensaje original
+        self.finalizar = finalizar  # True si la conversación termina en este turno
+        self.flujo = flujo
+        self._al_completar = []
+
+    def cuando_complete(self, funcion):
+        """Ejecuta funcion(turno) cuando la respuesta completa está disponible."""
+        if self.flujo is None:
+            funcion(self)
+        else:
+            self._al_completar.append(funcion)
+
+    def fragmentos(self):
+        if self.flujo is None:
+            yield self.respuesta
+            return
+        partes = []
+        for fragmento in self.flujo:
+            partes.append(fragmento)
+            yield fragmento
+        self.terminar(partes)
+
+    def terminar(self, partes):
+        """Fija la respuesta completa a partir de los fragmentos enviados y ejecuta cuando_complete()."""
+        self.respuesta = ''.join(partes)
+        self.flujo = None
+        for funcion in self._al_completar:
+            funcion(self)
+        self._al_completar = []
+
+    def completar(self):
+        for _ in self.fragmentos():
+            pass
+        return self.respuesta
+
+
+class TransicionInvalida(Exception):
+    """Un manejador movió la conversación a un estado no declarado."""
+
+
+class MaquinaEstados:
+    """Despachador de la conversación basado en una tabla de manejadores por estado.
+
+    Cada estado declara los estados a los que puede pasar; permanecer en el mismo
+    estado siempre está permitido. Los ganchos 'antes' y 'despues' se ejecutan en
+    todos los turnos y son el único punto para registrar, persistir o medir.
+    """
+
+    def __init__(self, estado_inicial):
+        self.estado_inicial = estado_inicial
+        self._manejadores = {}
+        self._transiciones = {}
+        self._antes = []
+        self._despues = []
+
+    def estado(self, nombre, transiciones=()):
+        """Decorador que registra el manejador de un estado."""
+        def decorador(funcion):
+            if nombre in self._manejadores:
+                raise ValueError(f"El estado '{nombre}' ya tiene un manejador registrado")
+            self._manejadores[nombre] = funcion
+            self._transiciones[nombre] = frozenset(transiciones)
+            return funcion
+        return decorador
+
+    def antes(self, funcion):
+        """Registra un gancho funcion(contexto, mensaje) previo al manejador."""
+        self._antes.append(funcion)
+        return funcion
+
+    def despues(self, funcion):
+        """Registra un gancho funcion(contexto, mensaje, turno, estado_anterior) posterior al manejador."""
+        self._despues.append(funcion)
+        return funcion
+
+    @property
+    def estados(self):
+        return tuple(self._manejadores)
+
+    def transiciones(self, estado):
+        return self._transiciones[estado]
+
+    def verificar(self):
+        """Comprueba el grafo de transiciones y devuelve la lista de errores encontrados."""
+        errores = []
+        if self.estado_inicial not in self._manejadores:
+            errores.append(f"El estado inicial '{self.estado_inicial}' no tiene manejador")
+        for origen, destinos in self._transiciones.items():
+            for destino in sorted(destinos - set(self._manejadores)):
+                errores.append(f"'{origen}' declara una transición a '{destino}', que no tiene manejador")
+
+        alcanzables = set()
+        pendientes = [self.estado_inicial]
+        while pendientes:
+            estado = pendientes.pop()
+            if estado in alcanzables or estado not in self._transiciones:
+                continue
+            alcanzables.add(estado)
+            pendientes.extend(self._transiciones[estado])
+        for estado in self._manejadores:
+            if estado not in alcanzables:
+                errores.append(f"El estado '{estado}' no es alcanzable desde '{self.estado_inicial}'")
+        return errores
+
+    def despachar(self, contexto, mensaje):
+        """Ejecuta un turno sobre 'contexto' (que debe tener la clave 'estado') y devuelve el Turno."""
+        estado_anterior = contexto["estado"]
+        manejador = self._manejadores.get(estado_anterior)
+        if manejador is None:
+            # Estado desconocido (p. ej. una sesión antigua): reiniciar la conversación
+            estado_anterior = contexto["estado"] = self.estado_inicial
+            manejador = self._manejadores[estado_anterior]
+
+        for gancho in self._antes:
+            gancho(contexto, mensaje)
+
+        turno = manejador(contexto, mensaje)
+
+        estado_nuevo = contexto["estado"]
+        if estado_nuevo != estado_anterior and estado_nuevo not in self._transiciones[estado_anterior]:
+            raise TransicionInvalida(f"Transición no declarada: '{estado_anterior}' -> '{estado_nuevo}'")
+
+        for gancho in self._despues:
+            gancho(contexto, mensaje, turno, estado_anterior)
+        return turno
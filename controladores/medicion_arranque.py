@@ -0,0 +1,108 @@
+"""Medición del arranque en frío de un worker web.
+
+Cada repetición lanza un intérprete nuevo que importa app.py, llama a create_app y hace
+una primera búsqueda de intenciones, como haría un worker de gunicorn recién creado. Se
+informa la mediana de cada etapa, la memoria residente y qué dependencias pesadas ya
+estaban cargadas al terminar create_app, antes de atender ninguna solicitud. Se ejecuta con
+'python manage.py medir-arranque'.
+"""
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dependencias que solo deben importarse cuando se usan
+MODULOS_PESADOS = ('flask_migrate', 'alembic', 'sklearn', 'pandas', 'openpyxl', 'openai', 'sendgrid',
+                   'httpx', 'requests', 'xlsxwriter', 'numpy', 'scipy')
+_PATRON_IMPORTTIME = re.compile(r'import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)')
+
+_SCRIPT = '''
+import json, resource, sys, time
+inicio = time.perf_counter()
+sys.path.insert(0, {raiz!r})
+from app import create_app
+importado = time.perf_counter()
+app = create_app({config!r})
+creado = time.perf_counter()
+cargados = [modulo for modulo in {pesados!r} if modulo in sys.modules]
+from controladores.conversacion import indice_problemas
+indice_problemas.buscar('mi auto no tiene fuerza')
+buscado = time.perf_counter()
+print(json.dumps({{
+    'importar_s': importado - inicio,
+    'crear_app_s': creado - importado,
+    'primera_busqueda_s': buscado - creado,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'cargados': cargados,
+}}))
+'''
+
+
+def _importaciones(stderr, limite):
+    """Paquetes de primer nivel que más tiempo acumulado tardaron en importarse (-X importtime)."""
+    por_paquete = {}
+    for linea in stderr.splitlines():
+        coincidencia = _PATRON_IMPORTTIME.match(linea)
+        if coincidencia:
+            paquete = coincidencia.group(3).split('.')[0]
+            por_paquete[paquete] = max(por_paquete.get(paquete, 0), int(coincidencia.group(1)))
+    por_paquete.pop('app', None)
+    ordenados = sorted(por_paquete.items(), key=lambda par: par[1], reverse=True)[:limite]
+    return [(paquete, microsegundos / 1e6) for paquete, microsegundos in ordenados]
+
+
+def medir_una_vez(config='prod', importaciones=0):
+    entorno = dict(os.environ)
+    # Sin base configurada basta una SQLite en archivo: el arranque no abre conexiones
+    entorno.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'medir-arranque.db'))
+    entorno.pop('FLASK_RUN_FROM_CLI', None)  # Como un worker de gunicorn, no como un comando flask
+    comando = [sys.executable]
+    if importaciones:
+        comando += ['-X', 'importtime']
+    comando += ['-c', _SCRIPT.format(raiz=RAIZ, config=config, pesados=MODULOS_PESADOS)]
+    proceso = subprocess.run(comando, cwd=RAIZ, env=entorno, capture_output=True, text=True)
+    if proceso.returncode != 0:
+        raise RuntimeError(f'El arranque falló:\n{proceso.stderr[-2000:]}')
+    datos = json.loads(proceso.stdout.strip().splitlines()[-1])
+    if importaciones:
+        datos['importaciones'] = _importaciones(proceso.stderr, importaciones)
+    return datos
+
+
+def medir_arranque(repeticiones=5, config='prod', importaciones=0):
+    """Mediana de 'repeticiones' arranques en frío; la primera se descarta si hay más de una."""
+    corridas = [medir_una_vez(config) for _ in range(repeticiones + (1 if repeticiones > 1 else 0))]
+    if repeticiones > 1:
+        corridas = corridas[1:]  # La primera paga la caché de disco de los .pyc
+    informe = {
+        'config': config,
+        'repeticiones': len(corridas),
+        'cargados': corridas[-1]['cargados'],
+    }
+    for clave in ('importar_s', 'crear_app_s', 'primera_busqueda_s', 'rss_mb'):
+        informe[clave] = statistics.median(corrida[clave] for corrida in corridas)
+    if importaciones:
+        informe['importaciones'] = medir_una_vez(config, importaciones)['importaciones']
+    return informe
+
+
+def formatear_informe(datos):
+    total = datos['importar_s'] + datos['crear_app_s']
+    lineas = [
+        f"Arranque en frío (config {datos['config']}, mediana de {datos['repeticiones']})",
+        f"  importar app.py      {datos['importar_s'] * 1000:8.0f} ms",
+        f"  create_app           {datos['crear_app_s'] * 1000:8.0f} ms",
+        f"  listo para atender   {total * 1000:8.0f} ms",
+        f"  primera búsqueda     {datos['primera_busqueda_s'] * 1000:8.0f} ms",
+        f"  memoria residente    {datos['rss_mb']:8.0f} MB",
+        f"  dependencias pesadas cargadas: {', '.join(datos['cargados']) or 'ninguna'}",
+    ]
+    if datos.get('importaciones'):
+        lineas.append('')
+        lineas.append('Importaciones más lentas (tiempo acumulado):')
+        lineas += [f'  {paquete:<24}{segundos * 1000:8.1f} ms' for paquete, segundos in datos['importaciones']]
+    return '\n'.join(lineas)
@@ -0,0 +1,220 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LIMITES_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _formatear_etiquetas(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+def _formatear_numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def muestras(self):
+        with self._lock:
+            valores = dict(self._valores)
+        return [(self.nombre + _formatear_etiquetas(self.etiquetas, clave), valor)
+                for clave, valor in sorted(valores.items())]
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}  # etiquetas -> [conteos por cubeta..., suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+        cubeta = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [0] * (len(self.limites) + 1) + [0.0, 0]
+            serie[cubeta] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def muestras(self):
+        with self._lock:
+            series = {clave: list(serie) for clave, serie in self._series.items()}
+        lineas = []
+        for clave, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.limites + (float('inf'),), serie):
+                acumulado += conteo
+                lineas.append((self.nombre + '_bucket' + _formatear_etiquetas(
+                    self.etiquetas, clave, [('le', _formatear_numero(limite))]), acumulado))
+            lineas.append((self.nombre + '_sum' + _formatear_etiquetas(self.etiquetas, clave), serie[-2]))
+            lineas.append((self.nombre + '_count' + _formatear_etiquetas(self.etiquetas, clave), serie[-1]))
+        return lineas
+
+
+class RegistroMetricas:
+    """Métricas del proceso en formato de texto de Prometheus.
+
+    Cada worker de gunicorn tiene su propio registro; Prometheus debe consultar cada proceso
+    o sumar por instancia.
+    """
+
+    def __init__(self):
+        self._metricas = {}
+        self._colectores = []
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def colector(self, funcion):
+        """Registra funcion() -> [(nombre, tipo, ayuda, [(etiquetas_dict, valor)])] evaluada al exportar."""
+        self._colectores.append(funcion)
+        return funcion
+
+    def exportar(self):
+        lineas = []
+        for metrica in list(self._metricas.values()):
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(f'{nombre} {_formatear_numero(valor)}' for nombre, valor in metrica.muestras())
+        for colector in self._colectores:
+            for nombre, tipo, ayuda, muestras in colector():
+                lineas.append(f'# HELP {nombre} {ayuda}')
+                lineas.append(f'# TYPE {nombre} {tipo}')
+                for etiquetas, valor in muestras:
+                    lineas.append(f'{nombre}{_formatear_etiquetas(list(etiquetas), list(etiquetas.values()))} '
+                                  f'{_formatear_numero(valor)}')
+        return '\n'.join(lineas) + '\n'
+
+
+registro = RegistroMetricas()
+
+etapas = registro.histograma(
+    'chatbot_etapa_segundos', 'Duración de cada etapa del procesamiento de un mensaje.', ('etapa',))
+turnos = registro.histograma(
+    'chatbot_turno_segundos', 'Duración del manejador de cada estado de la conversación.', ('estado',))
+transiciones = registro.contador(
+    'chatbot_transiciones_total', 'Transiciones entre estados de la conversación.', ('origen', 'destino'))
+resultados_turno = registro.contador(
+    'chatbot_turnos_total', 'Turnos procesados por estado y resultado (es_exitosa).', ('estado', 'exitosa'))
+solicitudes = registro.histograma(
+    'http_solicitud_segundos', 'Duración de las solicitudes HTTP.', ('endpoint', 'metodo', 'codigo'))
+consultas_db = registro.histograma(
+    'db_consultas_por_solicitud', 'Consultas SQL ejecutadas por solicitud HTTP.', ('endpoint',), LIMITES_CONSULTAS)
+tiempo_db = registro.histograma(
+    'db_tiempo_por_solicitud_segundos', 'Tiempo total en consultas SQL por solicitud HTTP.', ('endpoint',))
+consulta_db = registro.histograma(
+    'db_consulta_segundos', 'Duración de cada consulta SQL.', ('operacion',))
+
+
+@contextmanager
+def medir(etapa):
+    """Mide el bloque y lo registra en chatbot_etapa_segundos{etapa=...}."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        etapas.observar(time.perf_counter() - inicio, etapa=etapa)
+
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metricas_inicio', []).append(time.perf_counter())
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    pila = conn.info.get('metricas_inicio')
+    if not pila:
+        return
+    duracion = time.perf_counter() - pila.pop()
+    operacion = statement.lstrip()[:6].upper()
+    consulta_db.observar(duracion, operacion=operacion if operacion.isalpha() else 'OTRA')
+    if has_app_context() and 'metricas_db' in g:
+        g.metricas_db[0] += 1
+        g.metricas_db[1] += duracion
+
+
+_eventos_registrados = False
+
+
+def _registrar_eventos_sqlalchemy():
+    global _eventos_registrados
+    if not _eventos_registrados:
+        # Sobre la clase Engine: aplica a todos los motores, incluidos los binds de Flask-SQLAlchemy
+        event.listen(Engine, 'before_cursor_execute', _antes_de_consulta)
+        event.listen(Engine, 'after_cursor_execute', _despues_de_consulta)
+        _eventos_registrados = True
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule is not None else 'no_encontrada'
+
+
+def init_app(app):
+    """Instrumenta solicitudes y consultas SQL y registra la ruta /metrics (METRICAS_HABILITADAS)."""
+    if not app.config.get('METRICAS_HABILITADAS', True):
+        return
+    _registrar_eventos_sqlalchemy()
+
+    @app.before_request
+    def _iniciar_medicion():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_db = [0, 0.0]
+
+    @app.after_request
+    def _registrar_solicitud(response):
+        if 'metricas_inicio' in g:
+            endpoint = _endpoint()
+            solicitudes.observar(time.perf_counter() - g.metricas_inicio, endpoint=endpoint,
+                                 metodo=request.method, codigo=response.status_code)
+            consultas_db.observar(g.metricas_db[0], endpoint=endpoint)
+            tiempo_db.observar(g.metricas_db[1], endpoint=endpoint)
+        return response
+
+    def metricas():
+        return Response(registro.exportar(), mimetype=None, content_type=TIPO_CONTENIDO)
+
+    app.add_url_rule('/metrics', 'metricas', metricas)
+    app.extensions['metricas'] = registro
@@ -0,0 +1,252 @@
+import json
+import os
+import smtplib
+import socket
+import threading
+import time
+import uuid
+import redis
+from datetime import datetime
+from email.mime.text import MIMEText
+from flask import current_app
+from controladores.redis_cliente import obtener_redis
+from controladores.metricas import medir
+
+COLA_PENDIENTES = 'notificaciones:pendientes'
+COLA_REINTENTOS = 'notificaciones:reintentos'
+COLA_FALLIDAS = 'notificaciones:fallidas'
+# Cada trabajador mueve el mensaje que está enviando a su propia lista 'procesando'; si el
+# proceso muere antes de terminar, el mensaje sigue ahí y se recupera al reiniciar
+PREFIJO_PROCESANDO = 'notificaciones:procesando:'
+# Hash nombre -> último latido de cada trabajador; sus listas 'procesando' se recuperan si dejan de latir
+TRABAJADORES = 'notificaciones:trabajadores'
+TRABAJADOR_INACTIVO_SEGUNDOS = 300
+
+
+class ErrorTransporte(Exception):
+    """El transporte no pudo entregar el mensaje."""
+
+
+class TransporteSendGrid:
+    def __init__(self, api_key, remitente):
+        self.api_key = api_key
+        self.remitente = remitente
+        self._cliente = None
+
+    def enviar(self, mensaje):
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail
+        if self._cliente is None:
+            self._cliente = SendGridAPIClient(self.api_key)
+        correo = Mail(
+            from_email=self.remitente,
+            to_emails=mensaje['destinatario'],
+            subject=mensaje['asunto'],
+            html_content=mensaje['contenido_html'])
+        try:
+            response = self._cliente.send(correo)
+        except Exception as e:
+            raise ErrorTransporte(str(e)) from e
+        if response.status_code >= 300:
+            raise ErrorTransporte(f"SendGrid respondió {response.status_code}: {response.body}")
+
+
+class TransporteSMTP:
+    """Envío por SMTP; con un servidor sumidero local (p. ej. aiosmtpd o MailHog) sirve para pruebas."""
+
+    def __init__(self, host, puerto, remitente, timeout=10):
+        self.host = host
+        self.puerto = puerto
+        self.remitente = remitente
+        self.timeout = timeout
+
+    def enviar(self, mensaje):
+        correo = MIMEText(mensaje['contenido_html'], 'html', 'utf-8')
+        correo['Subject'] = mensaje['asunto']
+        correo['From'] = self.remitente
+        correo['To'] = mensaje['destinatario']
+        try:
+            with smtplib.SMTP(self.host, self.puerto, timeout=self.timeout) as servidor:
+                servidor.send_message(correo)
+        except (OSError, smtplib.SMTPException) as e:
+            raise ErrorTransporte(str(e)) from e
+
+
+class TransporteArchivo:
+    """Escribe cada mensaje como una línea JSON; útil en desarrollo y pruebas."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def enviar(self, mensaje):
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._lock, open(self.ruta, 'a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps(mensaje, ensure_ascii=False) + '\n')
+
+
+# Función para construir el transporte configurado en NOTIFICACIONES_TRANSPORTE
+def obtener_transporte(app=None):
+    app = app or current_app
+    transporte = app.extensions.get('transporte_notificaciones')
+    if transporte is None:
+        tipo = app.config.get('NOTIFICACIONES_TRANSPORTE', 'sendgrid')
+        remitente = app.config['NOTIFICACIONES_REMITENTE']
+        if tipo == 'archivo':
+            transporte = TransporteArchivo(app.config['NOTIFICACIONES_ARCHIVO'])
+        elif tipo == 'smtp':
+            transporte = TransporteSMTP(app.config['NOTIFICACIONES_SMTP_HOST'], app.config['NOTIFICACIONES_SMTP_PUERTO'], remitente)
+        else:
+            transporte = TransporteSendGrid(app.config.get('SENDGRID_API_KEY'), remitente)
+        app.extensions['transporte_notificaciones'] = transporte
+    return transporte
+
+
+# Función para encolar un correo; el request nunca espera al proveedor de correo
+def encolar_correo(destinatario, asunto, contenido_html):
+    mensaje = {
+        'id': uuid.uuid4().hex,
+        'tipo': 'correo',
+        'destinatario': destinatario,
+        'asunto': asunto,
+        'contenido_html': contenido_html,
+        'intentos': 0,
+        'creado': datetime.now().isoformat(),
+    }
+    cliente = obtener_redis()
+    if cliente is not None:
+        cliente.lpush(COLA_PENDIENTES, json.dumps(mensaje))
+        return mensaje['id']
+
+    # Sin Redis: enviar en un hilo aparte para no bloquear el turno del chat
+    app = current_app._get_current_object()
+
+    def enviar_en_segundo_plano():
+        try:
+            obtener_transporte(app).enviar(mensaje)
+        except Exception as e:
+            app.logger.error(f"Error al enviar la notificación {mensaje['id']}: {e}")
+
+    threading.Thread(target=enviar_en_segundo_plano, name='notificacion', daemon=True).start()
+    return mensaje['id']
+
+
+def nombre_trabajador():
+    """Nombre único del proceso: DYNO en Heroku ('worker.1') o el host, más el PID."""
+    return f"{os.environ.get('DYNO') or socket.gethostname()}:{os.getpid()}"
+
+
+class TrabajadorNotificaciones:
+    """Procesa la cola de notificaciones con reintentos exponenciales y lista de mensajes fallidos.
+
+    Los mensajes se toman con BRPOPLPUSH hacia la lista 'procesando' del trabajador y solo se
+    retiran de ella (LREM) después de enviarlos o de reprogramarlos, así que una caída entre
+    la lectura y el envío no pierde el correo. Cada trabajador registra un latido en
+    TRABAJADORES; al arrancar, recuperar_pendientes() devuelve a la cola lo que quedó en su
+    propia lista y en las de los trabajadores que llevan TRABAJADOR_INACTIVO_SEGUNDOS sin latir.
+    """
+
+    def __init__(self, app, transporte=None, nombre=None):
+        self.app = app
+        self.redis = obtener_redis(app)
+        self.transporte = transporte or obtener_transporte(app)
+        self.max_intentos = app.config.get('NOTIFICACIONES_MAX_INTENTOS', 5)
+        self.backoff = app.config.get('NOTIFICACIONES_BACKOFF_SEGUNDOS', 30)
+        self.nombre = nombre or nombre_trabajador()
+        self.cola_procesando = PREFIJO_PROCESANDO + self.nombre
+
+    def _latido(self):
+        self.redis.hset(TRABAJADORES, self.nombre, time.time())
+
+    def _vaciar(self, cola_procesando):
+        recuperados = 0
+        while self.redis.rpoplpush(cola_procesando, COLA_PENDIENTES) is not None:
+            recuperados += 1
+        if recuperados:
+            self.app.logger.warning(f"{recuperados} notificaciones recuperadas de {cola_procesando}")
+        return recuperados
+
+    def recuperar_pendientes(self):
+        """Devuelve a la cola los mensajes que quedaron en 'procesando' tras una caída; retorna cuántos."""
+        recuperados = self._vaciar(self.cola_procesando)
+        limite = time.time() - TRABAJADOR_INACTIVO_SEGUNDOS
+        for nombre, latido in self.redis.hgetall(TRABAJADORES).items():
+            nombre = nombre.decode('utf-8')
+            if nombre == self.nombre or float(latido) >= limite:
+                continue
+            recuperados += self._vaciar(PREFIJO_PROCESANDO + nombre)
+            self.redis.hdel(TRABAJADORES, nombre)
+        self._latido()
+        return recuperados
+
+    def _promover_reintentos(self):
+        """Mueve a la cola principal los reintentos cuyo tiempo de espera ya venció."""
+        vencidos = self.redis.zrangebyscore(COLA_REINTENTOS, 0, time.time())
+        for crudo in vencidos:
+            # ZREM devuelve 1 solo para el trabajador que lo retira, evitando duplicados entre procesos
+            if self.redis.zrem(COLA_REINTENTOS, crudo):
+                self.redis.lpush(COLA_PENDIENTES, crudo)
+
+    def _terminar(self, crudo, cola=None, valor=None, puntaje=None):
+        """Retira 'crudo' de 'procesando' y, en la misma transacción, lo deja en fallidas o reintentos."""
+        pipe = self.redis.pipeline()
+        if cola == COLA_FALLIDAS:
+            pipe.lpush(COLA_FALLIDAS, valor)
+        elif cola == COLA_REINTENTOS:
+            pipe.zadd(COLA_REINTENTOS, {valor: puntaje})
+        pipe.lrem(self.cola_procesando, 1, crudo)
+        pipe.execute()
+
+    def _procesar(self, crudo):
+        try:
+            mensaje = json.loads(crudo)
+            if not isinstance(mensaje, dict):
+                raise ValueError('el mensaje no es un objeto JSON')
+        except ValueError as e:
+            self._terminar(crudo, COLA_FALLIDAS, crudo)
+            self.app.logger.error(f"Notificación ilegible enviada a fallidas: {e}")
+            return False
+        try:
+            with medir('correo_envio'):
+                self.transporte.enviar(mensaje)
+        except Exception as e:
+            mensaje['intentos'] = mensaje.get('intentos', 0) + 1
+            mensaje['ultimo_error'] = str(e)
+            if mensaje['intentos'] >= self.max_intentos:
+                self._terminar(crudo, COLA_FALLIDAS, json.dumps(mensaje))
+                self.app.logger.error(f"Notificación {mensaje.get('id')} enviada a fallidas tras {mensaje['intentos']} intentos: {e}")
+            else:
+                espera = self.backoff * (2 ** (mensaje['intentos'] - 1))
+                self._terminar(crudo, COLA_REINTENTOS, json.dumps(mensaje), time.time() + espera)
+                self.app.logger.warning(f"Notificación {mensaje.get('id')} reintentará en {espera}s: {e}")
+            return False
+        self._terminar(crudo)
+        return True
+
+    def procesar_una_vez(self, timeout=1):
+        """Procesa como máximo un mensaje; devuelve None si la cola estaba vacía."""
+        self._latido()
+        self._promover_reintentos()
+        crudo = self.redis.brpoplpush(COLA_PENDIENTES, self.cola_procesando, timeout=timeout)
+        if crudo is None:
+            return None
+        return self._procesar(crudo)
+
+    def ejecutar(self, detener=None, espera_maxima=60):
+        """Procesa la cola hasta que se active 'detener'; si Redis falla, reintenta con espera exponencial."""
+        detener = detener or threading.Event()
+        recuperado = False
+        espera = 1
+        while not detener.is_set():
+            try:
+                if not recuperado:
+                    self.recuperar_pendientes()
+                    recuperado = True
+                self.procesar_una_vez()
+                espera = 1
+            except redis.RedisError as e:
+                self.app.logger.error(f"Error de Redis en el trabajador de notificaciones, reintento en {espera}s: {e}")
+                detener.wait(espera)
+                espera = min(espera * 2, espera_maxima)
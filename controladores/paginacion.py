@@ -0,0 +1,107 @@
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+
+POR_PAGINA = 25
+POR_PAGINA_MAXIMO = 100
+
+
+class Pagina:
+    """Resultado de una página por keyset; 'siguiente' y 'anterior' son cursores opacos o None."""
+
+    def __init__(self, elementos, siguiente, anterior, orden, direccion, por_pagina):
+        self.elementos = elementos
+        self.siguiente = siguiente
+        self.anterior = anterior
+        self.orden = orden
+        self.direccion = direccion
+        self.por_pagina = por_pagina
+
+    def __iter__(self):
+        return iter(self.elementos)
+
+    def __len__(self):
+        return len(self.elementos)
+
+
+def _a_json(valor):
+    return valor.isoformat() if isinstance(valor, (date, datetime)) else valor
+
+
+def _desde_json(columna, valor):
+    tipo = columna.type.python_type
+    if valor is not None and tipo in (date, datetime):
+        return tipo.fromisoformat(valor)
+    return valor
+
+
+def codificar_cursor(valor, id):
+    crudo = json.dumps([_a_json(valor), id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, columna):
+    """Devuelve (valor, id) o None si el cursor no es válido."""
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valor, id = json.loads(crudo)
+        return _desde_json(columna, valor), int(id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _posterior(columna, columna_id, valor, id, descendente):
+    # (columna, id) estrictamente después de (valor, id) en el orden pedido
+    if descendente:
+        return or_(columna < valor, and_(columna == valor, columna_id < id))
+    return or_(columna > valor, and_(columna == valor, columna_id > id))
+
+
+def paginar(consulta, columnas, columna_id, args, orden_defecto='id', direccion_defecto='asc'):
+    """Pagina 'consulta' por keyset sobre (columna de orden, id).
+
+    'columnas' mapea los nombres admitidos en ?orden= a columnas NOT NULL (con NULL el keyset
+    saltaría filas). Lee orden, dir, por_pagina y el cursor 'despues' o 'antes' de 'args';
+    un cursor inválido se ignora y se vuelve a la primera página. Cada página cuesta una
+    consulta con LIMIT que usa el índice de la columna de orden, sin OFFSET.
+    """
+    orden = args.get('orden') if args.get('orden') in columnas else orden_defecto
+    direccion = args.get('dir') if args.get('dir') in ('asc', 'desc') else direccion_defecto
+    try:
+        por_pagina = min(max(int(args.get('por_pagina', POR_PAGINA)), 1), POR_PAGINA_MAXIMO)
+    except ValueError:
+        por_pagina = POR_PAGINA
+    columna = columnas[orden]
+    descendente = direccion == 'desc'
+
+    despues = args.get('despues')
+    antes = args.get('antes')
+    clave = decodificar_cursor(despues or antes, columna) if (despues or antes) else None
+    hacia_atras = clave is not None and not despues
+
+    # Hacia atrás se recorre en el orden inverso y luego se invierte la página
+    invertir = descendente != hacia_atras
+    if clave is not None:
+        consulta = consulta.filter(_posterior(columna, columna_id, clave[0], clave[1], invertir))
+    if invertir:
+        consulta = consulta.order_by(columna.desc(), columna_id.desc())
+    else:
+        consulta = consulta.order_by(columna.asc(), columna_id.asc())
+    filas = consulta.limit(por_pagina + 1).all()
+
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if hacia_atras:
+        filas.reverse()
+
+    def cursor(fila):
+        return codificar_cursor(getattr(fila, columna.key), getattr(fila, columna_id.key))
+
+    siguiente = anterior = None
+    if filas:
+        if hay_mas or hacia_atras:
+            siguiente = cursor(filas[-1])
+        if clave is not None and (hay_mas or not hacia_atras):
+            anterior = cursor(filas[0])
+    return Pagina(filas, siguiente, anterior, orden, direccion, por_pagina)
@@ -0,0 +1,98 @@
+import socket
+import threading
+import redis
+from datetime import date, datetime, timedelta
+from modelos.models import db, Servicio, EjecucionPlanificador
+from controladores.slots import generar_slots
+from controladores.disponibilidad import invalidar_disponibilidad
+from controladores.redis_cliente import obtener_redis
+
+
+# Función para mantener un horizonte móvil de slots para todos los servicios
+def aprovisionar_slots(dias, desde=None):
+    """Genera los slots faltantes de los próximos 'dias' días y registra la ejecución."""
+    fecha_desde = desde or date.today()
+    fecha_hasta = fecha_desde + timedelta(days=dias - 1)
+    ejecucion = EjecucionPlanificador(
+        tarea='aprovisionar_slots',
+        tiempo_inicio=datetime.now(),
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta
+    )
+    try:
+        servicio_ids = [servicio_id for (servicio_id,) in db.session.query(Servicio.id)]
+        ejecucion.servicios = len(servicio_ids)
+        ejecucion.slots_creados = generar_slots(servicio_ids, fecha_desde, fecha_hasta, commit=False) if servicio_ids else 0
+        ejecucion.exitosa = True
+    except Exception as e:
+        db.session.rollback()
+        ejecucion.servicios = ejecucion.servicios or 0
+        ejecucion.slots_creados = 0
+        ejecucion.exitosa = False
+        ejecucion.error = str(e)
+    ejecucion.tiempo_fin = datetime.now()
+    db.session.add(ejecucion)
+    db.session.commit()
+    if ejecucion.slots_creados:
+        invalidar_disponibilidad(servicio_ids, fecha_desde, fecha_hasta)
+    return ejecucion
+
+
+class PlanificadorSlots:
+    """Ejecuta aprovisionar_slots periódicamente en su propio proceso.
+
+    No se inicia con la aplicación: create_app también corre en cada worker de gunicorn, en la
+    fase release y en los comandos CLI. Lo lanza 'python manage.py planificador-slots' (proceso
+    'planificador' del Procfile) cada SLOTS_PLANIFICADOR_INTERVALO_MIN minutos. Con Redis, un
+    candado con la duración del intervalo evita ejecuciones repetidas si hay más de una instancia.
+    """
+
+    CLAVE_CANDADO = 'planificador_slots:candado'
+
+    def __init__(self):
+        self._app = None
+        self._detener = threading.Event()
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['planificador_slots'] = self
+
+    def detener(self):
+        self._detener.set()
+
+    def _tomar_turno(self, intervalo):
+        """True si esta instancia debe ejecutar la ronda actual."""
+        cliente = obtener_redis(self._app)
+        if cliente is None:
+            return True
+        try:
+            return bool(cliente.set(self.CLAVE_CANDADO, socket.gethostname(), nx=True, ex=max(int(intervalo) - 1, 1)))
+        except redis.RedisError as e:
+            self._app.logger.warning(f"Planificador de slots sin candado en Redis: {e}")
+            return True
+
+    def ejecutar_una_vez(self, intervalo=None):
+        """Aprovisiona los slots si le toca a esta instancia; devuelve la ejecución o None."""
+        intervalo = intervalo or self._app.config['SLOTS_PLANIFICADOR_INTERVALO_MIN'] * 60
+        if not self._tomar_turno(intervalo):
+            return None
+        with self._app.app_context():
+            try:
+                ejecucion = aprovisionar_slots(self._app.config['SLOTS_HORIZONTE_DIAS'])
+                self._app.logger.info(f"Planificador de slots: {ejecucion.slots_creados} slots creados")
+                return ejecucion
+            finally:
+                db.session.remove()
+
+    def ejecutar(self, detener=None):
+        detener = detener or self._detener
+        intervalo = self._app.config['SLOTS_PLANIFICADOR_INTERVALO_MIN'] * 60
+        while not detener.is_set():
+            try:
+                self.ejecutar_una_vez(intervalo)
+            except Exception as e:
+                self._app.logger.error(f"Error en el planificador de slots: {e}")
+            detener.wait(intervalo)
+
+
+planificador_slots = PlanificadorSlots()
@@ -0,0 +1,246 @@
+"""Prueba de carga del chatbot con conversaciones simuladas.
+
+Construye una aplicación aislada (SQLite temporal, LLM falso y correos a archivo, sin Redis)
+y ejecuta conversaciones completas en paralelo, midiendo la latencia de cada turno según el
+estado de la conversación en el que se procesó. Se ejecuta con 'python manage.py prueba-carga'.
+"""
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from flask import Flask
+from config import config_by_name
+from modelos.models import db, Servicio, Usuario, Vehiculo
+from controladores.conversacion import procesar_mensaje, cargar_servicios, DATOS_DIR
+from controladores.estado_conversacion import obtener_almacen_estados
+from controladores.gateway_llm import gateway_llm, BackendFalso, CacheRespuestas
+from controladores import analitica
+from controladores.registro_interacciones import cola_interacciones
+from controladores.planificador_slots import aprovisionar_slots
+
+ESCENARIOS = ('registro', 'recurrente', 'precio', 'consulta')
+CLIENTES_SEMILLA = 50
+_PATRON_HORA = re.compile(r'\b(\d{2}:\d{2})\b')
+_PROBLEMAS = ('mi auto no tiene fuerza', 'necesito cambio de aceite', 'revision de frenos',
+              'el motor no responde bien y se aguanta', 'cambio de pastillas de freno')
+_CONSULTAS = ('cada cuanto debo cambiar el aceite', 'por que chillan los frenos',
+              'que significa la luz del motor encendida', 'cuanto dura una bateria')
+
+
+def crear_app_carga(directorio, latencia_llm=0.0):
+    """Aplicación mínima con la misma lógica de conversación que la app real, sin servicios externos."""
+    app = Flask(__name__, template_folder='../vistas/templates', static_folder='../vistas/static')
+    app.config.from_object(config_by_name['test'])
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(directorio, 'carga.db'),
+        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}},
+        SECRET_KEY='prueba-carga',
+        SESSION_REDIS=None,
+        INTERACCIONES_WRITE_BEHIND=True,
+        NOTIFICACIONES_TRANSPORTE='archivo',
+        NOTIFICACIONES_ARCHIVO=os.path.join(directorio, 'correos.jsonl'),
+    )
+    app.extensions['redis'] = None  # Sin Redis: almacén de estados y caché locales
+    db.init_app(app)
+    cola_interacciones.init_app(app)
+    gateway_llm.backend = BackendFalso(latencia=latencia_llm)
+    gateway_llm.cache = CacheRespuestas()
+    gateway_llm.init_app(app)
+    analitica.init_app(app)
+
+    from controladores.routes import register_routes
+    register_routes(app)
+    return app
+
+
+def preparar_datos(app, dias, desde):
+    """Crea los servicios de datos/servicios.txt, clientes existentes y los slots de 'dias' días."""
+    with app.app_context():
+        db.create_all()
+        for nombre in cargar_servicios(os.path.join(DATOS_DIR, 'servicios.txt')):
+            db.session.add(Servicio(nombre=nombre, precio=100))
+        for i in range(CLIENTES_SEMILLA):
+            usuario = Usuario(nombre=f'Cliente{i}', apellido='Carga', email=f'cliente{i}@carga.test', telefono='900000000')
+            db.session.add(usuario)
+            db.session.flush()
+            db.session.add(Vehiculo(usuario_id=usuario.id, marca='Toyota', modelo='Yaris', año=2015))
+        db.session.commit()
+        aprovisionar_slots(dias, desde=desde)
+
+
+def _elegir_hora(respuesta, aleatorio):
+    horas = _PATRON_HORA.findall(respuesta)
+    return aleatorio.choice(horas) if horas else None
+
+
+def pasos_escenario(escenario, numero, fecha, aleatorio):
+    """Mensajes del escenario; un paso puede ser una función de la respuesta anterior (None = abortar)."""
+    problema = aleatorio.choice(_PROBLEMAS)
+    existente = f'cliente{numero % CLIENTES_SEMILLA}@carga.test'
+    if escenario == 'registro':
+        return ['hola', f'nuevo{numero}@carga.test', f'Cliente Nuevo{numero}', '987654321', 'Av. Siempre Viva 123',
+                'Peru', '1990-01-01', 'M', 'Toyota', 'Yaris', '2015', 'secreto', 'secreto',
+                problema, 'si', fecha.isoformat(), lambda respuesta: _elegir_hora(respuesta, aleatorio), 'no']
+    if escenario == 'recurrente':
+        return ['hola', existente, problema, 'si', fecha.isoformat(),
+                lambda respuesta: _elegir_hora(respuesta, aleatorio), 'gracias']
+    if escenario == 'precio':
+        return ['hola', existente, problema, 'precio', 'nuevo servicio', aleatorio.choice(_PROBLEMAS), 'cuanto cuesta']
+    return ['hola', existente, problema, 'consulta especifica', aleatorio.choice(_CONSULTAS), 'precio']
+
+
+class Resultados:
+    """Latencias por estado y contadores de la prueba, seguros entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.conversaciones = defaultdict(int)
+        self.abortadas = 0
+
+    def registrar(self, estado, segundos, error=False):
+        with self._lock:
+            self.latencias[estado].append(segundos)
+            if error:
+                self.errores[estado] += 1
+
+    def terminar(self, escenario, abortada):
+        with self._lock:
+            self.conversaciones[escenario] += 1
+            self.abortadas += int(abortada)
+
+
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return 0.0
+    posicion = min(len(ordenadas) - 1, max(0, int(round(p / 100 * len(ordenadas) + 0.5)) - 1))
+    return ordenadas[posicion]
+
+
+def _turno_funcion(app, conversacion_id, mensaje):
+    with app.app_context():
+        return procesar_mensaje(conversacion_id, mensaje).completar(), False
+
+
+def _turno_http(cliente, conversacion_id, mensaje):
+    respuesta = cliente.post('/conversacion', json={'message': mensaje})
+    datos = respuesta.get_json(silent=True) or {}
+    return datos.get('message') or datos.get('error', ''), respuesta.status_code != 200
+
+
+def ejecutar_conversacion(app, modo, escenario, numero, fecha, resultados, semilla):
+    aleatorio = random.Random(semilla * 1000003 + numero)
+    conversacion_id = f'carga-{numero}'
+    almacen = obtener_almacen_estados(app)
+    cliente = None
+    if modo == 'http':
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['conversacion_id'] = conversacion_id  # Para conocer el estado de cada turno
+
+    respuesta = ''
+    abortada = False
+    for paso in pasos_escenario(escenario, numero, fecha, aleatorio):
+        mensaje = paso(respuesta) if callable(paso) else paso
+        if mensaje is None:
+            abortada = True
+            break
+        estado = almacen.cargar(conversacion_id)
+        estado = estado.estado if estado is not None else 'inicio'
+        inicio = time.perf_counter()
+        try:
+            if modo == 'http':
+                respuesta, error = _turno_http(cliente, conversacion_id, mensaje)
+            else:
+                respuesta, error = _turno_funcion(app, conversacion_id, mensaje)
+        except Exception as e:
+            respuesta, error = str(e), True
+        resultados.registrar(estado, time.perf_counter() - inicio, error)
+    resultados.terminar(escenario, abortada)
+
+
+def ejecutar_prueba(conversaciones=200, concurrencia=8, modo='http', mezcla=None, latencia_llm=0.0,
+                    dias=7, semilla=0):
+    """Ejecuta la prueba completa y devuelve el informe como diccionario."""
+    mezcla = mezcla or {'registro': 1, 'recurrente': 2, 'precio': 1, 'consulta': 1}
+    aleatorio = random.Random(semilla)
+    escenarios = aleatorio.choices(list(mezcla), weights=list(mezcla.values()), k=conversaciones)
+    desde = date.today() + timedelta(days=1)
+
+    with tempfile.TemporaryDirectory(prefix='prueba-carga-') as directorio:
+        app = crear_app_carga(directorio, latencia_llm)
+        preparar_datos(app, dias, desde)
+        resultados = Resultados()
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+            futuros = [
+                ejecutor.submit(ejecutar_conversacion, app, modo, escenario, numero,
+                                desde + timedelta(days=numero % dias), resultados, semilla)
+                for numero, escenario in enumerate(escenarios)
+            ]
+            for futuro in futuros:
+                futuro.result()
+        duracion = time.perf_counter() - inicio
+        cola_interacciones.vaciar()
+
+    return informe(resultados, duracion, modo, concurrencia, latencia_llm)
+
+
+def informe(resultados, duracion, modo, concurrencia, latencia_llm):
+    por_estado = {}
+    todas = []
+    for estado, latencias in sorted(resultados.latencias.items()):
+        ordenadas = sorted(latencias)
+        todas.extend(ordenadas)
+        por_estado[estado] = {
+            'turnos': len(ordenadas),
+            'errores': resultados.errores[estado],
+            'p50_ms': percentil(ordenadas, 50) * 1000,
+            'p95_ms': percentil(ordenadas, 95) * 1000,
+            'p99_ms': percentil(ordenadas, 99) * 1000,
+            'turnos_por_segundo': len(ordenadas) / duracion if duracion else 0.0,
+        }
+    todas.sort()
+    return {
+        'modo': modo,
+        'concurrencia': concurrencia,
+        'latencia_llm_s': latencia_llm,
+        'duracion_s': duracion,
+        'conversaciones': dict(resultados.conversaciones),
+        'abortadas': resultados.abortadas,
+        'turnos': len(todas),
+        'errores': sum(resultados.errores.values()),
+        'turnos_por_segundo': len(todas) / duracion if duracion else 0.0,
+        'p50_ms': percentil(todas, 50) * 1000,
+        'p95_ms': percentil(todas, 95) * 1000,
+        'p99_ms': percentil(todas, 99) * 1000,
+        'por_estado': por_estado,
+    }
+
+
+def formatear_informe(datos):
+    lineas = [
+        f"Modo {datos['modo']}, concurrencia {datos['concurrencia']}, latencia LLM {datos['latencia_llm_s']}s",
+        f"{sum(datos['conversaciones'].values())} conversaciones ({', '.join(f'{k}={v}' for k, v in sorted(datos['conversaciones'].items()))}), "
+        f"{datos['abortadas']} abortadas, {datos['turnos']} turnos, {datos['errores']} errores en {datos['duracion_s']:.2f}s",
+        f"Total: {datos['turnos_por_segundo']:.1f} turnos/s  p50 {datos['p50_ms']:.1f}ms  p95 {datos['p95_ms']:.1f}ms  p99 {datos['p99_ms']:.1f}ms",
+        '',
+        f"{'estado':<28}{'turnos':>8}{'errores':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'turnos/s':>10}",
+    ]
+    for estado, fila in datos['por_estado'].items():
+        lineas.append(f"{estado:<28}{fila['turnos']:>8}{fila['errores']:>9}{fila['p50_ms']:>10.1f}"
+                      f"{fila['p95_ms']:>10.1f}{fila['p99_ms']:>10.1f}{fila['turnos_por_segundo']:>10.1f}")
+    return '\n'.join(lineas)
+
+
+def guardar_informe(datos, ruta):
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, indent=2, ensure_ascii=False)
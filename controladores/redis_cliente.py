@@ -0,0 +1,18 @@
+import os
+import redis
+from flask import current_app
+
+
+# Función para obtener el cliente Redis compartido (el mismo que usan las sesiones)
+def obtener_redis(app=None):
+    """Devuelve el cliente Redis de la aplicación, o None si no hay Redis configurado."""
+    app = app or current_app
+    if 'redis' in app.extensions:
+        return app.extensions['redis']
+    cliente = app.config.get('SESSION_REDIS')
+    if isinstance(cliente, str):
+        cliente = redis.from_url(cliente)
+    elif cliente is None and os.getenv('REDIS_URL'):
+        cliente = redis.from_url(os.getenv('REDIS_URL'))
+    app.extensions['redis'] = cliente
+    return cliente
@@ -0,0 +1,98 @@
+import atexit
+import os
+import threading
+from flask import current_app
+from sqlalchemy import insert
+from modelos.models import db, Interaccion
+from controladores import analitica
+
+
+class ColaInteracciones:
+    """Cola write-behind para las filas de Interaccion.
+
+    El request solo encola la fila; un hilo en segundo plano las inserta en bloque
+    cada 'tamano_lote' filas o cada 'intervalo_ms' milisegundos, lo que ocurra primero.
+    La cola se vacía al terminar el proceso (atexit) para no perder registros.
+    """
+
+    def __init__(self, tamano_lote=100, intervalo_ms=500):
+        self.tamano_lote = tamano_lote
+        self.intervalo_ms = intervalo_ms
+        self.habilitada = True
+        self._app = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._evento = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._pid = None
+
+    def init_app(self, app):
+        self._app = app
+        self.tamano_lote = app.config.get('INTERACCIONES_LOTE_TAMANO', self.tamano_lote)
+        self.intervalo_ms = app.config.get('INTERACCIONES_LOTE_MS', self.intervalo_ms)
+        self.habilitada = app.config.get('INTERACCIONES_WRITE_BEHIND', True)
+        app.extensions['cola_interacciones'] = self
+        atexit.register(self.cerrar)
+
+    def _iniciar_hilo(self):
+        # Tras un fork (gunicorn --preload) el hilo del proceso padre no existe en el hijo
+        if self._pid == os.getpid() and self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._buffer = []
+                self._pid = os.getpid()
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._bucle, name='cola-interacciones', daemon=True)
+                self._hilo.start()
+
+    def encolar(self, fila):
+        if self._app is None:
+            self._app = current_app._get_current_object()
+        if not self.habilitada:
+            self._insertar([fila])
+            return
+        self._iniciar_hilo()
+        with self._lock:
+            self._buffer.append(fila)
+            lleno = len(self._buffer) >= self.tamano_lote
+        if lleno:
+            self._evento.set()
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._evento.wait(self.intervalo_ms / 1000.0)
+            self._evento.clear()
+            self.vaciar()
+
+    def vaciar(self):
+        """Inserta en bloque todas las filas pendientes."""
+        with self._lock:
+            filas, self._buffer = self._buffer, []
+        if filas:
+            self._insertar(filas)
+
+    def _insertar(self, filas):
+        with self._app.app_context():
+            try:
+                db.session.execute(insert(Interaccion), filas)
+                db.session.commit()
+                analitica.registrar_interacciones(filas)  # INSERT en bloque: sin eventos del ORM
+            except Exception as e:
+                db.session.rollback()
+                self._app.logger.error(f"Error al insertar {len(filas)} interacciones: {e}")
+            finally:
+                db.session.remove()
+
+    def cerrar(self):
+        self._detener.set()
+        self._evento.set()
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            self._hilo.join(timeout=5)
+        if self._app is not None:
+            self.vaciar()
+
+
+cola_interacciones = ColaInteracciones()
@@ -1,9 +1,20 @@
-from flask import request, jsonify, redirect, url_for
+import json
+from flask import request, jsonify, redirect, url_for, Response, stream_with_context
 from modelos.models import db, Usuario, Vehiculo, Servicio, Slot, Reserva, ComentarioServicio, Repuesto
-from controladores.conversacion import handle_message, registrar_interaccion
-from openai.error import OpenAIError
+from controladores.conversacion import (handle_message, handle_message_stream, procesar_mensaje, terminar_conversacion,
+                                        registrar_interaccion, clasificar_lote, MENSAJE_BIENVENIDA)
+from controladores.estado_conversacion import id_valido, ConversacionOcupada
+from controladores.disponibilidad import invalidar_slot
+from controladores.gateway_llm import gateway_llm
+from controladores.capa_servicios import UsuarioService, VehiculoService, ReservaService, ConflictoReserva
+from controladores.decorators import token_requerido
 import traceback
 
+# Resultados por mensaje en /conversacion/batch: valores mayores se recortan a este máximo
+TOP_K_MAXIMO = 10
+# Mensajes por solicitud en /conversacion/batch; lotes mayores se rechazan
+MENSAJES_BATCH_MAXIMO = 500
+
 def register_routes(app):
     @app.route('/')
     def home():
@@ -15,7 +26,7 @@ def register_routes(app):
             user_message = request.json.get('message')
             if not user_message:
                 # Responder con mensaje de bienvenida si el mensaje del usuario está vacío
-                respuesta_bot = "¡Hola! 👋 **Soy tu asistente para la reserva de servicios automotrices.** 🚗 ¿Cómo te puedo ayudar hoy? "
+                respuesta_bot = MENSAJE_BIENVENIDA
                 es_exitosa = True
                 registrar_interaccion(None, '', respuesta_bot, es_exitosa)
                 return jsonify({'message': respuesta_bot})
@@ -27,31 +38,105 @@ def register_routes(app):
             app.logger.error(f"Error en la ruta '/conversacion': {str(e)}\n{error_trace}")
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/conversacion/stream', methods=['POST'])
+    def conversacion_stream():
+        """Como /conversacion, pero las respuestas del LLM se envían como Server-Sent Events.
+
+        Los estados que no consultan al LLM responden con el mismo JSON que /conversacion.
+        Eventos: 'data: {"delta": ...}' por fragmento y 'event: fin' con el mensaje completo.
+        """
+        try:
+            user_message = request.json.get('message')
+            if not user_message:
+                registrar_interaccion(None, '', MENSAJE_BIENVENIDA, True)
+                return jsonify({'message': MENSAJE_BIENVENIDA})
+
+            turno = handle_message_stream(user_message)
+            if turno.flujo is None:
+                return jsonify({"message": turno.respuesta})
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            app.logger.error(f"Error en la ruta '/conversacion/stream': {str(e)}\n{error_trace}")
+            return jsonify({'error': str(e)}), 500
+
+        def eventos():
+            try:
+                for fragmento in turno.fragmentos():
+                    yield f"data: {json.dumps({'delta': fragmento}, ensure_ascii=False)}\n\n"
+                yield f"event: fin\ndata: {json.dumps({'message': turno.respuesta}, ensure_ascii=False)}\n\n"
+            except Exception as e:
+                app.logger.error(f"Error en la ruta '/conversacion/stream': {str(e)}\n{traceback.format_exc()}")
+                yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+
+        # El estado de la conversación ya quedó en la sesión; la sesión se guarda antes de enviar el cuerpo
+        return Response(stream_with_context(eventos()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/conversacion/<conversacion_id>', methods=['POST'])
+    @token_requerido('CANALES_API_TOKEN')
+    def conversacion_por_id(conversacion_id):
+        """Conversación identificada por el canal (gateway de mensajería), sin cookies.
+
+        El identificador suele ser un teléfono, fácil de adivinar: la ruta exige el token del canal.
+        """
+        if not id_valido(conversacion_id):
+            return jsonify({'error': 'Identificador de conversación inválido'}), 400
+        try:
+            user_message = (request.get_json(silent=True) or {}).get('message')
+            if not user_message:
+                registrar_interaccion(None, '', MENSAJE_BIENVENIDA, True)
+                return jsonify({'conversacion_id': conversacion_id, 'message': MENSAJE_BIENVENIDA})
+            turno = procesar_mensaje(conversacion_id, user_message)
+            return jsonify({'conversacion_id': conversacion_id, 'message': turno.completar(), 'finalizada': turno.finalizar})
+        except ConversacionOcupada:
+            return jsonify({'error': 'La conversación está procesando otro mensaje'}), 409
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            app.logger.error(f"Error en la ruta '/conversacion/{conversacion_id}': {str(e)}\n{error_trace}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/conversacion/<conversacion_id>', methods=['DELETE'])
+    @token_requerido('CANALES_API_TOKEN')
+    def terminar_conversacion_por_id(conversacion_id):
+        if not id_valido(conversacion_id):
+            return jsonify({'error': 'Identificador de conversación inválido'}), 400
+        terminar_conversacion(conversacion_id)
+        return jsonify({'message': 'Conversación terminada', 'conversacion_id': conversacion_id})
+
+    @app.route('/conversacion/batch', methods=['POST'])
+    @token_requerido('CLASIFICACION_API_TOKEN')
+    def conversacion_batch():
+        data = request.get_json(silent=True) or {}
+        try:
+            mensajes = data.get('messages')
+            if not isinstance(mensajes, list) or not all(isinstance(m, str) for m in mensajes):
+                return jsonify({'error': "'messages' debe ser una lista de textos"}), 400
+            if len(mensajes) > MENSAJES_BATCH_MAXIMO:
+                return jsonify({'error': f"'messages' admite como máximo {MENSAJES_BATCH_MAXIMO} textos"}), 400
+            top_k = data.get('top_k', 3)
+            if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+                return jsonify({'error': "'top_k' debe ser un entero mayor que 0"}), 400
+            top_k = min(top_k, TOP_K_MAXIMO)
+            clasificaciones = clasificar_lote(mensajes, top_k=top_k)
+            return jsonify({'resultados': [
+                [{'problema': problema, 'servicio': servicio, 'similitud': similitud}
+                 for problema, servicio, similitud in candidatos]
+                for candidatos in clasificaciones
+            ]})
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            app.logger.error(f"Error en la ruta '/conversacion/batch': {str(e)}\n{error_trace}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/llm/estadisticas', methods=['GET'])
+    def llm_estadisticas():
+        return jsonify(gateway_llm.estadisticas())
+
     @app.route('/usuarios', methods=['POST'])
     def create_usuario():
         data = request.get_json()
         try:
-            new_usuario = Usuario(
-                nombre=data['nombre'],
-                apellido=data['apellido'],
-                email=data['email'],
-                telefono=data['telefono'],
-                direccion=data.get('direccion'),
-                ciudad=data.get('ciudad'),
-                profesion=data.get('profesion'),
-                pais=data.get('pais'),
-                fecha_nacimiento=data.get('fecha_nacimiento'),
-                genero=data.get('genero'),
-                preferencias_servicio=data.get('preferencias_servicio'),
-                rol=data.get('rol', 'usuario'),
-                activo=data.get('activo', True),
-                estado=data.get('estado', 'inicio')
-            )
-            
-            if 'password' in data:
-                new_usuario.set_password(data['password'])
-            db.session.add(new_usuario)
-            db.session.commit()
+            new_usuario = UsuarioService.crear(data)
             return jsonify({'message': 'Usuario creado', 'usuario': new_usuario.id})
         except Exception as e:
             db.session.rollback()
@@ -63,14 +148,7 @@ def register_routes(app):
     def create_vehiculo():
         data = request.get_json()
         try:
-            new_vehiculo = Vehiculo(
-                usuario_id=data['usuario_id'],
-                marca=data['marca'],
-                modelo=data['modelo'],
-                año=data['año']
-            )
-            db.session.add(new_vehiculo)
-            db.session.commit()
+            new_vehiculo = VehiculoService.crear(data)
             return jsonify({'message': 'Vehículo creado', 'vehiculo': new_vehiculo.id})
         except Exception as e:
             db.session.rollback()
@@ -110,6 +188,7 @@ def register_routes(app):
             )
             db.session.add(new_slot)
             db.session.commit()
+            invalidar_slot(new_slot)
             return jsonify({'message': 'Slot creado', 'slot': new_slot.id})
         except Exception as e:
             db.session.rollback()
@@ -123,8 +202,8 @@ def register_routes(app):
         try:
             if 'vehiculo_id' not in data or data['vehiculo_id'] is None:
                 raise ValueError("vehiculo_id no puede ser nulo")
-            
-            new_reserva = Reserva(
+
+            new_reserva = ReservaService.crear(
                 usuario_id=data['usuario_id'],
                 vehiculo_id=data['vehiculo_id'],
                 servicio_id=data['servicio_id'],
@@ -132,11 +211,9 @@ def register_routes(app):
                 problema=data['problema'],
                 fecha_hora=data['fecha_hora']
             )
-            db.session.add(new_reserva)
-            slot = Slot.query.get(data['slot_id'])
-            slot.reservado = True
-            db.session.commit()
             return jsonify({'message': 'Reserva creada', 'reserva': new_reserva.id})
+        except ConflictoReserva as e:
+            return jsonify({'error': str(e)}), 409
         except Exception as e:
             db.session.rollback()
             error_trace = traceback.format_exc()
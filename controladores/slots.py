@@ -0,0 +1,96 @@
+from datetime import datetime, date, timedelta
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from config import Config
+from modelos.models import db, Slot
+
+# Filas por sentencia INSERT multi-fila (mantiene los parámetros por debajo de los límites del motor)
+FILAS_POR_SENTENCIA = 1000
+
+
+def _config(clave):
+    try:
+        return current_app.config.get(clave, getattr(Config, clave))
+    except RuntimeError:
+        return getattr(Config, clave)
+
+
+def _a_fecha(valor):
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+def horarios_del_dia():
+    """Devuelve la lista de (hora_inicio, hora_fin) de un día según Config.HORARIO_*."""
+    duracion = timedelta(minutes=_config('DURACION_SLOT_MINUTOS'))
+    ventanas = [
+        (_config('HORARIO_INICIO_MANANA'), _config('HORARIO_FIN_MANANA')),
+        (_config('HORARIO_INICIO_TARDE'), _config('HORARIO_FIN_TARDE')),
+    ]
+    horarios = []
+    base = date.min
+    for inicio, fin in ventanas:
+        actual = datetime.combine(base, datetime.strptime(inicio, '%H:%M').time())
+        limite = datetime.combine(base, datetime.strptime(fin, '%H:%M').time())
+        while actual < limite:
+            horarios.append((actual.time(), (actual + duracion).time()))
+            actual += duracion
+    return horarios
+
+
+def calcular_slots(servicio_ids, fecha_inicio, fecha_fin):
+    """Calcula en memoria las filas de Slot para los servicios y el rango de fechas indicados."""
+    fecha_inicio = _a_fecha(fecha_inicio)
+    fecha_fin = _a_fecha(fecha_fin)
+    horarios = horarios_del_dia()
+    filas = []
+    fecha = fecha_inicio
+    while fecha <= fecha_fin:
+        for servicio_id in servicio_ids:
+            for hora_inicio, hora_fin in horarios:
+                filas.append({
+                    'servicio_id': servicio_id,
+                    'fecha': fecha,
+                    'hora_inicio': hora_inicio,
+                    'hora_fin': hora_fin,
+                    'reservado': False,
+                })
+        fecha += timedelta(days=1)
+    return filas
+
+
+def _insert_ignorando_duplicados():
+    """INSERT que ignora filas existentes según la restricción única (servicio_id, fecha, hora_inicio)."""
+    dialecto = db.session.get_bind().dialect.name
+    if dialecto in ('mysql', 'mariadb'):
+        # INSERT IGNORE devuelve en rowcount solo las filas realmente insertadas
+        return mysql.insert(Slot).prefix_with('IGNORE')
+    if dialecto == 'postgresql':
+        return postgresql.insert(Slot).on_conflict_do_nothing(index_elements=['servicio_id', 'fecha', 'hora_inicio'])
+    if dialecto == 'sqlite':
+        return sqlite.insert(Slot).on_conflict_do_nothing(index_elements=['servicio_id', 'fecha', 'hora_inicio'])
+    return insert(Slot)
+
+
+def insertar_slots(filas, commit=True):
+    """Inserta las filas con INSERT multi-fila idempotente y devuelve cuántas se crearon."""
+    creados = 0
+    for inicio in range(0, len(filas), FILAS_POR_SENTENCIA):
+        bloque = filas[inicio:inicio + FILAS_POR_SENTENCIA]
+        resultado = db.session.execute(_insert_ignorando_duplicados().values(bloque))
+        creados += max(resultado.rowcount or 0, 0)
+    if commit:
+        db.session.commit()
+    return creados
+
+
+# Función para generar slots automáticamente
+def generar_slots(servicio_id, fecha_inicio, fecha_fin, commit=True):
+    """Genera los slots de uno o varios servicios entre dos fechas (inclusive).
+
+    Es seguro ejecutarla en paralelo o repetirla: los slots existentes se ignoran.
+    """
+    servicio_ids = servicio_id if isinstance(servicio_id, (list, tuple, set)) else [servicio_id]
+    return insertar_slots(calcular_slots(servicio_ids, fecha_inicio, fecha_fin), commit=commit)
@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, session, redirect, url_for, request, flash
+from sqlalchemy.orm import joinedload
 from modelos.models import db, Usuario, Vehiculo, Reserva
 from .decorators import login_required
+from .capa_servicios import ReservaService, ConflictoReserva
+from .paginacion import paginar
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
 
@@ -32,8 +35,13 @@ def registrar_vehiculo():
 @login_required
 def listar_reservas():
     usuario_id = session['user_id']
-    reservas = Reserva.query.filter_by(usuario_id=usuario_id).all()
-    return render_template('user/reservas.html', reservas=reservas)
+    consulta = (Reserva.query.options(joinedload(Reserva.vehiculo), joinedload(Reserva.servicio))
+                .filter(Reserva.usuario_id == usuario_id))
+    if request.args.get('estado'):
+        consulta = consulta.filter(Reserva.estado == request.args['estado'])
+    pagina = paginar(consulta, {'fecha_hora': Reserva.fecha_hora, 'id': Reserva.id}, Reserva.id, request.args,
+                     orden_defecto='fecha_hora', direccion_defecto='desc')
+    return render_template('user/reservas.html', reservas=pagina, pagina=pagina)
 
 @user_bp.route('/reserva/nueva', methods=['GET', 'POST'])
 @login_required
@@ -51,9 +59,11 @@ def nueva_reserva():
         problema = request.form['problema']
         fecha_hora = request.form['fecha_hora']
         
-        nueva_reserva = Reserva(usuario_id=usuario_id, vehiculo_id=vehiculo_id, servicio_id=servicio_id, slot_id=slot_id, problema=problema, fecha_hora=fecha_hora)
-        db.session.add(nueva_reserva)
-        db.session.commit()
+        try:
+            ReservaService.crear(usuario_id=usuario_id, vehiculo_id=vehiculo_id, servicio_id=servicio_id, slot_id=slot_id, problema=problema, fecha_hora=fecha_hora)
+        except ConflictoReserva:
+            flash('El horario seleccionado ya fue reservado. Por favor, elige otro.', 'error')
+            return redirect(url_for('user.nueva_reserva'))
         
         flash('Reserva creada con éxito.', 'success')
         return redirect(url_for('user.listar_reservas'))
@@ -0,0 +1,105 @@
+"""Vectorizador TF-IDF con numpy y scipy, sin scikit-learn.
+
+Reproduce los pesos de TfidfVectorizer(lowercase=False) de scikit-learn (idf suavizado,
+normalización L2, analizadores de palabras y 'char_wb'), pero guarda el vocabulario como
+un arreglo ordenado de términos en lugar de un diccionario. Así el vocabulario, el idf y
+la matriz son arreglos que se pueden escribir a disco y abrir con np.load(mmap_mode='r'),
+compartiendo las páginas entre todos los workers.
+"""
+import re
+from collections import Counter
+import numpy as np
+from scipy.sparse import csr_matrix
+
+_PATRON_PALABRAS = re.compile(r'(?u)\b\w\w+\b')  # token_pattern por defecto de scikit-learn
+_PATRON_ESPACIOS = re.compile(r'\s\s+')
+
+ANALIZADORES = ('palabras', 'char_wb')
+
+
+def _ngramas_caracteres(texto, minimo, maximo):
+    # Igual que el analizador 'char_wb' de scikit-learn: n-gramas dentro de cada palabra
+    # rodeada de espacios; una palabra más corta que n se cuenta una sola vez
+    ngramas = []
+    for palabra in _PATRON_ESPACIOS.sub(' ', texto).split():
+        palabra = ' ' + palabra + ' '
+        largo = len(palabra)
+        for n in range(minimo, maximo + 1):
+            desplazamiento = 0
+            ngramas.append(palabra[desplazamiento:desplazamiento + n])
+            while desplazamiento + n < largo:
+                desplazamiento += 1
+                ngramas.append(palabra[desplazamiento:desplazamiento + n])
+            if desplazamiento == 0:
+                break
+    return ngramas
+
+
+class VectorizadorTfidf:
+    """TF-IDF de palabras o de n-gramas de caracteres con vocabulario en un arreglo ordenado."""
+
+    def __init__(self, analizador='palabras', ngramas=(1, 1), sublineal=False, terminos=None, idf=None):
+        if analizador not in ANALIZADORES:
+            raise ValueError(f"Analizador desconocido: '{analizador}'")
+        self.analizador = analizador
+        self.ngramas = tuple(ngramas)
+        self.sublineal = sublineal
+        self.terminos = terminos  # np.ndarray de str ordenado: la posición es la columna
+        self.idf = idf
+
+    def analizar(self, texto):
+        if self.analizador == 'char_wb':
+            return _ngramas_caracteres(texto, *self.ngramas)
+        palabras = _PATRON_PALABRAS.findall(texto)
+        minimo, maximo = self.ngramas
+        if maximo == 1:
+            return palabras
+        return [' '.join(palabras[i:i + n]) for n in range(minimo, maximo + 1)
+                for i in range(len(palabras) - n + 1)]
+
+    def ajustar(self, docs):
+        """Aprende vocabulario e idf de 'docs' y devuelve su matriz TF-IDF (CSR)."""
+        conteos = [Counter(self.analizar(doc)) for doc in docs]
+        frecuencia_docs = Counter()
+        for conteo in conteos:
+            frecuencia_docs.update(conteo.keys())
+        self.terminos = np.array(sorted(frecuencia_docs), dtype=str)
+        df = np.array([frecuencia_docs[termino] for termino in self.terminos.tolist()], dtype=np.float64)
+        # idf suavizado: como si hubiera un documento extra con todos los términos
+        self.idf = np.log((1 + len(docs)) / (1 + df)) + 1
+        return self._matriz(conteos)
+
+    def transformar(self, textos):
+        """Matriz TF-IDF (CSR) de 'textos' con el vocabulario aprendido; ignora términos nuevos."""
+        return self._matriz([Counter(self.analizar(texto)) for texto in textos])
+
+    def _columnas(self, conteo):
+        if not conteo or not len(self.terminos):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        tokens = np.array(list(conteo), dtype=str)
+        frecuencias = np.fromiter(conteo.values(), dtype=np.float64, count=len(conteo))
+        posiciones = np.minimum(np.searchsorted(self.terminos, tokens), len(self.terminos) - 1)
+        conocidos = self.terminos[posiciones] == tokens
+        return posiciones[conocidos], frecuencias[conocidos]
+
+    def _matriz(self, conteos):
+        indptr = [0]
+        indices = []
+        datos = []
+        for conteo in conteos:
+            columnas, frecuencias = self._columnas(conteo)
+            orden = np.argsort(columnas)
+            columnas, frecuencias = columnas[orden], frecuencias[orden]
+            if self.sublineal:
+                frecuencias = np.log(frecuencias) + 1
+            pesos = frecuencias * self.idf[columnas]
+            norma = np.sqrt(np.dot(pesos, pesos))
+            if norma > 0:
+                pesos = pesos / norma
+            indices.append(columnas)
+            datos.append(pesos)
+            indptr.append(indptr[-1] + len(columnas))
+        indices = np.concatenate(indices).astype(np.int32) if indices else np.empty(0, dtype=np.int32)
+        datos = np.concatenate(datos) if datos else np.empty(0)
+        return csr_matrix((datos, indices, np.array(indptr, dtype=np.int32)),
+                          shape=(len(conteos), len(self.terminos)))
@@ -1,10 +1,17 @@
 import os
 import sys
 from flask import Flask
+from flask.cli import FlaskGroup
 from flask_migrate import Migrate, upgrade
 from flask_session import Session
 from config import config_by_name
 from modelos.models import db
+from controladores.registro_interacciones import cola_interacciones
+from controladores.planificador_slots import planificador_slots
+from controladores.gateway_llm import gateway_llm
+from controladores.conversacion import indice_problemas, indice_servicios
+from controladores import analitica, metricas
+from controladores.redis_cliente import obtener_redis
 from controladores.admin_routes import admin_bp
 from controladores.user_routes import user_bp
 from controladores.auth_routes import auth_bp
@@ -15,11 +22,20 @@ def create_app(config_name):
     app = Flask(__name__, template_folder='vistas/templates', static_folder='vistas/static')
     app.config.from_object(config_by_name[config_name])
     
-    # Inicializar la sesión
-    Session(app)
+    # Inicializar la sesión en Redis; sin REDIS_URL se usa la sesión por cookie de Flask (desarrollo, pruebas)
+    if app.config.get('SESSION_REDIS'):
+        app.config['SESSION_REDIS'] = obtener_redis(app)
+        Session(app)
     
     # Inicializar la base de datos
     db.init_app(app)
+    cola_interacciones.init_app(app)
+    planificador_slots.init_app(app)
+    gateway_llm.init_app(app)
+    indice_problemas.init_app(app, 'INTENCIONES_BUSCADOR')
+    indice_servicios.init_app(app)
+    metricas.init_app(app)
+    analitica.init_app(app)
     migrate = Migrate(app, db)
 
     # Registrar Blueprints
@@ -30,8 +46,11 @@ def create_app(config_name):
     
     with app.app_context():
         from controladores.routes import register_routes
+        from controladores.comandos import register_commands
         register_routes(app)
-        db.create_all()
+        register_commands(app)
+        if app.config.get('CREAR_TABLAS_AL_INICIAR'):
+            db.create_all()
 
     return app
 
@@ -40,7 +59,12 @@ if __name__ == "__main__":
     app = create_app(config_name)
 
     if len(sys.argv) > 1 and sys.argv[1] == 'db':
+        # Crea las tablas que falten según el modelo y aplica las migraciones (que omiten lo ya creado)
         with app.app_context():
+            db.create_all()
             upgrade()
+    elif len(sys.argv) > 1:
+        # Ejecutar los comandos CLI registrados (p. ej. clasificar-interacciones)
+        FlaskGroup(create_app=lambda: app).main(args=sys.argv[1:], prog_name='manage.py')
     else:
         app.run(debug=(config_name == 'dev'))
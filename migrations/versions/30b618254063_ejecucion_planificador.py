@@ -0,0 +1,39 @@
+"""Tabla ejecucion_planificador
+
+Revision ID: 30b618254063
+Revises: 8f0093903237
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '30b618254063'
+down_revision = '8f0093903237'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('ejecucion_planificador'):
+        return
+    op.create_table(
+        'ejecucion_planificador',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tarea', sa.String(length=50), nullable=False),
+        sa.Column('tiempo_inicio', sa.DateTime(), nullable=False),
+        sa.Column('tiempo_fin', sa.DateTime(), nullable=True),
+        sa.Column('fecha_desde', sa.Date(), nullable=False),
+        sa.Column('fecha_hasta', sa.Date(), nullable=False),
+        sa.Column('servicios', sa.Integer(), nullable=False),
+        sa.Column('slots_creados', sa.Integer(), nullable=False),
+        sa.Column('exitosa', sa.Boolean(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ejecucion_planificador')
@@ -0,0 +1,43 @@
+"""Tabla resumen_diario
+
+Revision ID: 5d1e8a3c9b27
+Revises: c2a7749147f4
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1e8a3c9b27'
+down_revision = 'c2a7749147f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('resumen_diario'):
+        return
+    op.create_table(
+        'resumen_diario',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.Date(), nullable=False),
+        sa.Column('interacciones', sa.Integer(), nullable=False),
+        sa.Column('interacciones_exitosas', sa.Integer(), nullable=False),
+        sa.Column('consultas_iniciadas', sa.Integer(), nullable=False),
+        sa.Column('solicitudes_atendidas', sa.Integer(), nullable=False),
+        sa.Column('conversiones_realizadas', sa.Integer(), nullable=False),
+        sa.Column('registros', sa.Integer(), nullable=False),
+        sa.Column('reservas', sa.Integer(), nullable=False),
+        sa.Column('registro_segundos_promedio', sa.Float(), nullable=True),
+        sa.Column('reserva_segundos_promedio', sa.Float(), nullable=True),
+        sa.Column('embudo', sa.JSON(), nullable=True),
+        sa.Column('actualizado', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('fecha')
+    )
+
+
+def downgrade():
+    op.drop_table('resumen_diario')
@@ -0,0 +1,71 @@
+"""Restricción única de Slot (servicio_id, fecha, hora_inicio)
+
+Revision ID: 8f0093903237
+Revises:
+Create Date: 2026-10-17 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f0093903237'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+NOMBRE_RESTRICCION = 'uq_slot_servicio_fecha_hora'
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existentes = {uc['name'] for uc in inspector.get_unique_constraints('slot')}
+    if NOMBRE_RESTRICCION in existentes:
+        # Base creada con db.create_all() a partir del modelo actual
+        return
+
+    # Fusionar los slots duplicados antes de crear la restricción: se conserva el ocupado (o el
+    # de menor id) y los duplicados libres se eliminan
+    slot = sa.table('slot', sa.column('id'), sa.column('servicio_id'), sa.column('fecha'),
+                    sa.column('hora_inicio'), sa.column('reservado'))
+    reserva = sa.table('reserva', sa.column('slot_id'))
+    # Los flujos de reserva anteriores no marcaban 'reservado': un slot con reservas también está ocupado
+    con_reservas = {fila.slot_id for fila in bind.execute(sa.select(reserva.c.slot_id).distinct())}
+    grupos = {}
+    consulta = sa.select(slot.c.id, slot.c.servicio_id, slot.c.fecha, slot.c.hora_inicio, slot.c.reservado)
+    for fila in bind.execute(consulta):
+        grupos.setdefault((fila.servicio_id, fila.fecha, fila.hora_inicio), []).append(fila)
+
+    def ocupado(fila):
+        return bool(fila.reservado) or fila.id in con_reservas
+
+    # Primero el ocupado (reservado puede ser NULL), luego el de menor id
+    grupos = {clave: sorted(filas, key=lambda fila: (not ocupado(fila), fila.id))
+              for clave, filas in grupos.items() if len(filas) > 1}
+
+    # Dos slots ocupados en la misma hora son dos citas distintas: no se pueden fusionar solas
+    conflictos = {clave: [fila.id for fila in filas] for clave, filas in grupos.items()
+                  if sum(1 for fila in filas if ocupado(fila)) > 1}
+    if conflictos:
+        detalle = '\n'.join(f'  servicio_id={servicio_id} fecha={fecha} hora_inicio={hora_inicio}: slots {ids}'
+                            for (servicio_id, fecha, hora_inicio), ids in sorted(conflictos.items()))
+        raise RuntimeError(
+            f'No se puede crear {NOMBRE_RESTRICCION}: hay {len(conflictos)} horarios con más de un slot '
+            f'ocupado (reservado o con reservas). Reasigne o cancele esas reservas y vuelva a ejecutar '
+            f'la migración.\n{detalle}')
+
+    for filas in grupos.values():
+        conservado = filas[0]
+        duplicados = [fila.id for fila in filas[1:]]
+        # Sin conflictos, los duplicados están libres y no tienen reservas que reasignar
+        bind.execute(slot.delete().where(slot.c.id.in_(duplicados)))
+
+    with op.batch_alter_table('slot') as batch_op:
+        batch_op.create_unique_constraint(NOMBRE_RESTRICCION, ['servicio_id', 'fecha', 'hora_inicio'])
+
+
+def downgrade():
+    with op.batch_alter_table('slot') as batch_op:
+        batch_op.drop_constraint(NOMBRE_RESTRICCION, type_='unique')
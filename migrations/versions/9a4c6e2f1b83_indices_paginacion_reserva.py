@@ -0,0 +1,34 @@
+"""Índices de paginación por keyset en Reserva
+
+Revision ID: 9a4c6e2f1b83
+Revises: 5d1e8a3c9b27
+Create Date: 2026-10-17 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c6e2f1b83'
+down_revision = '5d1e8a3c9b27'
+branch_labels = None
+depends_on = None
+
+INDICES = {
+    'ix_reserva_fecha_hora_id': ['fecha_hora', 'id'],
+    'ix_reserva_estado_fecha_hora_id': ['estado', 'fecha_hora', 'id'],
+    'ix_reserva_usuario_fecha_hora_id': ['usuario_id', 'fecha_hora', 'id'],
+}
+
+
+def upgrade():
+    existentes = {indice['name'] for indice in sa.inspect(op.get_bind()).get_indexes('reserva')}
+    for nombre, columnas in INDICES.items():
+        if nombre not in existentes:
+            op.create_index(nombre, 'reserva', columnas, unique=False)
+
+
+def downgrade():
+    for nombre in INDICES:
+        op.drop_index(nombre, table_name='reserva')
@@ -0,0 +1,29 @@
+"""Índice compuesto de disponibilidad en Slot
+
+Revision ID: c2a7749147f4
+Revises: 30b618254063
+Create Date: 2026-10-17 13:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a7749147f4'
+down_revision = '30b618254063'
+branch_labels = None
+depends_on = None
+
+NOMBRE_INDICE = 'ix_slot_disponibilidad'
+
+
+def upgrade():
+    existentes = {indice['name'] for indice in sa.inspect(op.get_bind()).get_indexes('slot')}
+    if NOMBRE_INDICE in existentes:
+        return
+    op.create_index(NOMBRE_INDICE, 'slot', ['servicio_id', 'fecha', 'reservado', 'hora_inicio'], unique=False)
+
+
+def downgrade():
+    op.drop_index(NOMBRE_INDICE, table_name='slot')
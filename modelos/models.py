@@ -59,6 +59,10 @@ class Servicio(db.Model):
         return f'<Servicio {self.nombre}>'
 
 class Slot(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('servicio_id', 'fecha', 'hora_inicio', name='uq_slot_servicio_fecha_hora'),
+        db.Index('ix_slot_disponibilidad', 'servicio_id', 'fecha', 'reservado', 'hora_inicio'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     servicio_id = db.Column(db.Integer, db.ForeignKey('servicio.id'), nullable=False)
     fecha = db.Column(db.Date, nullable=False)
@@ -71,6 +75,13 @@ class Slot(db.Model):
         return f'<Slot {self.fecha} {self.hora_inicio}-{self.hora_fin}>'
 
 class Reserva(db.Model):
+    __table_args__ = (
+        # Paginación por keyset (fecha_hora, id): listado de administración, filtrado por estado y por usuario
+        db.Index('ix_reserva_fecha_hora_id', 'fecha_hora', 'id'),
+        db.Index('ix_reserva_estado_fecha_hora_id', 'estado', 'fecha_hora', 'id'),
+        db.Index('ix_reserva_usuario_fecha_hora_id', 'usuario_id', 'fecha_hora', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
     vehiculo_id = db.Column(db.Integer, db.ForeignKey('vehiculo.id'), nullable=False)
@@ -133,3 +144,36 @@ class Interaccion(db.Model):
 
     def __repr__(self):
         return f'<Interaccion {self.id} {self.timestamp}>'
+
+class EjecucionPlanificador(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    tarea = db.Column(db.String(50), nullable=False, default='aprovisionar_slots')
+    tiempo_inicio = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+    tiempo_fin = db.Column(db.DateTime, nullable=True)
+    fecha_desde = db.Column(db.Date, nullable=False)
+    fecha_hasta = db.Column(db.Date, nullable=False)
+    servicios = db.Column(db.Integer, nullable=False, default=0)
+    slots_creados = db.Column(db.Integer, nullable=False, default=0)
+    exitosa = db.Column(db.Boolean, default=False)
+    error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<EjecucionPlanificador {self.id} {self.tiempo_inicio}>'
+
+class ResumenDiario(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, nullable=False, unique=True)
+    interacciones = db.Column(db.Integer, nullable=False, default=0)
+    interacciones_exitosas = db.Column(db.Integer, nullable=False, default=0)
+    consultas_iniciadas = db.Column(db.Integer, nullable=False, default=0)
+    solicitudes_atendidas = db.Column(db.Integer, nullable=False, default=0)
+    conversiones_realizadas = db.Column(db.Integer, nullable=False, default=0)
+    registros = db.Column(db.Integer, nullable=False, default=0)
+    reservas = db.Column(db.Integer, nullable=False, default=0)
+    registro_segundos_promedio = db.Column(db.Float)
+    reserva_segundos_promedio = db.Column(db.Float)
+    embudo = db.Column(db.JSON)  # Entradas a cada estado de la conversación en el día
+    actualizado = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f'<ResumenDiario {self.fecha}>'
@@ -24,16 +24,21 @@ function sendMessage() {
     appendMessage('user', userInput);
     document.getElementById('user-input').value = '';
 
-    fetch('/conversacion', {
+    fetch('/conversacion/stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
         body: JSON.stringify({ message: userInput }),
     })
-    .then(response => response.json())
-    .then(data => {
-        appendMessage('bot', data.message);
+    .then(response => {
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.startsWith('text/event-stream')) {
+            return readStream(response); // Respuesta del LLM: se muestra a medida que llega
+        }
+        return response.json().then(data => {
+            appendMessage('bot', data.message);
+        });
     })
     .catch(error => {
         console.error('Error:', error);
@@ -41,6 +46,50 @@ function sendMessage() {
     });
 }
 
+function readStream(response) {
+    const messageElement = appendMessage('bot', '');
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    function handleEvent(rawEvent) {
+        let eventName = 'message';
+        let data = '';
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) eventName = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+        });
+        if (!data) return;
+        const payload = JSON.parse(data);
+        if (eventName === 'message') {
+            messageElement.textContent += payload.delta;
+        } else if (eventName === 'fin') {
+            messageElement.textContent = payload.message;
+        } else if (eventName === 'error') {
+            messageElement.textContent = 'Hubo un error al procesar tu mensaje. Por favor, inténtalo de nuevo.';
+        }
+        scrollToBottom();
+    }
+
+    function read() {
+        return reader.read().then(({ done, value }) => {
+            if (done) return;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop(); // El último trozo puede ser un evento incompleto
+            events.forEach(handleEvent);
+            return read();
+        });
+    }
+
+    return read();
+}
+
+function scrollToBottom() {
+    const chatWindow = document.getElementById('chat-window');
+    chatWindow.scrollTop = chatWindow.scrollHeight;
+}
+
 function appendMessage(sender, message) {
     const chatWindow = document.getElementById('chat-window');
     const messageElement = document.createElement('div');
@@ -48,6 +97,7 @@ function appendMessage(sender, message) {
     messageElement.textContent = message;
     chatWindow.appendChild(messageElement);
     chatWindow.scrollTop = chatWindow.scrollHeight;
+    return messageElement;
 }
 
 function checkEnter(event) {